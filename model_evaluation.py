@@ -196,13 +196,20 @@ def analyze_concentration_risk(df_backtest, output_dir='outputs'):
 
 
 def compare_with_without_k(actual_results, matrices_by_mob, parent_fallback,
-                           k_by_mob, states, s30_states, max_mob=24):
+                           k_by_mob, states, s30_states, max_mob=24, k_store=None):
     """
     Compare model performance with and without K factor.
+
+    One-step forecasts from the previous actual MOB (all pairs in one batch):
+        del30_rate_markov : v_{mob-1} @ P
+        del30_rate_k      : v_{mob-1} @ ((1-k) I + k P)  (k-adjusted store, shared with
+                            forecast_all_vintages_partial_step / backtest_error_by_mob)
     
     Returns:
         DataFrame comparing metrics
     """
+    from src.rollrate.calibration_kmob import k_adjusted_store, one_step_k_forecasts
+
     comparison_results = []
     
     for (product, score, vintage), actual_data in actual_results.items():
@@ -241,6 +248,29 @@ def compare_with_without_k(actual_results, matrices_by_mob, parent_fallback,
     
     if df_compare.empty:
         return df_compare, {}
+
+    # One-step forecasts with / without K (batched over every (vintage, mob) pair)
+    if k_store is None:
+        segments = [(p, s) for p, s, _v in actual_results.keys()]
+        last_mob = max(int(max(d.keys())) for d in actual_results.values() if d)
+        k_store = k_adjusted_store(matrices_by_mob, parent_fallback, k_by_mob, states, segments, last_mob)
+    one = one_step_k_forecasts(actual_results, k_store, states)
+    s30_idx = [states.index(s) for s in s30_states if s in states]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_markov = one['v_hat'][:, s30_idx].sum(axis=1) / one['v_hat'].sum(axis=1)
+        rate_k = one['v_adj'][:, s30_idx].sum(axis=1) / one['v_adj'].sum(axis=1)
+    keys = [one['keys'][c] for c in one['cohort']]
+    df_one = pd.DataFrame({
+        'product': [k[0] for k in keys],
+        'score': [k[1] for k in keys],
+        'vintage': [k[2] for k in keys],
+        'mob': one['mob'].astype(int),
+        'del30_rate_markov': rate_markov,
+        'del30_rate_k': rate_k,
+    })
+    df_compare = df_compare.merge(df_one, on=['product', 'score', 'vintage', 'mob'], how='left')
+    err_markov = (df_compare['del30_rate_markov'] - df_compare['del30_rate_actual']).abs()
+    err_k = (df_compare['del30_rate_k'] - df_compare['del30_rate_actual']).abs()
     
     # Calculate aggregate metrics
     metrics = {
@@ -248,6 +278,8 @@ def compare_with_without_k(actual_results, matrices_by_mob, parent_fallback,
         'avg_k': df_compare['k_value'].mean(),
         'k_range': (df_compare['k_value'].min(), df_compare['k_value'].max()),
         'avg_del30_rate': df_compare['del30_rate_actual'].mean(),
+        'mae_markov': err_markov.mean(),
+        'mae_k': err_k.mean(),
     }
     
     return df_compare, metrics
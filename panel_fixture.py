@@ -0,0 +1,59 @@
+"""
+Panel giả lập dùng chung cho các test script (test_matrix_store.py, test_model_bundle.py, ...).
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.config import CFG, BUCKETS_CANON
+
+STATE_P = [0.85, 0.08, 0.05, 0.02]
+
+
+def make_panel(n_loans: int = 3000, seed: int = 1) -> pd.DataFrame:
+    """2 product × 2 score, MOB 0..8, cutoff Timestamp từ 2025-01 (+0..2 tháng theo loan)."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for loan in range(n_loans):
+        product = "A" if loan % 3 else "B"
+        score = "S1" if loan % 2 else "S2"
+        start = pd.Timestamp("2025-01-01") + pd.DateOffset(months=int(rng.integers(0, 3)))
+        for mob in range(int(rng.integers(2, 9))):
+            rows.append({
+                CFG["loan"]: loan,
+                CFG["mob"]: mob,
+                CFG["state"]: rng.choice(BUCKETS_CANON[:4], p=STATE_P),
+                CFG["cutoff"]: start + pd.DateOffset(months=mob),
+                CFG["ead"]: float(rng.uniform(100, 1000)),
+                "PRODUCT_TYPE": product,
+                "RISK_SCORE": score,
+            })
+    return pd.DataFrame(rows)
+
+
+def make_long_panel(n_loans: int = 2000, seed: int = 2) -> pd.DataFrame:
+    """Panel dài hơn ROLL_WINDOW, cutoff int32 YYYYMM (như panel compact): 202401–202604."""
+    rng = np.random.default_rng(seed)
+    months = pd.period_range("2024-01", "2026-04", freq="M")
+    rows = []
+    for loan in range(n_loans):
+        start = int(rng.integers(0, len(months) - 3))
+        for mob in range(int(rng.integers(2, min(9, len(months) - start)))):
+            ym = months[start + mob]
+            rows.append({
+                CFG["loan"]: loan,
+                CFG["mob"]: mob,
+                CFG["state"]: rng.choice(BUCKETS_CANON[:4], p=STATE_P),
+                CFG["cutoff"]: ym.year * 100 + ym.month,
+                CFG["ead"]: float(rng.uniform(100, 1000)),
+                "PRODUCT_TYPE": "A" if loan % 3 else "B",
+                "RISK_SCORE": "S1",
+            })
+    return pd.DataFrame(rows).astype({CFG["cutoff"]: "int32"})
+
+
+def with_orig_date(df: pd.DataFrame) -> pd.DataFrame:
+    """Bản copy có DISBURSAL_DATE = cutoff đầu tiên của loan (cohort cho forecast)."""
+    out = df.copy()
+    out[CFG["orig_date"]] = out.groupby(CFG["loan"])[CFG["cutoff"]].transform("min")
+    return out
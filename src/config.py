@@ -1,4 +1,5 @@
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
 
@@ -10,6 +11,11 @@ OUT_ROOT     = PROJECT_ROOT / "outputs"
 DATA_SOURCE  = "parquet"  # options: "parquet" | "oracle"
 PARQUET_DIR  = PROJECT_ROOT / "data" / "parquet"       # <-- FIXED: absolute path
 PARQUET_FILE = None  # or "rollrate_base.parquet" if bạn dùng 1 file duy nhất
+PANEL_CACHE_DIR = OUT_ROOT / "cache" / "panel"  # cache panel đã preprocess (feather uncompressed)
+MODEL_ARTIFACT_DIR = OUT_ROOT / "artifacts"  # bundle model đã fit (matrices, k, alpha, seasonality, LGD)
+TRANSITION_STATE_PATH = OUT_ROOT / "cache" / "transition_state.npz"  # counts theo tháng cho update_transitions
+PAIR_COUNT_CACHE_PATH = OUT_ROOT / "cache" / "pair_counts_by_month.npz"  # counts toàn lịch sử cho sweep ROLL_WINDOW / WEIGHT_METHOD
+PARTITION_KEY = "CUTOFF_YYYYMM"  # tên key partition: CUTOFF_YYYYMM=202501.parquet hoặc CUTOFF_YYYYMM=202501/
 
 EXCEL_FILE   = PROJECT_ROOT / "data" / "rollrate_input.xlsx"   # 👈 đường dẫn mặc định nếu dùng Excel
 EXCEL_SHEET  = "Data"    
@@ -61,9 +67,37 @@ def parse_date(value):
         return pd.NaT
 
 
-def parse_date_column(series):
-    """Parse toàn bộ column date."""
-    return series.apply(parse_date)
+def parse_date_column(series, output="datetime"):
+    """
+    Parse toàn bộ column date (vectorized).
+    Chỉ parse mỗi giá trị unique 1 lần bằng parse_date rồi map ngược lại theo mã factorize,
+    nên chi phí theo số tháng khác nhau chứ không theo số dòng.
+
+    output:
+        - "datetime":    datetime64 (YYYYMM -> ngày 1 của tháng, datetime giữ nguyên)
+        - "yyyymm":      int32 YYYYMM (202501)
+        - "month_index": int32 year*12 + month - 1 (trừ trực tiếp ra số tháng)
+        NaT/NaN -> NaT (datetime) hoặc <NA> (Int32).
+    """
+    if output not in ("datetime", "yyyymm", "month_index"):
+        raise ValueError(f"output không hợp lệ: {output}. Chọn 'datetime', 'yyyymm' hoặc 'month_index'.")
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        dt = pd.Series(series, copy=True)
+    else:
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        # tolist() → scalar Python (np.int32 / Int32 không phải int → parse_date sẽ hiểu sai YYYYMM)
+        parsed = pd.DatetimeIndex([parse_date(u) for u in uniques.tolist()] + [pd.NaT])
+        codes = np.where(codes < 0, len(uniques), codes)
+        dt = pd.Series(parsed.take(codes), index=series.index, name=series.name)
+
+    if output == "datetime":
+        return dt
+
+    ym = dt.dt.year * 100 + dt.dt.month
+    if output == "month_index":
+        ym = (ym // 100) * 12 + (ym % 100) - 1
+    return ym.astype("Int32") if ym.hasnans else ym.astype("int32")
 
 # ===========================
 # B. Model parameters
@@ -118,11 +152,72 @@ def get_cohort_cols():
     """Trả về list columns để định nghĩa 1 cohort: SEGMENT_COLS + VINTAGE_DATE"""
     return ["PRODUCT_TYPE", "RISK_SCORE", "VINTAGE_DATE"]
 
+def get_load_columns():
+    """
+    Trả về list columns tối thiểu cần đọc từ nguồn dữ liệu:
+    các cột khai báo trong CFG (loan, mob, state, ...) + SEGMENT_COLS.
+    Dùng cho load_data(columns=...) để không đọc toàn bộ cột của parquet.
+    """
+    col_keys = ["loan", "mob", "state", "orig_date", "ead", "disb", "cutoff"]
+    cols = [CFG[k] for k in col_keys if CFG.get(k)]
+    return list(dict.fromkeys(cols + list(SEGMENT_COLS)))
+
 def get_cohort_mob_cols():
     """Trả về list columns để định nghĩa 1 cohort tại 1 MOB"""
     return ["PRODUCT_TYPE", "RISK_SCORE", "VINTAGE_DATE", "MOB"]
 
-def create_segment_columns(df):
+def _factorize_str(series):
+    """factorize 1 cột → (codes int64, labels str) với label giống series.astype(str)."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    # astype(str) trên uniques (cùng dtype) → cùng định dạng với cả cột (vd datetime → "2025-01-01");
+    # giá trị thiếu → str(u) ("nan" / "NaT" / "None" như astype(str) của pandas cũ)
+    as_str = pd.Series(uniques).astype(str).tolist()
+    labels = np.array(
+        [a if isinstance(a, str) else str(u) for a, u in zip(as_str, np.asarray(uniques, dtype=object))],
+        dtype=object,
+    )
+    return codes.astype(np.int64), labels
+
+
+def combine_segment_codes(df, cols, sep="_"):
+    """
+    Ghép nhiều cột thành 1 key dạng "A_B_C" mà không join từng dòng:
+    factorize từng cột → mã mixed-radix → factorize lại → chỉ join label cho các tổ hợp unique.
+
+    Returns:
+        codes:  ndarray int64 (mã tổ hợp cho từng dòng, 0..n_combo-1)
+        labels: ndarray object (label của từng mã, duy nhất)
+        lookup: DataFrame [code, *cols, label] — bảng tra mã → giá trị từng cột
+    """
+    combo = np.zeros(len(df), dtype=np.int64)
+    col_labels = []
+    for c in cols:
+        codes, labels = _factorize_str(df[c])
+        combo = combo * len(labels) + codes
+        col_labels.append(labels)
+
+    combo_codes, combo_uniques = pd.factorize(combo)
+    # Giải mã mixed-radix của các tổ hợp unique → giá trị từng cột
+    parts = []
+    rest = np.asarray(combo_uniques, dtype=np.int64)
+    for labels in reversed(col_labels):
+        parts.append(labels[rest % len(labels)])
+        rest = rest // len(labels)
+    parts = parts[::-1]
+    joined = np.array([sep.join(t) for t in zip(*parts)], dtype=object) if parts else np.array([], dtype=object)
+
+    # Label có thể trùng (vd "A_B"+"C" vs "A"+"B_C") → factorize lại theo label
+    label_codes, labels = pd.factorize(joined)
+    codes = label_codes[combo_codes].astype(np.int64)
+
+    lookup = pd.DataFrame({c: p for c, p in zip(cols, parts)})
+    lookup.insert(0, "code", label_codes)
+    lookup["label"] = joined
+    lookup = lookup.sort_values("code", kind="stable").reset_index(drop=True)
+    return codes, np.asarray(labels, dtype=object), lookup
+
+
+def create_segment_columns(df, inplace=False, as_category=False, return_lookup=False):
     """
     Tạo cột PRODUCT_TYPE và RISK_SCORE từ SEGMENT_COLS.
     
@@ -132,36 +227,52 @@ def create_segment_columns(df):
       + PRODUCT_TYPE: giữ nguyên
       + RISK_SCORE = "GRADE_GENDER_LA_GROUP" (ghép các giá trị)
     
+    Args:
+        inplace: True → sửa trực tiếp df (không copy toàn bộ frame)
+        as_category: True → RISK_SCORE/PRODUCT_TYPE là category (gọn bộ nhớ), False → str như cũ
+        return_lookup: True → trả thêm bảng tra code → giá trị từng cột → RISK_SCORE
+
     Returns:
         DataFrame với cột PRODUCT_TYPE và RISK_SCORE đã được chuẩn hóa
+        (df, lookup) nếu return_lookup=True
     """
-    df = df.copy()
+    if not inplace:
+        df = df.copy()
     
     # Lấy các cột segment (trừ PRODUCT_TYPE)
     other_cols = [c for c in SEGMENT_COLS if c != "PRODUCT_TYPE"]
     
-    if not other_cols:
+    if not other_cols and "RISK_SCORE" not in df.columns:
         # Không có cột nào khác, tạo RISK_SCORE mặc định
-        if "RISK_SCORE" not in df.columns:
-            df["RISK_SCORE"] = "ALL"
-    elif other_cols == ["RISK_SCORE"]:
-        # Chỉ có RISK_SCORE, giữ nguyên
-        df["RISK_SCORE"] = df["RISK_SCORE"].astype(str)
-    else:
-        # Ghép nhiều cột thành RISK_SCORE
-        # Kiểm tra các cột có tồn tại không
-        missing_cols = [c for c in other_cols if c not in df.columns]
-        if missing_cols:
-            raise KeyError(f"SEGMENT_COLS chứa các cột không tồn tại trong data: {missing_cols}")
-        
-        # Ghép các cột thành RISK_SCORE
-        df["RISK_SCORE"] = df[other_cols].astype(str).agg("_".join, axis=1)
-        print(f"   ✅ Tạo RISK_SCORE từ {other_cols}: {df['RISK_SCORE'].nunique()} unique values")
+        df["RISK_SCORE"] = "ALL"
+    key_cols = other_cols or ["RISK_SCORE"]
+
+    # Kiểm tra các cột có tồn tại không
+    missing_cols = [c for c in key_cols if c not in df.columns]
+    if missing_cols:
+        raise KeyError(f"SEGMENT_COLS chứa các cột không tồn tại trong data: {missing_cols}")
+
+    # Ghép các cột thành RISK_SCORE theo mã factorize (1 cột → chỉ chuẩn hóa về str)
+    codes, labels, lookup = combine_segment_codes(df, key_cols)
+    if as_category:
+        df["RISK_SCORE"] = pd.Categorical.from_codes(codes, categories=labels)
+    elif other_cols:
+        df["RISK_SCORE"] = labels[codes] if len(codes) else pd.Series(dtype=object)
+    # Không có cột segment khác → giữ nguyên RISK_SCORE từ data (như cũ)
+    if len(key_cols) > 1:
+        print(f"   ✅ Tạo RISK_SCORE từ {key_cols}: {len(labels)} unique values")
     
     # Đảm bảo PRODUCT_TYPE là string
     if "PRODUCT_TYPE" in df.columns:
-        df["PRODUCT_TYPE"] = df["PRODUCT_TYPE"].astype(str)
+        if as_category:
+            p_codes, p_labels = _factorize_str(df["PRODUCT_TYPE"])
+            p_final, p_uniques = pd.factorize(p_labels)
+            df["PRODUCT_TYPE"] = pd.Categorical.from_codes(p_final[p_codes], categories=p_uniques)
+        else:
+            df["PRODUCT_TYPE"] = df["PRODUCT_TYPE"].astype(str)
     
+    if return_lookup:
+        return df, lookup
     return df
 
 SEGMENT_MAP = {
@@ -1,34 +1,394 @@
 from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
 import pandas as pd
 from pathlib import Path
 from src.config import (
     DATA_SOURCE,
     PARQUET_DIR,
     PARQUET_FILE,
+    PARTITION_KEY,
     EXCEL_FILE,
     EXCEL_SHEET,
+    PANEL_CACHE_DIR,
+    CFG,
+    BUCKETS_CANON,
+    parse_date_column,
 )
 
-def _read_parquet_dir(parquet_dir: Path) -> pd.DataFrame:
+_PARTITION_RE = re.compile(rf"{re.escape(PARTITION_KEY)}=(\d{{6}})")
+MANIFEST_NAME = "_manifest.json"
+
+
+def _to_yyyymm(value) -> int | None:
+    """Chuẩn hóa 1 giá trị cutoff (202501, "202501", "2025-01", Timestamp) → int YYYYMM."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        v = value.strip()
+        if len(v) == 6 and v.isdigit():
+            return int(v)
+    ts = pd.Timestamp(value)
+    return ts.year * 100 + ts.month
+
+
+def _partition_of(path: Path) -> int | None:
+    """Lấy YYYYMM từ tên file hoặc thư mục cha dạng CUTOFF_YYYYMM=202501."""
+    for part in (path.stem, *(p.name for p in path.parents)):
+        m = _PARTITION_RE.fullmatch(part)
+        if m:
+            return int(m.group(1))
+    return None
+
+
+def list_partitions(parquet_dir: Path) -> dict[int, list[Path]]:
+    """
+    Liệt kê các partition CUTOFF_YYYYMM có trong thư mục parquet.
+    Hỗ trợ cả 2 layout:
+        - file phẳng:  CUTOFF_YYYYMM=202501.parquet
+        - hive:        CUTOFF_YYYYMM=202501/part-0.parquet
+    Returns: {yyyymm: [files]} (sort theo tháng)
+    """
+    parts: dict[int, list[Path]] = {}
+    for f in sorted(Path(parquet_dir).rglob("*.parquet")):
+        key = _partition_of(f.relative_to(parquet_dir))
+        if key is not None:
+            parts.setdefault(key, []).append(f)
+    return dict(sorted(parts.items()))
+
+
+# ============================================================
+# Manifest: partition → số dòng + checksum
+# ============================================================
+
+def file_checksum(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def partition_entry(parquet_dir: Path, files: list[Path]) -> dict:
+    """Thông tin 1 partition để ghi vào manifest (số dòng đọc từ metadata parquet)."""
+    import pyarrow.parquet as pq
+
+    file_info = []
+    for f in files:
+        f = Path(f)
+        file_info.append({
+            "path": f.relative_to(parquet_dir).as_posix(),
+            "rows": pq.ParquetFile(f).metadata.num_rows,
+            "bytes": f.stat().st_size,
+            "sha256": file_checksum(f),
+        })
+    return {
+        "rows": sum(fi["rows"] for fi in file_info),
+        "files": file_info,
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def read_manifest(parquet_dir: Path) -> dict:
+    path = Path(parquet_dir) / MANIFEST_NAME
+    if not path.exists():
+        return {"partition_key": PARTITION_KEY, "partitions": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(parquet_dir: Path, manifest: dict) -> Path:
+    path = Path(parquet_dir) / MANIFEST_NAME
+    manifest = dict(manifest, partition_key=PARTITION_KEY)
+    manifest["partitions"] = dict(sorted(manifest.get("partitions", {}).items()))
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+
+def build_manifest(parquet_dir: Path) -> dict:
+    """
+    Quét toàn bộ partition đang có trên đĩa và ghi lại manifest.
+    Chạy 1 lần cho thư mục parquet cũ (chưa có manifest) trước khi ingest incremental.
+    """
+    parquet_dir = Path(parquet_dir)
+    manifest = read_manifest(parquet_dir)
+    manifest["partitions"] = {
+        str(k): partition_entry(parquet_dir, files)
+        for k, files in list_partitions(parquet_dir).items()
+    }
+    write_manifest(parquet_dir, manifest)
+    print(f"🧾 Manifest: {len(manifest['partitions'])} partitions → {parquet_dir / MANIFEST_NAME}")
+    return manifest
+
+
+def validate_manifest(
+    parquet_dir: Path,
+    keys: list[int] | None = None,
+    check_checksum: bool = True,
+) -> list[str]:
+    """
+    So sánh partition trên đĩa với manifest.
+    Returns: list mô tả lỗi (rỗng = hợp lệ).
+    """
+    import pyarrow.parquet as pq
+
+    parquet_dir = Path(parquet_dir)
+    manifest = read_manifest(parquet_dir)["partitions"]
+    on_disk = list_partitions(parquet_dir)
+    if keys is None:
+        keys = sorted(set(on_disk) | {int(k) for k in manifest})
+
+    issues = []
+    for k in keys:
+        entry = manifest.get(str(k))
+        if entry is None:
+            issues.append(f"{PARTITION_KEY}={k}: không có trong manifest")
+            continue
+        expected = {fi["path"]: fi for fi in entry["files"]}
+        actual = {f.relative_to(parquet_dir).as_posix(): f for f in on_disk.get(k, [])}
+        for rel in sorted(set(expected) - set(actual)):
+            issues.append(f"{PARTITION_KEY}={k}: thiếu file {rel}")
+        for rel in sorted(set(actual) - set(expected)):
+            issues.append(f"{PARTITION_KEY}={k}: file lạ không có trong manifest {rel}")
+        for rel in sorted(set(expected) & set(actual)):
+            fi, f = expected[rel], actual[rel]
+            rows = pq.ParquetFile(f).metadata.num_rows
+            if rows != fi["rows"]:
+                issues.append(f"{PARTITION_KEY}={k}: {rel} có {rows:,} dòng, manifest ghi {fi['rows']:,}")
+            elif check_checksum and file_checksum(f) != fi["sha256"]:
+                issues.append(f"{PARTITION_KEY}={k}: {rel} sai checksum")
+    return issues
+
+
+def _select_partitions(
+    partitions: dict[int, list[Path]],
+    cutoff_from=None,
+    cutoff_to=None,
+    last_n_months: int | None = None,
+) -> list[int]:
+    lo, hi = _to_yyyymm(cutoff_from), _to_yyyymm(cutoff_to)
+    keys = [k for k in partitions if (lo is None or k >= lo) and (hi is None or k <= hi)]
+    if last_n_months is not None:
+        keys = keys[-int(last_n_months):] if last_n_months > 0 else []
+    return keys
+
+
+def _resolve_columns(schema_names: list[str], columns: list[str] | None) -> list[str] | None:
+    """Map các cột yêu cầu (không phân biệt hoa/thường) sang tên thật trong schema."""
+    if columns is None:
+        return None
+    by_upper = {n.upper(): n for n in schema_names}
+    found, missing = [], []
+    for c in dict.fromkeys(columns):
+        if c.upper() in by_upper:
+            found.append(by_upper[c.upper()])
+        else:
+            missing.append(c)
+    if missing:
+        print(f"ℹ️ Bỏ qua các cột không có trong parquet: {missing}")
+    return found
+
+
+def _cutoff_filter(schema, lo: int | None, hi: int | None):
+    """Filter expression trên cột cutoff (dùng khi file không mang key partition)."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    name = next((n for n in schema.names if n.upper() == CFG["cutoff"].upper()), None)
+    if name is None or (lo is None and hi is None):
+        return None
+    field = ds.field(name)
+    if pa.types.is_integer(schema.field(name).type):
+        bounds = (lo, hi)
+    else:
+        bounds = tuple(
+            None if b is None else pd.Timestamp(year=b // 100, month=b % 100, day=1)
+            for b in (lo, hi)
+        )
+        # cutoff thường là cuối tháng → cận trên là đầu tháng kế tiếp (exclusive)
+        if bounds[1] is not None:
+            bounds = (bounds[0], bounds[1] + pd.offsets.MonthBegin(1))
+    expr = None
+    if bounds[0] is not None:
+        expr = field >= bounds[0]
+    if bounds[1] is not None:
+        upper = (field <= bounds[1]) if pa.types.is_integer(schema.field(name).type) else (field < bounds[1])
+        expr = upper if expr is None else (expr & upper)
+    return expr
+
+
+def _read_parquet_dir(
+    parquet_dir: Path,
+    columns: list[str] | None = None,
+    cutoff_from=None,
+    cutoff_to=None,
+    last_n_months: int | None = None,
+    validate: bool = False,
+) -> pd.DataFrame:
+    """
+    Đọc thư mục parquet, có:
+      - partition pruning theo CUTOFF_YYYYMM (chỉ mở các file trong khoảng cutoff)
+      - column projection (chỉ đọc các cột trong `columns`)
+    Nếu file không mang key partition thì lọc theo cột cutoff (pushdown qua row-group stats).
+    validate=True → kiểm tra các partition được chọn với manifest trước khi đọc.
+    """
+    pruning = cutoff_from is not None or cutoff_to is not None or last_n_months is not None
+    partitions = list_partitions(parquet_dir)
+    if partitions:
+        keys = _select_partitions(partitions, cutoff_from, cutoff_to, last_n_months)
+        files = [f for k in keys for f in partitions[k]]
+        if pruning:
+            rng = f"{keys[0]}→{keys[-1]}" if keys else "∅"
+            print(f"✂️ Partition pruning: {len(keys)}/{len(partitions)} partitions ({rng})")
+        if not files:
+            raise FileNotFoundError(
+                f"Không có partition {PARTITION_KEY} nào trong khoảng "
+                f"[{cutoff_from}, {cutoff_to}] tại {parquet_dir}"
+            )
+        if validate:
+            issues = validate_manifest(parquet_dir, keys=keys)
+            if issues:
+                raise ValueError("Partition không khớp manifest:\n  - " + "\n  - ".join(issues))
+            print(f"🧾 Manifest OK cho {len(keys)} partitions")
+    else:
+        files = sorted(parquet_dir.rglob("*.parquet"))
+        if not files:
+            raise FileNotFoundError(f"Không tìm thấy *.parquet trong {parquet_dir}")
+        if last_n_months is not None:
+            print("⚠️ last_n_months cần key partition trong tên file → bỏ qua, chỉ lọc theo cutoff_from/cutoff_to.")
+
     try:
         import pyarrow.dataset as ds
-        dataset = ds.dataset(str(parquet_dir), format="parquet")
-        table = dataset.to_table()
+        dataset = ds.dataset([str(f) for f in files], format="parquet")
+        cols = _resolve_columns(dataset.schema.names, columns)
+        flt = None
+        if not partitions:
+            flt = _cutoff_filter(dataset.schema, _to_yyyymm(cutoff_from), _to_yyyymm(cutoff_to))
+        table = dataset.to_table(columns=cols, filter=flt)
         df = table.to_pandas()
-        print(f"✅ Loaded {len(df):,} rows via pyarrow.dataset from {parquet_dir}")
+        print(f"✅ Loaded {len(df):,} rows × {len(df.columns)} cols via pyarrow.dataset from {parquet_dir}")
         return df
     except Exception as e:
-        print(f"⚠️ pyarrow.dataset not used ({e}). Falling back to glob concat...")
-        files = sorted(parquet_dir.glob("*.parquet"))
-        if not files:
-            raise FileNotFoundError(f"Không tìm thấy *.parquet trong {parquet_dir}")
-        dfs = [pd.read_parquet(f) for f in files]
+        print(f"⚠️ pyarrow.dataset not used ({e}). Falling back to per-file concat...")
+        dfs = []
+        for f in files:
+            part = pd.read_parquet(f)
+            cols = _resolve_columns(list(part.columns), columns)
+            dfs.append(part if cols is None else part[cols])
         df = pd.concat(dfs, ignore_index=True)
+        if not partitions and (cutoff_from is not None or cutoff_to is not None):
+            df = _filter_cutoff_frame(df, cutoff_from, cutoff_to)
         print(f"✅ Loaded {len(df):,} rows from {len(files)} files in {parquet_dir}")
         return df
 
 
-def load_data(sql_or_file: str = None, params: dict | None = None) -> pd.DataFrame:
+def _filter_cutoff_frame(df: pd.DataFrame, cutoff_from=None, cutoff_to=None) -> pd.DataFrame:
+    """Lọc DataFrame đã load theo khoảng cutoff (cho nguồn không hỗ trợ pushdown)."""
+    col = next((c for c in df.columns if c.upper() == CFG["cutoff"].upper()), None)
+    if col is None or (cutoff_from is None and cutoff_to is None):
+        return df
+    s = df[col]
+    if pd.api.types.is_datetime64_any_dtype(s):
+        ym = s.dt.year * 100 + s.dt.month
+    else:
+        ym = pd.to_numeric(s, errors="coerce")
+    mask = pd.Series(True, index=df.index)
+    if cutoff_from is not None:
+        mask &= ym >= _to_yyyymm(cutoff_from)
+    if cutoff_to is not None:
+        mask &= ym <= _to_yyyymm(cutoff_to)
+    return df.loc[mask].reset_index(drop=True)
+
+
+def compact_panel(
+    df: pd.DataFrame,
+    float32_amounts: bool = False,
+    date_encoding: str = "yyyymm",
+    inplace: bool = False,
+    date_keys: tuple = ("cutoff", "orig_date"),
+) -> pd.DataFrame:
+    """
+    Chuẩn hóa panel sang kiểu dữ liệu gọn (opt-in, gọi sau load_data / create_segment_columns):
+        - STATE_MODEL, PRODUCT_TYPE, RISK_SCORE → category (state theo thứ tự BUCKETS_CANON)
+        - MOB → int16
+        - CUTOFF_DATE, DISBURSAL_DATE → int32 tháng: date_encoding="yyyymm" (202501, tương thích
+          DATE_FORMAT="YYYYMM") hoặc "month_index" (year*12 + month - 1)
+          (tháng thiếu → Int32 <NA>; parse lại bằng parse_date_column). date_keys: key CFG của
+          các cột date cần mã hoá (bỏ key nào → cột đó giữ nguyên, vd DISBURSAL_DATE datetime)
+        - EAD / DISBURSAL_AMOUNT → float32 nếu float32_amounts=True
+
+    Lưu ý: create_segment_columns() mặc định ép RISK_SCORE/PRODUCT_TYPE về str → gọi nó TRƯỚC compact_panel
+    (hoặc dùng create_segment_columns(df, inplace=True, as_category=True)).
+    """
+    if not inplace:
+        df = df.copy()
+    mem_before = df.memory_usage(deep=True).sum()
+
+    state_col = CFG["state"]
+    if state_col in df.columns:
+        seen = [s for s in pd.unique(df[state_col].dropna()) if s not in BUCKETS_CANON]
+        df[state_col] = pd.Categorical(df[state_col], categories=list(BUCKETS_CANON) + sorted(map(str, seen)))
+
+    for col in ("PRODUCT_TYPE", "RISK_SCORE"):
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    mob_col = CFG["mob"]
+    if mob_col in df.columns:
+        mob = pd.to_numeric(df[mob_col], errors="coerce").round(0)
+        df[mob_col] = mob.astype("Int16") if mob.hasnans else mob.astype("int16")
+
+    for key in date_keys:
+        col = CFG.get(key)
+        if col and col in df.columns:
+            df[col] = parse_date_column(df[col], output=date_encoding)
+
+    if float32_amounts:
+        for key in ("ead", "disb"):
+            col = CFG.get(key)
+            if col and col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+
+    mem_after = df.memory_usage(deep=True).sum()
+    print(f"🗜️ compact_panel: {mem_before / 1e6:,.1f} MB → {mem_after / 1e6:,.1f} MB "
+          f"({mem_before / max(mem_after, 1):.1f}x)")
+    return df
+
+
+def load_data(
+    sql_or_file: str = None,
+    params: dict | None = None,
+    cutoff_from=None,
+    cutoff_to=None,
+    columns: list[str] | None = None,
+    last_n_months: int | None = None,
+    compact: bool = False,
+    validate_manifest: bool = False,
+) -> pd.DataFrame:
+    """
+    Load panel dữ liệu từ DATA_SOURCE (parquet | oracle | excel).
+
+    Args:
+        cutoff_from, cutoff_to: khoảng CUTOFF (YYYYMM int/str hoặc datetime), bao gồm 2 đầu.
+            Với parquet → push xuống key partition CUTOFF_YYYYMM (chỉ đọc các tháng cần).
+        columns: list cột cần đọc (vd: get_load_columns()). None = đọc tất cả.
+        last_n_months: chỉ lấy N partition mới nhất (vd: ROLL_WINDOW + 1 cho rebuild hàng tháng).
+        compact: True → trả về panel gọn qua compact_panel() (category/int16/int32).
+        validate_manifest: True → đối chiếu partition được đọc với _manifest.json
+            (số dòng + checksum), raise ValueError nếu lệch.
+
+    Example:
+        from src.config import ROLL_WINDOW, get_load_columns
+        df = load_data(columns=get_load_columns(), last_n_months=ROLL_WINDOW + 1)
+    """
     ds = DATA_SOURCE.lower()
 
     # ------------------- Oracle -------------------
@@ -42,9 +402,20 @@ def load_data(sql_or_file: str = None, params: dict | None = None) -> pd.DataFra
         parquet_dir = PARQUET_DIR if sql_or_file is None else Path(sql_or_file)
         print(f"📦 Loading Parquet from: {parquet_dir.resolve()}")
         if parquet_dir.is_dir():
-            df = _read_parquet_dir(parquet_dir)
+            df = _read_parquet_dir(
+                parquet_dir,
+                columns=columns,
+                cutoff_from=cutoff_from,
+                cutoff_to=cutoff_to,
+                last_n_months=last_n_months,
+                validate=validate_manifest,
+            )
         elif parquet_dir.suffix.lower() == ".parquet" and parquet_dir.exists():
             df = pd.read_parquet(parquet_dir)
+            cols = _resolve_columns(list(df.columns), columns)
+            if cols is not None:
+                df = df[cols]
+            df = _filter_cutoff_frame(df, cutoff_from, cutoff_to)
             print(f"✅ Loaded {len(df):,} rows from {parquet_dir.name}")
         else:
             raise FileNotFoundError(f"Không tìm thấy thư mục/file parquet: {parquet_dir}")
@@ -58,6 +429,10 @@ def load_data(sql_or_file: str = None, params: dict | None = None) -> pd.DataFra
             raise FileNotFoundError(f"Không tìm thấy file Excel: {excel_path}")
         print(f"📗 Loading Excel data from {excel_path} (sheet='{EXCEL_SHEET}')")
         df = pd.read_excel(excel_path, sheet_name=EXCEL_SHEET)
+        cols = _resolve_columns(list(df.columns), columns)
+        if cols is not None:
+            df = df[cols]
+        df = _filter_cutoff_frame(df, cutoff_from, cutoff_to)
         print(f"✅ Loaded {len(df):,} rows and {len(df.columns)} columns from Excel")
 
     else:
@@ -68,4 +443,153 @@ def load_data(sql_or_file: str = None, params: dict | None = None) -> pd.DataFra
     if "PRODUCT_TYPE" not in df.columns:
         df["PRODUCT_TYPE"] = "A"
         print("ℹ️ Added default column PRODUCT_TYPE = 'A'")
+    if compact:
+        df = compact_panel(df, inplace=True)
+    return df
+
+
+# ============================================================
+# Panel cache: load + preprocess 1 lần, lần sau đọc feather (zero_copy → memory-map)
+# ============================================================
+
+PANEL_CACHE_VERSION = 2  # 2: DISBURSAL_DATE parse trước compact (bản 1 có thể ra 1970 khi thiếu tháng)
+
+
+def _source_fingerprint(source: Path, cutoff_from=None, cutoff_to=None, last_n_months=None) -> list:
+    """
+    Dấu vân tay nguồn dữ liệu: với mỗi file partition được chọn → (path, size, mtime, sha256 từ manifest).
+    Dùng checksum trong manifest nếu có (không phải đọc lại file).
+    """
+    source = Path(source)
+    if source.is_file():
+        st = source.stat()
+        return [[source.name, st.st_size, st.st_mtime_ns, None]]
+
+    partitions = list_partitions(source)
+    if partitions:
+        keys = _select_partitions(partitions, cutoff_from, cutoff_to, last_n_months)
+        files = [f for k in keys for f in partitions[k]]
+    else:
+        files = sorted(source.rglob("*.parquet"))
+    checksums = {
+        fi["path"]: fi["sha256"]
+        for entry in read_manifest(source)["partitions"].values()
+        for fi in entry["files"]
+    }
+    out = []
+    for f in files:
+        rel = f.relative_to(source).as_posix()
+        st = f.stat()
+        out.append([rel, st.st_size, st.st_mtime_ns, checksums.get(rel)])
+    return out
+
+
+def panel_cache_key(source: Path, **load_kwargs) -> str:
+    """
+    Key cache = hash(nguồn partition + CFG + SEGMENT_COLS + DATE_FORMAT + tham số load).
+    Đổi config hoặc có partition mới/sửa → key mới → tự rebuild.
+    """
+    import src.config as config
+
+    payload = {
+        "version": PANEL_CACHE_VERSION,
+        "source": _source_fingerprint(
+            source,
+            load_kwargs.get("cutoff_from"),
+            load_kwargs.get("cutoff_to"),
+            load_kwargs.get("last_n_months"),
+        ),
+        "CFG": config.CFG,
+        "SEGMENT_COLS": list(config.SEGMENT_COLS),
+        "DATE_FORMAT": config.DATE_FORMAT,
+        "load": load_kwargs,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+def load_panel(
+    sql_or_file: str | None = None,
+    cutoff_from=None,
+    cutoff_to=None,
+    columns: list[str] | None = None,
+    last_n_months: int | None = None,
+    compact: bool = True,
+    float32_amounts: bool = False,
+    cache_dir: str | Path | None = None,
+    refresh: bool = False,
+    zero_copy: bool = False,
+) -> pd.DataFrame:
+    """
+    Load panel đã preprocess giống các notebook (Final_Workflow, Projection, Markovchain):
+        load_data → DISBURSAL_DATE parse_date_column → create_segment_columns (→ compact_panel)
+    và cache kết quả dạng feather (uncompressed) trong PANEL_CACHE_DIR.
+    Lần sau nếu nguồn + config không đổi → đọc thẳng file feather (vài giây thay vì vài phút,
+    không load_data / preprocess lại).
+
+    Args:
+        compact: True → category/int16/int32 (DISBURSAL_DATE vẫn là datetime như notebook).
+        refresh: True → bỏ qua cache, build lại.
+        zero_copy: True → cột số không có null trỏ thẳng vào file memory-map (không copy vào RAM),
+                   nhưng các cột đó read-only (sửa in-place sẽ lỗi; gán cột mới thì được).
+                   False (mặc định) → DataFrame copy bình thường, sửa được.
+        Các tham số còn lại giống load_data.
+    """
+    from src.config import create_segment_columns
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    if DATA_SOURCE.lower() != "parquet":
+        print(f"ℹ️ Panel cache chỉ hỗ trợ DATA_SOURCE='parquet' → load trực tiếp ({DATA_SOURCE}).")
+        source = None
+    else:
+        source = PARQUET_DIR if sql_or_file is None else Path(sql_or_file)
+
+    load_kwargs = dict(
+        cutoff_from=cutoff_from,
+        cutoff_to=cutoff_to,
+        columns=columns,
+        last_n_months=last_n_months,
+        compact=compact,
+        float32_amounts=float32_amounts,
+    )
+
+    cache_path = None
+    if source is not None and source.exists():
+        key = panel_cache_key(source, **load_kwargs)
+        cache_path = Path(cache_dir or PANEL_CACHE_DIR) / f"panel_{key[:20]}.feather"
+        if cache_path.exists() and not refresh:
+            table = feather.read_table(str(cache_path), memory_map=True)
+            # split_blocks + self_destruct: cột số không null giữ buffer memory-map (zero-copy)
+            df = table.to_pandas(split_blocks=True, self_destruct=True) if zero_copy else table.to_pandas()
+            del table
+            print(f"⚡ Panel cache hit: {len(df):,} rows ← {cache_path.name}")
+            return df
+
+    df = load_data(
+        sql_or_file,
+        cutoff_from=cutoff_from,
+        cutoff_to=cutoff_to,
+        columns=columns,
+        last_n_months=last_n_months,
+    )
+    df = create_segment_columns(df, inplace=True, as_category=compact)
+    orig_col = CFG["orig_date"]
+    # DISBURSAL_DATE parse sang datetime trước, compact_panel chỉ mã hoá CUTOFF_DATE
+    # (không đi vòng YYYYMM → Int32 nullable → datetime)
+    if orig_col in df.columns:
+        df[orig_col] = parse_date_column(df[orig_col])
+    if compact:
+        df = compact_panel(df, float32_amounts=float32_amounts, inplace=True, date_keys=("cutoff",))
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".feather.tmp")
+        feather.write_feather(
+            pa.Table.from_pandas(df, preserve_index=False),
+            str(tmp),
+            compression="uncompressed",  # uncompressed → đọc lại bằng memory-map
+        )
+        os.replace(tmp, cache_path)
+        print(f"💾 Panel cached → {cache_path}")
     return df
@@ -1,14 +1,26 @@
 from __future__ import annotations
 from pathlib import Path
+from datetime import date
+from typing import Callable, Iterable
 import os
+import re
 import pandas as pd
-import oracledb
+
+try:
+    import oracledb
+    _HAS_ORACLEDB = True
+except Exception:
+    oracledb = None
+    _HAS_ORACLEDB = False
+
+from src.config import CFG, PARTITION_KEY
 
 # TỐI ƯU MẶC ĐỊNH CHO oracledb
 # ----------------------------------------------------------------
 # Tăng số dòng fetch mỗi lần (mặc định ~100)
-oracledb.defaults.fetch_array_size = 50000
-oracledb.defaults.prefetch_rows = 50000
+if _HAS_ORACLEDB:
+    oracledb.defaults.fetch_array_size = 50000
+    oracledb.defaults.prefetch_rows = 50000
 
 # Nếu mạng hoặc DB chậm → tăng lên 100k
 # oracledb.defaults.fetch_array_size = 100000
@@ -29,6 +41,8 @@ def _connect():
     Tạo kết nối Oracle đã tối ưu.
     Chạy ở chế độ Thin (nhanh, không cần Instant Client).
     """
+    if not _HAS_ORACLEDB:
+        raise ImportError("Cần cài oracledb để kết nối Oracle (pip install oracledb).")
     dsn = oracledb.makedsn(ORA_HOST, ORA_PORT, service_name=ORA_SERVICE)
 
     conn = oracledb.connect(
@@ -91,3 +105,515 @@ def load_df(sql: str, params: dict | None = None, sql_dir: str | None = None) ->
         conn.close()
 
     return df
+
+
+# ============================================================
+# Streaming extraction → parquet partitions CUTOFF_YYYYMM=...
+# ============================================================
+
+FETCH_BATCH_SIZE = 50_000
+
+# Kiểu cột cutoff ở nguồn:
+#   "date"   – Oracle DATE (CUTOFF_DATE trong sql/*.sql): lọc theo khoảng tháng
+#              CUTOFF_DATE >= :cutoff and CUTOFF_DATE < :cutoff_next (bind datetime.date)
+#   "yyyymm" – số YYYYMM: CUTOFF_DATE = :cutoff (bind int)
+CUTOFF_FORMATS = ("date", "yyyymm")
+CUTOFF_FORMAT = "date"
+
+_BIND_RE = re.compile(r":(cutoff_next|cutoff)\b", re.IGNORECASE)
+
+
+def _check_cutoff_format(cutoff_format: str) -> str:
+    if cutoff_format not in CUTOFF_FORMATS:
+        raise ValueError(f"cutoff_format '{cutoff_format}' không hợp lệ ({', '.join(CUTOFF_FORMATS)}).")
+    return cutoff_format
+
+
+def _with_cutoff_bind(sql: str, cutoff_col: str, cutoff_format: str = CUTOFF_FORMAT) -> str:
+    """
+    Nếu SQL chưa có bind :cutoff thì bọc lại để lọc theo 1 cutoff:
+        date:   select * from (<sql>) where CUTOFF_DATE >= :cutoff and CUTOFF_DATE < :cutoff_next
+        yyyymm: select * from (<sql>) where CUTOFF_DATE = :cutoff
+    (cú pháp chạy được trên cả Oracle lẫn SQLite/DuckDB; khoảng tháng vẫn dùng được index/partition DATE)
+    """
+    _check_cutoff_format(cutoff_format)
+    if ":cutoff" in sql.lower():
+        return sql
+    if cutoff_format == "date":
+        cond = f"{cutoff_col} >= :cutoff and {cutoff_col} < :cutoff_next"
+    else:
+        cond = f"{cutoff_col} = :cutoff"
+    return f"select * from (\n{sql}\n) where {cond}"
+
+
+def _cutoff_binds(
+    sql: str,
+    cutoff: int,
+    cutoff_format: str = CUTOFF_FORMAT,
+    cutoff_bind: Callable[[int], object] | None = None,
+) -> dict:
+    """
+    Giá trị bind cho 1 cutoff YYYYMM, chỉ gồm các bind có trong sql (oracledb báo lỗi bind thừa):
+        date   → :cutoff = ngày 1 của tháng, :cutoff_next = ngày 1 tháng sau
+        yyyymm → :cutoff = int YYYYMM
+    cutoff_bind (nếu có) thay giá trị :cutoff.
+    """
+    _check_cutoff_format(cutoff_format)
+    y, m = divmod(int(cutoff), 100)
+    if cutoff_format == "date":
+        binds = {"cutoff": date(y, m, 1), "cutoff_next": date(y + m // 12, m % 12 + 1, 1)}
+    else:
+        binds = {"cutoff": int(cutoff)}
+    if cutoff_bind is not None:
+        binds["cutoff"] = cutoff_bind(int(cutoff))
+    used = {b.lower() for b in _BIND_RE.findall(sql)}
+    return {k: v for k, v in binds.items() if k in used}
+
+
+def _partition_path(out_dir: Path, cutoff: int) -> Path:
+    return Path(out_dir) / f"{PARTITION_KEY}={int(cutoff)}.parquet"
+
+
+def _description_types(cursor) -> list:
+    """
+    Kiểu Arrow theo cursor.description (oracledb); None nếu driver không cho biết (vd SQLite).
+    Chỉ dùng để điền cột toàn NULL ở batch đầu, không ghi đè kiểu suy ra từ dữ liệu.
+    """
+    import pyarrow as pa
+
+    if not _HAS_ORACLEDB:
+        return [None] * len(cursor.description)
+    out = []
+    for d in cursor.description:
+        t, scale = d[1], d[5]
+        if t in (oracledb.DB_TYPE_NUMBER, oracledb.DB_TYPE_BINARY_INTEGER):
+            out.append(pa.int64() if scale == 0 else pa.float64())
+        elif t in (oracledb.DB_TYPE_BINARY_DOUBLE, oracledb.DB_TYPE_BINARY_FLOAT):
+            out.append(pa.float64())
+        elif t in (oracledb.DB_TYPE_VARCHAR, oracledb.DB_TYPE_NVARCHAR, oracledb.DB_TYPE_CHAR, oracledb.DB_TYPE_NCHAR):
+            out.append(pa.string())
+        elif t in (oracledb.DB_TYPE_DATE, oracledb.DB_TYPE_TIMESTAMP):
+            out.append(pa.timestamp("us"))
+        else:
+            out.append(None)
+    return out
+
+
+def _stream_cursor_to_parquet(cursor, out_path: Path, batch_size: int) -> int:
+    """
+    fetchmany(batch_size) → Arrow RecordBatch → ParquetWriter (mỗi batch 1 row group).
+    Bộ nhớ chỉ giữ 1 batch tại 1 thời điểm. Ghi ra file .tmp rồi rename khi xong
+    (lỗi giữa chừng → xoá .tmp, partition cũ giữ nguyên).
+
+    Cột toàn NULL ở batch đầu: lấy kiểu từ cursor.description; driver không có kiểu
+    → giữ các batch lại tới khi cột có dữ liệu rồi mới mở writer (pa.unify_schemas).
+    Query không trả về dòng nào → xoá partition cũ (nguồn không còn dữ liệu cutoff đó).
+    Returns: số dòng đã ghi.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    names = [d[0].upper() for d in cursor.description]
+    hints = _description_types(cursor)
+    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+    writer = None
+    schema = None
+    pending = []
+    n_rows = 0
+
+    def _widen(schema):
+        fields = [
+            f.with_type(h) if pa.types.is_null(f.type) and h is not None else f
+            for f, h in zip(schema, hints)
+        ]
+        return pa.schema(fields)
+
+    def _cast(batch):
+        if batch.schema == schema:
+            return batch
+        try:
+            return batch.cast(schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise TypeError(f"Kiểu dữ liệu batch sau khác batch đầu ({out_path.name}): {e}.") from e
+
+    ok = False
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            cols = list(zip(*rows))
+            batch = pa.RecordBatch.from_arrays([pa.array(c) for c in cols], names=names)
+            n_rows += len(rows)
+            if writer is None:
+                pending.append(batch)
+                schema = _widen(pa.unify_schemas([b.schema for b in pending], promote_options="permissive"))
+                if any(pa.types.is_null(f.type) for f in schema):
+                    continue  # còn cột chưa biết kiểu → đợi batch sau
+                writer = pq.ParquetWriter(str(tmp_path), schema)
+                for b in pending:
+                    writer.write_batch(_cast(b))
+                pending = []
+            else:
+                writer.write_batch(_cast(batch))
+
+        if pending:
+            # Hết dữ liệu mà vẫn có cột toàn NULL → ghi với kiểu null
+            writer = pq.ParquetWriter(str(tmp_path), schema)
+            for b in pending:
+                writer.write_batch(_cast(b))
+        ok = True
+    finally:
+        if writer is not None:
+            writer.close()
+        if not ok:
+            tmp_path.unlink(missing_ok=True)
+
+    if writer is None:
+        # Không có dòng nào → không ghi partition (tránh file schema toàn NULL làm lệch dataset)
+        if out_path.exists():
+            out_path.unlink()
+            print(f"   ⚠️ {out_path.name}: query không trả về dòng nào → xoá partition cũ.")
+        else:
+            print(f"   ⚠️ {out_path.name}: query không trả về dòng nào → không ghi partition.")
+        return 0
+
+    os.replace(tmp_path, out_path)
+    return n_rows
+
+
+def extract_to_parquet(
+    sql: str,
+    out_dir: str | Path,
+    cutoffs: Iterable,
+    params: dict | None = None,
+    sql_dir: str | None = None,
+    cutoff_col: str | None = None,
+    cutoff_bind: Callable[[int], object] | None = None,
+    batch_size: int = FETCH_BATCH_SIZE,
+    connect: Callable | None = None,
+    cutoff_format: str = CUTOFF_FORMAT,
+) -> dict[int, int]:
+    """
+    Trích xuất SQL (vd: sql/ETB.sql) theo từng cutoff, stream thẳng ra parquet:
+        out_dir/CUTOFF_YYYYMM=202501.parquet, ...
+    Không giữ toàn bộ result set trong RAM (khác load_df).
+
+    Args:
+        cutoffs: list cutoff dạng YYYYMM (202501, "202501", ...)
+        cutoff_col: cột lọc cutoff (mặc định CFG["cutoff"]). Nếu SQL đã có bind :cutoff thì dùng nguyên SQL.
+        cutoff_bind: hàm đổi YYYYMM → giá trị bind :cutoff (ghi đè giá trị mặc định của cutoff_format).
+        batch_size: số dòng mỗi lần fetchmany / mỗi row group.
+        connect: factory trả về DB-API connection (mặc định _connect Oracle).
+                 Test local: connect=lambda: sqlite3.connect("test.db")
+        cutoff_format: "date" (CUTOFF_DATE kiểu DATE, lọc theo khoảng tháng) hoặc "yyyymm" (cột số).
+
+    Returns:
+        {cutoff: số dòng đã ghi} (0 → partition cũ của cutoff đó đã bị xoá)
+    """
+    raw_sql, src_file = _resolve_sql_text(sql, sql_dir)
+    final_sql = _with_cutoff_bind(_clean_sql(raw_sql), cutoff_col or CFG["cutoff"], cutoff_format)
+    connect = connect or _connect
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"📤 Extract {src_file or 'SQL'} → {out_dir} (batch_size={batch_size:,})")
+
+    written: dict[int, int] = {}
+    conn = connect()
+    try:
+        for c in cutoffs:
+            cutoff = int(c)
+            binds = {**(params or {}), **_cutoff_binds(final_sql, cutoff, cutoff_format, cutoff_bind)}
+            cur = conn.cursor()
+            try:
+                cur.arraysize = batch_size
+                cur.execute(final_sql, binds)
+                n = _stream_cursor_to_parquet(cur, _partition_path(out_dir, cutoff), batch_size)
+            finally:
+                cur.close()
+            written[cutoff] = n
+            print(f"   ✅ {PARTITION_KEY}={cutoff}: {n:,} rows")
+    finally:
+        conn.close()
+
+    return written
+
+
+# ============================================================
+# Incremental ingest: chỉ fetch các cutoff còn thiếu
+# ============================================================
+
+def list_source_cutoffs(
+    sql: str,
+    sql_dir: str | None = None,
+    cutoff_col: str | None = None,
+    params: dict | None = None,
+    connect: Callable | None = None,
+    cutoff_format: str = CUTOFF_FORMAT,
+) -> list[int]:
+    """
+    Danh sách cutoff (YYYYMM) đang có ở nguồn: select distinct CUTOFF_DATE from (<sql>).
+    cutoff_format="date" → mỗi ngày DATE quy về tháng của nó; "yyyymm" → giá trị số giữ nguyên.
+    """
+    from src.data_loader import _to_yyyymm
+
+    _check_cutoff_format(cutoff_format)
+    raw_sql, _ = _resolve_sql_text(sql, sql_dir)
+    inner = _clean_sql(raw_sql)
+    if ":cutoff" in inner.lower():
+        raise ValueError("SQL đã có bind :cutoff → truyền cutoffs=[...] trực tiếp cho ingest_incremental.")
+    col = cutoff_col or CFG["cutoff"]
+    conn = (connect or _connect)()
+    try:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"select distinct {col} from (\n{inner}\n) t", dict(params or {}))
+            values = [r[0] for r in cur.fetchall()]
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+    values = [v for v in values if v is not None]
+    if cutoff_format == "date":
+        ts = pd.DatetimeIndex(pd.to_datetime(values))
+        return sorted(set((ts.year * 100 + ts.month).tolist()))
+    return sorted({_to_yyyymm(v) for v in values})
+
+
+def ingest_incremental(
+    sql: str,
+    out_dir: str | Path,
+    refresh_last_n: int = 0,
+    cutoffs: Iterable | None = None,
+    params: dict | None = None,
+    sql_dir: str | None = None,
+    cutoff_col: str | None = None,
+    cutoff_bind: Callable[[int], object] | None = None,
+    batch_size: int = FETCH_BATCH_SIZE,
+    connect: Callable | None = None,
+    cutoff_format: str = CUTOFF_FORMAT,
+) -> dict[int, int]:
+    """
+    Ingest hàng tháng theo manifest (out_dir/_manifest.json):
+      - chỉ fetch các cutoff có ở nguồn nhưng chưa có trong manifest / mất file
+      - cộng thêm refresh_last_n cutoff mới nhất (bắt số liệu điều chỉnh muộn)
+      - cập nhật manifest (số dòng, checksum) cho các partition vừa ghi,
+        bỏ khỏi manifest các cutoff refresh không còn dòng nào
+
+    Thư mục parquet cũ chưa có manifest → chạy build_manifest(out_dir) 1 lần trước.
+
+    Returns:
+        {cutoff: số dòng đã ghi} cho các cutoff được fetch
+    """
+    from src.data_loader import list_partitions, partition_entry, read_manifest, write_manifest
+
+    out_dir = Path(out_dir)
+    if cutoffs is None:
+        source = list_source_cutoffs(
+            sql, sql_dir=sql_dir, cutoff_col=cutoff_col, params=params, connect=connect,
+            cutoff_format=cutoff_format,
+        )
+    else:
+        source = sorted({int(c) for c in cutoffs})
+
+    manifest = read_manifest(out_dir)
+    on_disk = list_partitions(out_dir) if out_dir.exists() else {}
+    have = {int(k) for k in manifest["partitions"]} & set(on_disk)
+
+    missing = [c for c in source if c not in have]
+    refresh = source[-refresh_last_n:] if refresh_last_n > 0 else []
+    todo = sorted(set(missing) | set(refresh))
+
+    print(f"🔄 Ingest: nguồn có {len(source)} cutoffs | đã có {len(have)} | "
+          f"thiếu {len(missing)} | refresh {len(refresh)}")
+    if not todo:
+        print("✅ Dữ liệu đã cập nhật, không cần fetch.")
+        return {}
+
+    written = extract_to_parquet(
+        sql,
+        out_dir=out_dir,
+        cutoffs=todo,
+        params=params,
+        sql_dir=sql_dir,
+        cutoff_col=cutoff_col,
+        cutoff_bind=cutoff_bind,
+        batch_size=batch_size,
+        connect=connect,
+        cutoff_format=cutoff_format,
+    )
+
+    partitions = list_partitions(out_dir)
+    for c, n in written.items():
+        if n > 0 and c in partitions:
+            manifest["partitions"][str(c)] = partition_entry(out_dir, partitions[c])
+        elif n == 0:
+            manifest["partitions"].pop(str(c), None)
+    write_manifest(out_dir, manifest)
+    print(f"🧾 Manifest cập nhật: {len(manifest['partitions'])} partitions")
+    return written
+
+
+
+# ============================================================
+# Parallel extraction: shard theo CUTOFF_DATE hoặc ORA_HASH(AGREEMENT_ID)
+# ============================================================
+
+def _create_pool(workers: int):
+    """Connection pool Oracle (mỗi worker giữ 1 connection)."""
+    if not _HAS_ORACLEDB:
+        raise ImportError("Cần cài oracledb để kết nối Oracle (pip install oracledb).")
+    dsn = oracledb.makedsn(ORA_HOST, ORA_PORT, service_name=ORA_SERVICE)
+    return oracledb.create_pool(
+        user=ORA_USER,
+        password=ORA_PASS,
+        dsn=dsn,
+        min=1,
+        max=workers,
+        increment=1,
+        stmtcachesize=50,
+    )
+
+
+def _run_shard(connect: Callable, sql: str, binds: dict, out_path: Path | None, batch_size: int):
+    """Chạy 1 shard: trả về DataFrame (merge) hoặc stream ra out_path (trả về số dòng)."""
+    conn = connect()
+    try:
+        if out_path is None:
+            return pd.read_sql_query(sql, conn, params=binds)
+        cur = conn.cursor()
+        try:
+            cur.arraysize = batch_size
+            cur.execute(sql, binds)
+            return _stream_cursor_to_parquet(cur, out_path, batch_size)
+        finally:
+            cur.close()
+    finally:
+        conn.close()  # pool.acquire() → close() trả connection về pool
+
+
+def load_df_parallel(
+    sql: str,
+    shard_by: str = "cutoff",
+    cutoffs: Iterable | None = None,
+    n_shards: int = 8,
+    workers: int = 4,
+    params: dict | None = None,
+    sql_dir: str | None = None,
+    cutoff_col: str | None = None,
+    cutoff_bind: Callable[[int], object] | None = None,
+    hash_col: str | None = None,
+    hash_expr: str = "ORA_HASH({col}, {max_bucket})",
+    out_dir: str | Path | None = None,
+    batch_size: int = FETCH_BATCH_SIZE,
+    connect: Callable | None = None,
+    cutoff_format: str = CUTOFF_FORMAT,
+) -> pd.DataFrame | dict:
+    """
+    Chạy SQL song song theo shard trên connection pool.
+
+    shard_by:
+        - "cutoff": mỗi shard = 1 tháng cutoff (cutoffs=None → lấy từ nguồn), lọc/bind theo
+                    cutoff_format như extract_to_parquet ("date" | "yyyymm")
+        - "hash":   mỗi shard = 1 bucket của hash_expr trên hash_col (mặc định AGREEMENT_ID),
+                    hash_expr mặc định ORA_HASH({col}, {max_bucket}) → bucket 0..n_shards-1
+    out_dir:
+        - None → merge các shard thành 1 DataFrame (theo thứ tự shard)
+        - path → ghi mỗi shard ra parquet (CUTOFF_YYYYMM=... hoặc SHARD=...), trả về {shard: số dòng}
+    connect:
+        factory trả về DB-API connection. Mặc định: oracledb pool với max=workers.
+        Test local: connect=lambda: sqlite3.connect("test.db"), hash_expr="({col} % {n_shards})"
+    """
+    raw_sql, src_file = _resolve_sql_text(sql, sql_dir)
+    inner = _clean_sql(raw_sql)
+
+    if shard_by == "cutoff":
+        col = cutoff_col or CFG["cutoff"]
+        if cutoffs is None:
+            cutoffs = list_source_cutoffs(
+                sql, sql_dir=sql_dir, cutoff_col=col, params=params, connect=connect, cutoff_format=cutoff_format
+            )
+        shard_sql = _with_cutoff_bind(inner, col, cutoff_format)
+        shards = [
+            (c, _cutoff_binds(shard_sql, c, cutoff_format, cutoff_bind))
+            for c in sorted({int(c) for c in cutoffs})
+        ]
+        name_of = lambda key: f"{PARTITION_KEY}={key}.parquet"
+    elif shard_by == "hash":
+        expr = hash_expr.format(col=hash_col or CFG["loan"], max_bucket=n_shards - 1, n_shards=n_shards)
+        shard_sql = f"select * from (\n{inner}\n) where {expr} = :shard"
+        shards = [(i, {"shard": i}) for i in range(n_shards)]
+        name_of = lambda key: f"SHARD={key:03d}.parquet"
+    else:
+        raise ValueError(f"shard_by không hợp lệ: {shard_by}. Chọn 'cutoff' hoặc 'hash'.")
+
+    print(f"⚡ load_df_parallel: {src_file or 'SQL'} | {len(shards)} shards theo {shard_by} | workers={workers}")
+
+    pool = None
+    if connect is None:
+        pool = _create_pool(workers)
+        connect = pool.acquire
+
+    if out_dir is not None:
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = {
+                key: ex.submit(
+                    _run_shard,
+                    connect,
+                    shard_sql,
+                    {**(params or {}), **binds},
+                    None if out_dir is None else out_dir / name_of(key),
+                    batch_size,
+                )
+                for key, binds in shards
+            }
+            results = {key: fut.result() for key, fut in futures.items()}
+    finally:
+        if pool is not None:
+            pool.close()
+
+    if out_dir is not None:
+        total = sum(results.values())
+        print(f"✅ Wrote {total:,} rows in {len(results)} shards → {out_dir}")
+        return results
+
+    frames = [results[key] for key, _ in shards]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    print(f"✅ Loaded {len(df):,} rows from {len(shards)} shards")
+    return df
+
+if __name__ == "__main__":
+    # python -m src.db sql/ETB.sql ETB_Parquet_YYYYMM --refresh-last 2
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incremental ingest SQL → parquet CUTOFF_YYYYMM partitions")
+    parser.add_argument("sql", help="file .sql (vd: sql/ETB.sql)")
+    parser.add_argument("out_dir", help="thư mục parquet đích (vd: ETB_Parquet_YYYYMM)")
+    parser.add_argument("--refresh-last", type=int, default=0, help="fetch lại N cutoff mới nhất")
+    parser.add_argument("--batch-size", type=int, default=FETCH_BATCH_SIZE)
+    parser.add_argument("--cutoff-col", default=None, help=f"cột cutoff (mặc định {CFG['cutoff']})")
+    parser.add_argument("--cutoff-format", choices=CUTOFF_FORMATS, default=CUTOFF_FORMAT,
+                        help="date: cột DATE (lọc theo khoảng tháng) | yyyymm: cột số YYYYMM")
+    parser.add_argument("--build-manifest", action="store_true",
+                        help="quét partition đang có để tạo manifest trước khi ingest")
+    args = parser.parse_args()
+
+    if args.build_manifest:
+        from src.data_loader import build_manifest
+        build_manifest(Path(args.out_dir))
+
+    ingest_incremental(
+        args.sql,
+        out_dir=args.out_dir,
+        refresh_last_n=args.refresh_last,
+        cutoff_col=args.cutoff_col,
+        batch_size=args.batch_size,
+        cutoff_format=args.cutoff_format,
+    )
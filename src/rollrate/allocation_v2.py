@@ -12,6 +12,7 @@ import numpy as np
 from typing import Dict, List, Optional
 
 from src.config import CFG, BUCKETS_CANON, BUCKETS_30P, BUCKETS_60P, BUCKETS_90P
+from src.rollrate.matrix_store import as_nested
 
 
 def allocate_with_transition_matrix(
@@ -90,6 +91,17 @@ def allocate_with_transition_matrix(
     
     np.random.seed(seed)
     
+    matrices_by_mob, parent_fallback = as_nested(matrices_by_mob, parent_fallback)
+    
+    # Cache DataFrame → dict: mỗi ma trận chỉ convert 1 lần (thay vì mỗi loan × mỗi bước)
+    matrix_dicts = {}
+    
+    def _as_dict(P_df):
+        key = id(P_df)
+        if key not in matrix_dicts:
+            matrix_dicts[key] = (P_df, P_df.to_dict(orient='index'))
+        return matrix_dicts[key][1]
+    
     results = []
     
     print(f"📍 Phân bổ forecast tại MOB = {target_mob} (dùng transition matrix)")
@@ -130,7 +142,7 @@ def allocate_with_transition_matrix(
                             if isinstance(matrix_data, dict) and "P" in matrix_data:
                                 # matrix_data["P"] là DataFrame, cần convert sang dict
                                 P_df = matrix_data["P"]
-                                matrix = P_df.to_dict(orient='index')
+                                matrix = _as_dict(P_df)
                 
                 # Fallback: dùng parent_fallback
                 if matrix is None and parent_fallback:
@@ -139,7 +151,7 @@ def allocate_with_transition_matrix(
                     if parent_key in parent_fallback:
                         P_df = parent_fallback[parent_key]
                         if isinstance(P_df, pd.DataFrame):
-                            matrix = P_df.to_dict(orient='index')
+                            matrix = _as_dict(P_df)
                 
                 # Fallback: dùng identity matrix (giữ nguyên state)
                 if matrix is None:
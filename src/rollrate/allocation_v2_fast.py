@@ -22,6 +22,7 @@ import numpy as np
 from typing import Dict, List, Optional
 
 from src.config import CFG, BUCKETS_CANON, BUCKETS_30P, BUCKETS_60P, BUCKETS_90P, parse_date_column
+from src.rollrate.matrix_store import fallback_index
 
 # Absorbing states - dư nợ = 0
 ABSORBING_STATES = ['WRITEOFF', 'PREPAY', 'SOLDOUT']
@@ -35,40 +36,14 @@ def _get_combined_matrix(
     mob_from: int,
     mob_to: int,
 ) -> np.ndarray:
-    """Tính combined transition matrix từ mob_from đến mob_to."""
-    n_states = len(BUCKETS_CANON)
-    state_to_idx = {s: i for i, s in enumerate(BUCKETS_CANON)}
-    
-    combined = np.eye(n_states)
-    
-    for mob in range(mob_from, mob_to):
-        P = None
-        
-        if product in matrices_by_mob:
-            if mob in matrices_by_mob[product]:
-                if score in matrices_by_mob[product][mob]:
-                    matrix_data = matrices_by_mob[product][mob][score]
-                    if isinstance(matrix_data, dict) and "P" in matrix_data:
-                        P = matrix_data["P"]
-        
-        if P is None and parent_fallback:
-            parent_key = (product, score)
-            if parent_key in parent_fallback:
-                P = parent_fallback[parent_key]
-        
-        if P is None:
-            continue
-        
-        if isinstance(P, pd.DataFrame):
-            P_arr = np.zeros((n_states, n_states))
-            for from_state in P.index:
-                if from_state in state_to_idx:
-                    for to_state in P.columns:
-                        if to_state in state_to_idx:
-                            P_arr[state_to_idx[from_state], state_to_idx[to_state]] = P.loc[from_state, to_state]
-            combined = combined @ P_arr
-    
-    return combined
+    """
+    Tính combined transition matrix từ mob_from đến mob_to.
+    Fallback (resolve sẵn trong FallbackIndex): đúng MOB → parent (product, score) → bỏ qua MOB đó.
+    Tích ma trận lấy từ cache tích lũy ngược theo mob_to của FallbackIndex.
+    matrices_by_mob nên là FallbackIndex dựng sẵn (dict lồng nhau → mỗi lần gọi dựng lại index).
+    """
+    fidx = fallback_index(matrices_by_mob, parent_fallback, policy="allocation", states=BUCKETS_CANON)
+    return fidx.transition(product, score, mob_from, mob_to)
 
 
 def allocate_fast(
@@ -133,6 +108,7 @@ def allocate_fast(
     #         (dùng để sample STATE_FORECAST)
     # ===================================================
     print("   Đang tính combined matrices...")
+    fidx = fallback_index(matrices_by_mob, parent_fallback, policy="allocation", states=BUCKETS_CANON)
     matrix_cache = {}
     
     unique_combos = df.groupby(['PRODUCT_TYPE', 'RISK_SCORE', 'MOB_CURRENT']).size().reset_index()[['PRODUCT_TYPE', 'RISK_SCORE', 'MOB_CURRENT']]
@@ -146,7 +122,7 @@ def allocate_fast(
             matrix_cache[(product, score, mob_current)] = np.eye(n_states)
         else:
             combined = _get_combined_matrix(
-                matrices_by_mob, parent_fallback,
+                fidx, None,
                 product, score, mob_current, target_mob
             )
             matrix_cache[(product, score, mob_current)] = combined
@@ -440,13 +416,16 @@ def allocate_multi_mob_fast(
     
     loan_info = loan_info.rename(columns=rename_map)
     
+    # Index fallback dựng 1 lần, dùng chung (cả cache tích ma trận) cho mọi target_mob
+    fidx = fallback_index(matrices_by_mob, parent_fallback, policy="allocation", states=BUCKETS_CANON)
+
     for target_mob in target_mobs:
         print(f"\n{'='*50}")
         
         df_allocated = allocate_fast(
             df_loans_latest=df_loans_latest,
             df_lifecycle_final=df_lifecycle_final,
-            matrices_by_mob=matrices_by_mob,
+            matrices_by_mob=fidx,
             target_mob=target_mob,
             parent_fallback=parent_fallback,
             seed=seed,
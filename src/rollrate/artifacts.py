@@ -0,0 +1,271 @@
+# ============================================================
+#  artifacts.py – Lưu / load bundle model đã fit (có version)
+#
+#  Bundle = 1 thư mục:
+#    manifest.json        : version, config_hash, data_window, alpha, danh sách file + sha256
+#    P.npy, parent.npy    : MatrixStore (load bằng memory-map)
+#    has_parent.npy       : segment có parent fallback thật (không phải identity / 0)
+#    matrix_cells.parquet : segment × MOB: present / is_fallback / reason
+#    k_curves.parquet     : mob, k_raw, k_smooth, k_final
+#    seasonality.parquet  : product, month, factor
+#    lgd_<name>.parquet   : các bảng LGD lookup
+#
+#  Dùng .npy riêng từng array (không dùng .npz) vì npz là zip → không memory-map được.
+# ============================================================
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from src.config import MODEL_ARTIFACT_DIR
+from src.data_loader import file_checksum
+from src.rollrate.matrix_store import MatrixStore
+
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+LATEST_FILE = "LATEST"
+
+
+def config_hash() -> str:
+    """Hash các config ảnh hưởng tới model (đổi config → hash khác → cảnh báo khi load)."""
+    import src.config as config
+
+    payload = {
+        "CFG": config.CFG,
+        "SEGMENT_COLS": list(config.SEGMENT_COLS),
+        "DATE_FORMAT": config.DATE_FORMAT,
+        "BUCKETS_CANON": list(config.BUCKETS_CANON),
+        "ABSORBING_BASE": list(config.ABSORBING_BASE),
+        "MIN_OBS": config.MIN_OBS,
+        "MIN_EAD": config.MIN_EAD,
+        "K_GLOBAL_MULTIPLIER": config.K_GLOBAL_MULTIPLIER,
+        "K_POST_MATURE": config.K_POST_MATURE,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+def _k_curves_frame(k_raw_by_mob, k_smooth_by_mob, k_final) -> pd.DataFrame:
+    curves = {"k_raw": k_raw_by_mob or {}, "k_smooth": k_smooth_by_mob or {}, "k_final": k_final or {}}
+    mobs = sorted({int(m) for d in curves.values() for m in d})
+    out = pd.DataFrame({"mob": np.array(mobs, dtype="int64")})
+    for name, d in curves.items():
+        out[name] = [float(d[m]) if m in d else np.nan for m in mobs]
+    return out
+
+
+def _k_curves_dicts(df: pd.DataFrame) -> dict:
+    out = {}
+    for name in ["k_raw", "k_smooth", "k_final"]:
+        s = df.set_index("mob")[name].dropna()
+        out[name] = {int(m): float(v) for m, v in s.items()}
+    return out
+
+
+def save_model_bundle(
+    matrices_by_mob,
+    parent_fallback: Dict | None = None,
+    k_raw_by_mob: Dict | None = None,
+    k_smooth_by_mob: Dict | None = None,
+    k_final: Dict | None = None,
+    alpha: float | None = None,
+    seasonality: Dict[str, pd.Series] | None = None,
+    lgd_lookups: Dict[str, pd.DataFrame] | None = None,
+    data_window: dict | None = None,
+    out_root: str | Path | None = None,
+    version: str | None = None,
+) -> Path:
+    """
+    Ghi toàn bộ output sau calibration vào 1 bundle: out_root/<version>/.
+
+    Args:
+        matrices_by_mob: MatrixStore hoặc dict lồng nhau (kèm parent_fallback).
+        k_raw_by_mob / k_smooth_by_mob / k_final: {mob: k}.
+        alpha: best_alpha từ fit_alpha.
+        seasonality: output build_seasonality ({product: Series tháng 1..12}).
+        lgd_lookups: {tên: DataFrame}, vd {"lookup_all": ..., "lgd_base": ...}.
+        data_window: mô tả dữ liệu fit, vd {"cutoff_from": 202401, "cutoff_to": 202512}.
+        version: tên version (mặc định timestamp YYYYMMDD_HHMMSS).
+
+    Returns:
+        Path tới thư mục bundle. out_root/LATEST trỏ tới version mới nhất.
+    """
+    out_root = Path(out_root or MODEL_ARTIFACT_DIR)
+    version = version or datetime.now().strftime("%Y%m%d_%H%M%S")
+    bundle_dir = out_root / version
+    if bundle_dir.exists():
+        raise FileExistsError(f"Bundle version '{version}' đã tồn tại: {bundle_dir}")
+
+    store = (
+        matrices_by_mob
+        if isinstance(matrices_by_mob, MatrixStore)
+        else MatrixStore.from_nested(matrices_by_mob, parent_fallback)
+    )
+
+    tmp_dir = out_root / f".{version}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    # ---- Matrices ----
+    np.save(tmp_dir / "P.npy", store.P)
+    np.save(tmp_dir / "parent.npy", store.parent)
+    np.save(tmp_dir / "has_parent.npy", store.has_parent)
+    seg_i, mob_j = np.indices(store.present.shape)
+    pd.DataFrame({
+        "product": [store.segments[i][0] for i in seg_i.ravel()],
+        "score": [store.segments[i][1] for i in seg_i.ravel()],
+        "mob": store.mobs[mob_j.ravel()],
+        "present": store.present.ravel(),
+        "is_fallback": store.is_fallback.ravel(),
+        "reason": store.reason.ravel().astype(str),
+    }).to_parquet(tmp_dir / "matrix_cells.parquet", index=False)
+
+    # ---- k curves ----
+    _k_curves_frame(k_raw_by_mob, k_smooth_by_mob, k_final).to_parquet(
+        tmp_dir / "k_curves.parquet", index=False
+    )
+
+    # ---- Seasonality ----
+    if seasonality:
+        pd.concat(
+            [
+                pd.DataFrame({"product": str(prod), "month": s.index.astype("int64"), "factor": s.to_numpy(dtype=float)})
+                for prod, s in seasonality.items()
+            ],
+            ignore_index=True,
+        ).to_parquet(tmp_dir / "seasonality.parquet", index=False)
+
+    # ---- LGD ----
+    for name, lookup in (lgd_lookups or {}).items():
+        lookup.to_parquet(tmp_dir / f"lgd_{name}.parquet", index=False)
+
+    files = sorted(p for p in tmp_dir.iterdir() if p.is_file())
+    manifest = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config_hash": config_hash(),
+        "data_window": data_window or {},
+        "alpha": None if alpha is None else float(alpha),
+        "segments": [list(s) for s in store.segments],
+        "mobs": [int(m) for m in store.mobs],
+        "states": store.states,
+        "lgd_lookups": sorted(lgd_lookups or {}),
+        "files": {p.name: {"bytes": p.stat().st_size, "sha256": file_checksum(p)} for p in files},
+    }
+    with open(tmp_dir / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    os.replace(tmp_dir, bundle_dir)
+    (out_root / LATEST_FILE).write_text(version, encoding="utf-8")
+    print(f"💾 Saved model bundle '{version}' → {bundle_dir} ({len(files)} files)")
+    return bundle_dir
+
+
+def resolve_bundle(path: str | Path | None = None) -> Path:
+    """Thư mục bundle: path trực tiếp, hoặc root chứa LATEST."""
+    path = Path(path or MODEL_ARTIFACT_DIR)
+    if (path / MANIFEST_FILE).exists():
+        return path
+    latest = path / LATEST_FILE
+    if latest.exists():
+        return path / latest.read_text(encoding="utf-8").strip()
+    raise FileNotFoundError(f"Không tìm thấy bundle model tại {path}")
+
+
+def load_model_bundle(
+    path: str | Path | None = None,
+    mmap: bool = True,
+    verify: bool = False,
+    strict_config: bool = False,
+) -> dict:
+    """
+    Load bundle đã lưu bằng save_model_bundle (không cần fit lại).
+
+    Args:
+        path: thư mục bundle hoặc root (→ version trong LATEST).
+        mmap: True → P/parent memory-map (read-only), load gần như tức thì.
+        verify: True → kiểm tra sha256 từng file với manifest.
+        strict_config: True → raise nếu config_hash khác config hiện tại (mặc định chỉ cảnh báo).
+
+    Returns:
+        dict: store (MatrixStore), matrices_by_mob, parent_fallback, k_raw_by_mob,
+              k_smooth_by_mob, k_final, alpha, seasonality, lgd_lookups, manifest.
+    """
+    bundle_dir = resolve_bundle(path)
+    with open(bundle_dir / MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(
+            f"Bundle format_version={manifest.get('format_version')} không hỗ trợ "
+            f"(hiện tại {BUNDLE_FORMAT_VERSION})."
+        )
+
+    if verify:
+        bad = [
+            name for name, meta in manifest["files"].items()
+            if not (bundle_dir / name).exists() or file_checksum(bundle_dir / name) != meta["sha256"]
+        ]
+        if bad:
+            raise ValueError(f"Bundle {bundle_dir} bị thay đổi so với manifest: {bad}")
+
+    if manifest["config_hash"] != config_hash():
+        msg = f"Bundle '{manifest['version']}' được fit với config khác config hiện tại."
+        if strict_config:
+            raise ValueError(msg)
+        print(f"⚠️ {msg}")
+
+    mmap_mode = "r" if mmap else None
+    cells = pd.read_parquet(bundle_dir / "matrix_cells.parquet")
+    shape = (len(manifest["segments"]), len(manifest["mobs"]))
+    # Bundle cũ không có has_parent.npy → mọi segment coi như có parent (như trước)
+    has_parent_path = bundle_dir / "has_parent.npy"
+    has_parent = np.load(has_parent_path) if has_parent_path.exists() else None
+    store = MatrixStore(
+        P=np.load(bundle_dir / "P.npy", mmap_mode=mmap_mode),
+        parent=np.load(bundle_dir / "parent.npy", mmap_mode=mmap_mode),
+        segments=[tuple(s) for s in manifest["segments"]],
+        mobs=manifest["mobs"],
+        states=manifest["states"],
+        present=cells["present"].to_numpy().reshape(shape),
+        is_fallback=cells["is_fallback"].to_numpy().reshape(shape),
+        reason=cells["reason"].to_numpy(dtype=object).reshape(shape),
+        has_parent=has_parent,
+    )
+    matrices_by_mob, parent_fallback = store.to_nested()
+
+    k = _k_curves_dicts(pd.read_parquet(bundle_dir / "k_curves.parquet"))
+
+    seasonality = {}
+    if (bundle_dir / "seasonality.parquet").exists():
+        df_season = pd.read_parquet(bundle_dir / "seasonality.parquet")
+        for prod, grp in df_season.groupby("product", sort=False):
+            seasonality[prod] = pd.Series(grp["factor"].to_numpy(), index=grp["month"].to_numpy())
+
+    lgd_lookups = {
+        name: pd.read_parquet(bundle_dir / f"lgd_{name}.parquet") for name in manifest["lgd_lookups"]
+    }
+
+    print(f"📦 Loaded model bundle '{manifest['version']}' ({store!r})")
+    return {
+        "store": store,
+        "matrices_by_mob": matrices_by_mob,
+        "parent_fallback": parent_fallback,
+        "k_raw_by_mob": k["k_raw"],
+        "k_smooth_by_mob": k["k_smooth"],
+        "k_final": k["k_final"],
+        "alpha": manifest["alpha"],
+        "seasonality": seasonality,
+        "lgd_lookups": lgd_lookups,
+        "manifest": manifest,
+    }
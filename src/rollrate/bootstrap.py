@@ -0,0 +1,277 @@
+# ============================================================
+#  bootstrap.py – Bootstrap theo loan cho transition matrices + forecast
+#
+#  Resample LOAN (không phải cặp): mỗi loan đóng góp cố định vào các ô
+#  (segment, MOB, from, to) → ma trận thưa loan × ô tính 1 lần.
+#  Mỗi lần resample chỉ là trọng số loan W[b, loan] (Poisson(1) / multinomial):
+#      counts[b] = W[b] @ X_loan×ô
+#  → B tensor transition trong vài phép nhân ma trận, rồi đi qua forecast
+#  như thêm 1 trục batch (không chạy lại make_pairs / pipeline cho từng mẫu).
+# ============================================================
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy import sparse
+    _HAS_SCIPY = True
+except Exception:
+    sparse = None
+    _HAS_SCIPY = False
+
+from src.config import CFG, BUCKETS_30P, BUCKETS_90P
+from src.rollrate.transition import STATE_SPACE, _state_codes, transition_tensor_from_counts
+from src.rollrate.matrix_store import MatrixStore, fallback_index
+
+
+# ============================================================
+# 1️⃣ Đóng góp của từng loan vào từng ô
+# ============================================================
+
+def _coo_sum(loan_code, col_code, values):
+    """Gộp (loan, cột) trùng nhau → (loan, cột, tổng), sort theo cột."""
+    n = int(loan_code.max()) + 1 if len(loan_code) else 1
+    uniq, inv = np.unique(col_code.astype(np.int64) * n + loan_code, return_inverse=True)
+    return uniq % n, uniq // n, np.bincount(inv.ravel(), weights=values, minlength=len(uniq))
+
+
+def loan_cell_contributions(pairs: pd.DataFrame, value_col: str = "ead_t") -> dict:
+    """
+    Ma trận đóng góp loan × ô từ output của make_pairs (dạng COO, sort theo ô):
+        counts : ô (segment, mob, from, to) – Σ value_col (state trong STATE_SPACE)
+        n_obs  : ô (segment, mob)           – số cặp
+        ead    : ô (segment, mob)           – Σ value_col (mọi state)
+    Segment / MOB theo đúng thứ tự build_transition_tensor.
+    """
+    loan_code, loans = pd.factorize(pairs[CFG["loan"]])
+    grouper = pairs.groupby(["product_t", "score_t"], observed=True)
+    seg_code = grouper.ngroup().to_numpy()
+    segments = [(str(p), str(s)) for p, s in grouper.size().index]
+    mobs, mob_code = np.unique(pairs["mob_t"].to_numpy(), return_inverse=True)
+
+    n_states = len(STATE_SPACE)
+    n_seg, n_mob = len(segments), len(mobs)
+    weights = pd.to_numeric(pairs[value_col], errors="coerce").fillna(0.0).to_numpy(dtype="float64")
+
+    ok = (loan_code >= 0) & (seg_code >= 0)
+    segmob = seg_code * n_mob + mob_code.ravel()
+    s_from, s_to = _state_codes(pairs["state_t"]), _state_codes(pairs["state_t1"])
+    ok_state = ok & (s_from >= 0) & (s_to >= 0)
+    cell = (segmob * n_states + s_from) * n_states + s_to
+
+    out = {
+        "loans": loans,
+        "n_loans": len(loans),
+        "segments": segments,
+        "mobs": mobs,
+        "n_cells": n_seg * n_mob * n_states * n_states,
+        "n_segmob": n_seg * n_mob,
+    }
+    out["counts"] = _coo_sum(loan_code[ok_state], cell[ok_state], weights[ok_state])
+    out["n_obs"] = _coo_sum(loan_code[ok], segmob[ok], np.ones(int(ok.sum())))
+    out["ead"] = _coo_sum(loan_code[ok], segmob[ok], weights[ok])
+    return out
+
+
+# Không có scipy: số phần tử tối đa của mảng tạm [b, đoạn nnz] (~32 MB float64)
+_NNZ_CHUNK_ELEMS = 1 << 22
+
+
+def _weighted_sum(W: np.ndarray, coo: tuple, n_loans: int, n_cols: int) -> np.ndarray:
+    """W [b, loan] × X [loan, cột] → [b, cột]."""
+    loan, col, val = coo
+    if _HAS_SCIPY:
+        X = sparse.csr_matrix((val, (loan, col)), shape=(n_loans, n_cols))
+        return np.asarray(X.T.dot(W.T).T)
+    # Không có scipy: coo đã sort theo cột → reduceat theo đoạn cột, từng khúc nnz
+    # (không dựng cả mảng [b, nnz]; cột vắt qua 2 khúc được cộng dồn)
+    out = np.zeros((W.shape[0], n_cols))
+    step = max(_NNZ_CHUNK_ELEMS // max(W.shape[0], 1), 1)
+    for lo in range(0, len(col), step):
+        c, l, v = col[lo:lo + step], loan[lo:lo + step], val[lo:lo + step]
+        starts = np.flatnonzero(np.r_[True, c[1:] != c[:-1]])
+        out[:, c[starts]] += np.add.reduceat(W[:, l] * v, starts, axis=1)
+    return out
+
+
+def _loan_weights(rng, method: str, b: int, n_loans: int) -> np.ndarray:
+    if method == "poisson":
+        return rng.poisson(1.0, size=(b, n_loans)).astype("float64")
+    if method == "multinomial":
+        return rng.multinomial(n_loans, np.full(n_loans, 1.0 / n_loans), size=b).astype("float64")
+    raise ValueError(f"bootstrap method '{method}' không hợp lệ (poisson / multinomial).")
+
+
+# ============================================================
+# 2️⃣ B tensor transition trong 1 batch
+# ============================================================
+
+def bootstrap_transitions(
+    pairs: pd.DataFrame,
+    n_boot: int = 200,
+    method: str = "poisson",
+    seed: int | None = 42,
+    value_col: str = "ead_t",
+    batch_size: int = 50,
+    contrib: dict | None = None,
+) -> dict:
+    """
+    Bootstrap theo loan cho toàn bộ transition Segment × MOB (cùng logic parent / MIN_OBS
+    như compute_transition_by_mob, áp dụng trên từng mẫu).
+
+    Args:
+        pairs: output make_pairs(df).
+        n_boot: số mẫu B.
+        method: "poisson" (W ~ Poisson(1), mỗi loan độc lập) hoặc "multinomial" (đúng n loan / mẫu).
+        seed: seed cho np.random.default_rng (tái lập được).
+        batch_size: số mẫu tính cùng lúc (giới hạn RAM).
+        contrib: loan_cell_contributions(pairs) đã tính sẵn (dùng lại khi chạy nhiều lần).
+
+    Returns:
+        dict: segments, mobs, states,
+              P [B, segment, mob, from, to], parent [B, segment, from, to],
+              present [B, segment, mob], is_fallback [B, segment, mob],
+              point (tensor với W = 1, khớp build_transition_tensor).
+    """
+    contrib = loan_cell_contributions(pairs, value_col) if contrib is None else contrib
+    segments, mobs = contrib["segments"], contrib["mobs"]
+    n_seg, n_mob, n_states = len(segments), len(mobs), len(STATE_SPACE)
+    n_loans = contrib["n_loans"]
+
+    def _tensors(W):
+        b = W.shape[0]
+        counts = _weighted_sum(W, contrib["counts"], n_loans, contrib["n_cells"])
+        n_obs = _weighted_sum(W, contrib["n_obs"], n_loans, contrib["n_segmob"])
+        ead = _weighted_sum(W, contrib["ead"], n_loans, contrib["n_segmob"])
+        # Gộp trục batch vào trục segment: mọi bước của tensor đều tính riêng từng segment
+        return transition_tensor_from_counts(
+            counts.reshape(b * n_seg, n_mob, n_states, n_states),
+            np.rint(n_obs).astype(np.int64).reshape(b * n_seg, n_mob),
+            ead.reshape(b * n_seg, n_mob),
+            segments * b,
+            mobs,
+        )
+
+    point = _tensors(np.ones((1, n_loans)))
+
+    rng = np.random.default_rng(seed)
+    P = np.empty((n_boot, n_seg, n_mob, n_states, n_states))
+    parent = np.empty((n_boot, n_seg, n_states, n_states))
+    present = np.empty((n_boot, n_seg, n_mob), dtype=bool)
+    is_fallback = np.empty((n_boot, n_seg, n_mob), dtype=bool)
+    for start in range(0, n_boot, batch_size):
+        b = min(batch_size, n_boot - start)
+        t = _tensors(_loan_weights(rng, method, b, n_loans))
+        sl = slice(start, start + b)
+        P[sl] = t["P"].reshape(b, n_seg, n_mob, n_states, n_states)
+        parent[sl] = t["parent"].reshape(b, n_seg, n_states, n_states)
+        present[sl] = t["present"].reshape(b, n_seg, n_mob)
+        is_fallback[sl] = t["is_fallback"].reshape(b, n_seg, n_mob)
+
+    print(f"✅ Bootstrap {n_boot} mẫu ({method}) × {n_seg} segments × {n_mob} MOB từ {n_loans:,} loans")
+    return {
+        "segments": segments,
+        "mobs": mobs,
+        "states": list(STATE_SPACE),
+        "P": P,
+        "parent": parent,
+        "present": present,
+        "is_fallback": is_fallback,
+        "point": point,
+    }
+
+
+def matrix_bands(boot: dict, product, score, mob=None, q=(0.05, 0.5, 0.95)) -> dict:
+    """
+    Khoảng tin cậy từng ô của ma trận (product, score, mob); mob=None → parent (gộp mọi MOB).
+    Returns: {q: DataFrame from × to}.
+    """
+    i = boot["segments"].index((str(product), str(score)))
+    if mob is None:
+        arr = boot["parent"][:, i]
+    else:
+        arr = boot["P"][:, i, int(np.searchsorted(boot["mobs"], mob))]
+    qs = np.quantile(arr, q, axis=0)
+    return {
+        qq: pd.DataFrame(m, index=boot["states"], columns=boot["states"]) for qq, m in zip(q, qs)
+    }
+
+
+# ============================================================
+# 3️⃣ Forecast với trục batch
+# ============================================================
+
+def bootstrap_forecast(
+    boot: dict,
+    product,
+    score,
+    initial_ead,
+    start_mob: int,
+    max_mob: int,
+    policy: str = "forecast",
+) -> np.ndarray:
+    """
+    EAD_{t+1}[b] = EAD_t[b] @ P[b] cho mọi mẫu cùng lúc.
+    Fallback MOB theo FallbackIndex (policy) dựng trên ước lượng điểm.
+
+    Returns:
+        ndarray [B, max_mob - start_mob + 1, n_states] (trục 1: MOB start_mob..max_mob).
+    """
+    point = boot["point"]
+    fidx = fallback_index(MatrixStore.from_tensor(point), policy=policy)
+    n_boot, n_seg, n_mob, n_states, _ = boot["P"].shape
+
+    v = np.asarray(
+        initial_ead.reindex(boot["states"], fill_value=0.0) if isinstance(initial_ead, pd.Series) else initial_ead,
+        dtype="float64",
+    )
+    out = np.empty((n_boot, max_mob - start_mob + 1, n_states))
+    out[:, 0] = v
+    cur = np.broadcast_to(v, (n_boot, n_states))
+
+    P_flat = boot["P"].reshape(n_boot, n_seg * n_mob, n_states, n_states)
+    for step, slot in enumerate(fidx.slots_for(product, score, range(start_mob, max_mob)), start=1):
+        if slot < 0:
+            raise KeyError(f"Không có transition matrix cho ({product}, {score}) theo policy '{policy}'.")
+        if slot < fidx.n_cells:
+            M = P_flat[:, slot]
+        elif slot < fidx.identity_slot:
+            M = boot["parent"][:, slot - fidx.parent_offset]
+        else:
+            M = None
+        cur = cur if M is None else np.einsum("bs,bst->bt", cur, M)
+        out[:, step] = cur
+    return out
+
+
+def del_curves(v: np.ndarray, states=None, denom=None) -> dict:
+    """
+    DEL30 / DEL90 theo MOB từ EAD [B, mob, state]:
+        DEL = Σ EAD ở BUCKETS_30P (90P) / denom (mặc định tổng EAD ban đầu, vd DISB tại MOB0).
+    """
+    states = list(STATE_SPACE if states is None else states)
+    denom = v[:, 0].sum(axis=-1, keepdims=True) if denom is None else denom
+    out = {}
+    for name, buckets in [("DEL30", BUCKETS_30P), ("DEL90", BUCKETS_90P)]:
+        idx = [states.index(s) for s in buckets if s in states]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[name] = v[..., idx].sum(axis=-1) / denom
+    return out
+
+
+def forecast_bands(v: np.ndarray, start_mob: int, q=(0.05, 0.5, 0.95), denom=None) -> pd.DataFrame:
+    """
+    Khoảng tin cậy DEL30 / DEL90 theo MOB từ output bootstrap_forecast.
+    Cột: MOB, METRIC, MEAN, Q<q> (vd Q05, Q50, Q95).
+    """
+    rows = []
+    mobs = np.arange(start_mob, start_mob + v.shape[1])
+    for metric, curves in del_curves(v, denom=denom).items():
+        qs = np.quantile(curves, q, axis=0)
+        frame = pd.DataFrame({"MOB": mobs, "METRIC": metric, "MEAN": curves.mean(axis=0)})
+        for qq, vals in zip(q, qs):
+            frame[f"Q{int(round(qq * 100)):02d}"] = vals
+        rows.append(frame)
+    return pd.concat(rows, ignore_index=True)
@@ -9,6 +9,8 @@ except Exception:
 from scipy.optimize import minimize
 
 from src.config import CFG, BUCKETS_CANON
+from src.rollrate.forecast_cube import ForecastCube
+from src.rollrate.matrix_store import fallback_index
 
 # Notes: inline comments map major blocks to the calibration guidance
 # (one-step forecast, WLS k calibration, smoothing, optional alpha).
@@ -126,35 +128,16 @@ def _get_P_for_segment(matrices_by_mob, parent_fallback, product, score, mob, st
     """
     Select P_m for (product, score, mob) with fallbacks:
     exact mob -> last available mob -> parent fallback -> identity.
+    Resolved through a FallbackIndex (policy "calibration"); pass a prebuilt index as
+    matrices_by_mob to avoid rebuilding it on every call.
     """
-    prod_str = str(product)
-    score_str = str(score)
+    P = _calibration_index(matrices_by_mob, parent_fallback, states).get(product, score, mob)
+    return pd.DataFrame(P, index=states, columns=states)
 
-    mob_dict = matrices_by_mob.get(prod_str, {})
-    P_df = None
 
-    if mob in mob_dict and score_str in mob_dict[mob]:
-        P_df = mob_dict[mob][score_str]["P"]
-    else:
-        if mob_dict:
-            last_mob = max(mob_dict.keys())
-            if score_str in mob_dict[last_mob]:
-                P_df = mob_dict[last_mob][score_str]["P"]
-
-    if P_df is None and parent_fallback is not None:
-        key_exact = (prod_str, score_str)
-        if key_exact in parent_fallback:
-            P_df = parent_fallback[key_exact]
-        else:
-            candidate = [k for k in parent_fallback.keys() if k[0] == prod_str]
-            if candidate:
-                P_df = parent_fallback[candidate[0]]
-
-    if P_df is None:
-        eye = np.eye(len(states))
-        P_df = pd.DataFrame(eye, index=states, columns=states)
-
-    return P_df.reindex(index=states, columns=states, fill_value=0.0)
+def _calibration_index(matrices_by_mob, parent_fallback, states):
+    """FallbackIndex (policy "calibration"), built once per k / alpha routine (cached on a MatrixStore)."""
+    return fallback_index(matrices_by_mob, parent_fallback, policy="calibration", states=states)
 
 
 def _build_state_vector_from_series(ead_series, states):
@@ -215,6 +198,7 @@ def fit_k_raw_segmented(
     if weight_mode not in ("ead", "equal"):
         raise ValueError(f"Unknown weight_mode: {weight_mode}")
 
+    fidx = _calibration_index(matrices_by_mob, parent_fallback, states)
     rows = []
     for (prod, score, _vintage), mob_dict in actual_results.items():
         mobs = sorted(mob_dict.keys())
@@ -229,14 +213,14 @@ def fit_k_raw_segmented(
             if v_m is None or v_m1 is None:
                 continue
 
-            P_df = _get_P_for_segment(matrices_by_mob, parent_fallback, prod, score, m, states)
+            P = fidx.get(prod, score, m)
             if check_P:
-                _assert_row_stochastic(P_df.values, tol=tol, name=f"P[{prod},{score},mob={m}]")
+                _assert_row_stochastic(P, tol=tol, name=f"P[{prod},{score},mob={m}]")
 
             if denom_mode == "ead":
                 v_m_norm = v_m / w_m
                 v_m1_norm = v_m1 / v_m1.sum()
-                v_hat = v_m_norm.values @ P_df.values
+                v_hat = v_m_norm.values @ P
                 _assert_prob_vector(v_m_norm.values, tol=tol, name="v_m_norm")
                 _assert_prob_vector(v_m1_norm.values, tol=tol, name="v_m1_norm")
                 _assert_prob_vector(v_hat, tol=tol, name="v_hat")
@@ -254,7 +238,7 @@ def fit_k_raw_segmented(
                 if disb_total <= min_disb:
                     continue
 
-                v_hat_amt = v_m.values @ P_df.values
+                v_hat_amt = v_m.values @ P
                 y_vm_amt = float(np.sum(v_m.values[s30_idx]))
                 y_tar_amt = float(np.sum(v_m1.values[s30_idx]))
                 y_hat_amt = float(np.sum(v_hat_amt[s30_idx]))
@@ -479,19 +463,23 @@ def forecast_segment_partial_step(
     states,
     check_P=False,
     tol=1e-6,
+    fidx=None,
 ):
     """
     Forecast with partial-step k: v_{m+1} = v_m + k_m * (v_hat - v_m).
+    fidx: prebuilt FallbackIndex (None -> built from matrices_by_mob).
     """
+    if fidx is None:
+        fidx = _calibration_index(matrices_by_mob, parent_fallback, states)
     results = {}
     cur = initial_ead.reindex(states, fill_value=0.0).astype(float)
     results[start_mob] = cur.copy()
 
     for mob in range(start_mob, max_mob):
-        P_df = _get_P_for_segment(matrices_by_mob, parent_fallback, product, score, mob, states)
+        P = fidx.get(product, score, mob)
         if check_P:
-            _assert_row_stochastic(P_df.values, tol=tol, name=f"P[{product},{score},mob={mob}]")
-        v_hat = cur.values @ P_df.values
+            _assert_row_stochastic(P, tol=tol, name=f"P[{product},{score},mob={mob}]")
+        v_hat = cur.values @ P
         k_m = float(np.clip(k_by_mob.get(mob, 1.0), 0.0, 1.0))
         # Apply k on the state vector (Step 8.2).
         cur = cur + k_m * (pd.Series(v_hat, index=states) - cur)
@@ -500,6 +488,87 @@ def forecast_segment_partial_step(
     return results
 
 
+def k_adjusted_store(
+    matrices_by_mob,
+    parent_fallback,
+    k_by_mob,
+    states,
+    segments,
+    max_mob,
+    fidx=None,
+):
+    """
+    Precompute k-adjusted matrices once per (segment, mob):
+        v_m + k_m * (v_m @ P_m - v_m) = v_m @ A_m,   A_m = (1 - k_m) I + k_m P_m
+    so every vintage advances with one batched matmul per MOB.
+
+    Args:
+        segments: list (product, score) to cover; max_mob: last MOB used as "from" state.
+
+    Returns dict:
+        fidx     : FallbackIndex (policy "calibration")
+        segments : list (product, score); seg_pos: {segment: row}
+        mobs     : MOB 0..max_mob (columns of slots); k: [n_mob] k_m clipped to [0, 1]
+        matrices : [n_adj, n, n] A for each distinct (P slot, k) pair (read-only)
+        slots    : [n_seg, n_mob] row in matrices (-1 = no P)
+        p_slots  : [n_seg, n_mob] slot of P_m in fidx.matrices (pure Markov)
+    """
+    if fidx is None:
+        fidx = _calibration_index(matrices_by_mob, parent_fallback, states)
+    segments = list(dict.fromkeys((p, s) for p, s in segments))
+    mobs = np.arange(int(max_mob) + 1)
+    k = np.array([float(np.clip(k_by_mob.get(int(m), 1.0), 0.0, 1.0)) for m in mobs])
+
+    rows = fidx.rows(segments)
+    cols = np.where(mobs <= fidx.max_mob, mobs, fidx.beyond_col)
+    p_slots = fidx.slots[rows][:, cols] if len(rows) else np.empty((0, len(mobs)), dtype=np.int64)
+
+    # 1 matrix per distinct (slot, k) pair
+    k_code, k_uniq = pd.factorize(k)
+    pair = np.where(p_slots >= 0, p_slots * len(k_uniq) + k_code[None, :], -1)
+    uniq, inv = np.unique(pair, return_inverse=True)
+    inv = inv.reshape(pair.shape)
+    valid = uniq >= 0
+    pair_slot, pair_k = uniq[valid] // len(k_uniq), k_uniq[uniq[valid] % len(k_uniq)]
+
+    n = len(states)
+    A = pair_k[:, None, None] * fidx.matrices[pair_slot]
+    A[:, np.arange(n), np.arange(n)] += (1.0 - pair_k)[:, None]
+    A.flags.writeable = False
+
+    offset = int((~valid).sum())  # -1 (if any) sorts first in uniq
+    slots = np.where(pair >= 0, inv - offset, -1)
+    return {
+        "fidx": fidx,
+        "segments": segments,
+        "seg_pos": {seg: i for i, seg in enumerate(segments)},
+        "mobs": mobs,
+        "k": k,
+        "matrices": A,
+        "slots": slots,
+        "p_slots": p_slots,
+    }
+
+
+def _k_store_rows(k_store, segments, max_mob):
+    """Rows of k_store for a list of (product, score); raise if the store does not cover them."""
+    missing = [seg for seg in dict.fromkeys(segments) if seg not in k_store["seg_pos"]]
+    if missing:
+        raise KeyError(f"k_store does not cover segments {missing[:3]} -> rebuild with k_adjusted_store(segments=...).")
+    if int(max_mob) > int(k_store["mobs"][-1]):
+        raise KeyError(f"k_store covers MOB <= {int(k_store['mobs'][-1])}, need {int(max_mob)}.")
+    return np.array([k_store["seg_pos"][seg] for seg in segments], dtype=np.int64)
+
+
+def _actual_cube(actual_results, states):
+    """actual_results (dict or ForecastCube) -> ForecastCube in `states` order."""
+    if isinstance(actual_results, ForecastCube):
+        if actual_results.states == list(states):
+            return actual_results
+        actual_results = actual_results.to_dict()
+    return ForecastCube.from_dict(actual_results, states)
+
+
 def forecast_all_vintages_partial_step(
     actual_results,
     matrices_by_mob,
@@ -507,29 +576,124 @@ def forecast_all_vintages_partial_step(
     max_mob,
     k_by_mob,
     states,
+    batched=True,
+    k_store=None,
 ):
-    """Apply partial-step forecast for every (product, score, vintage)."""
-    results = {}
-    for (prod, score, vintage), mob_dict in actual_results.items():
+    """
+    Apply partial-step forecast for every (product, score, vintage).
+
+    batched=True: all vintages advance together as v @ A_m with A_m = (1 - k_m) I + k_m P_m
+    precomputed once per (segment, mob) (k_adjusted_store). Same result as the per-vintage
+    loop up to floating-point rounding. batched=False: legacy loop (forecast_segment_partial_step).
+    """
+    if not batched:
+        fidx = _calibration_index(matrices_by_mob, parent_fallback, states)
+        results = {}
+        for (prod, score, vintage), mob_dict in actual_results.items():
+            if not mob_dict:
+                continue
+            start_mob = int(max(mob_dict.keys()))
+            init_ead = mob_dict[start_mob].reindex(states, fill_value=0.0)
+            fc = forecast_segment_partial_step(
+                matrices_by_mob=matrices_by_mob,
+                parent_fallback=parent_fallback,
+                product=prod,
+                score=score,
+                start_mob=start_mob,
+                initial_ead=init_ead,
+                max_mob=max_mob,
+                k_by_mob=k_by_mob,
+                states=states,
+                fidx=fidx,
+            )
+            results[(prod, score, vintage)] = fc
+        return results
+
+    # Initial vector = last actual MOB of each vintage
+    keys, start_mob, init_series = [], [], []
+    for key, mob_dict in actual_results.items():
         if not mob_dict:
             continue
-        start_mob = int(max(mob_dict.keys()))
-        init_ead = mob_dict[start_mob].reindex(states, fill_value=0.0)
-        fc = forecast_segment_partial_step(
-            matrices_by_mob=matrices_by_mob,
-            parent_fallback=parent_fallback,
-            product=prod,
-            score=score,
-            start_mob=start_mob,
-            initial_ead=init_ead,
-            max_mob=max_mob,
-            k_by_mob=k_by_mob,
-            states=states,
+        start = int(max(mob_dict.keys()))
+        keys.append(key)
+        start_mob.append(start)
+        init_series.append(mob_dict[start].reindex(states, fill_value=0.0).astype(float))
+    if not keys:
+        return {}
+    start_mob = np.array(start_mob, dtype=np.int64)
+    segments = [(p, s) for p, s, _v in keys]
+    last_from = max(int(max_mob) - 1, 0)
+    if k_store is None:
+        k_store = k_adjusted_store(
+            matrices_by_mob, parent_fallback, k_by_mob, states, segments, last_from
         )
-        results[(prod, score, vintage)] = fc
+    rows = _k_store_rows(k_store, segments, last_from)
+
+    A = k_store["matrices"]
+    slots = k_store["slots"][rows]
+    width = max(int(max_mob), int(start_mob.max())) + 1
+    ead = np.full((len(keys), width, len(states)), np.nan)
+    cur = np.stack([v.to_numpy() for v in init_series])
+    for m in range(int(start_mob.min()), int(max_mob)):
+        active = np.flatnonzero(start_mob <= m)
+        if len(active) == 0:
+            continue
+        cur[active] = (cur[active, None, :] @ A[slots[active, m]])[:, 0]
+        ead[active, m + 1] = cur[active]
+
+    states_index = pd.Index(states)
+    results = {}
+    for c, key in enumerate(keys):
+        start = int(start_mob[c])
+        fc = {start: init_series[c].copy()}
+        for mob in range(start + 1, int(max_mob) + 1):
+            fc[mob] = pd.Series(ead[c, mob], index=states_index)
+        results[key] = fc
     return results
 
 
+def one_step_k_forecasts(actual_results, k_store, states):
+    """
+    Every (vintage, m -> m+1) pair with actuals at both MOBs, forecast one step in batch:
+        v_hat = v_m @ P_m (pure Markov), v_adj = v_m @ A_m (k-adjusted, from k_store).
+
+    Returns dict:
+        keys   : cohort keys (product, score, vintage); cohort [N]: position in keys
+        mob    : [N] target MOB (m + 1)
+        v_m, v_next, v_hat, v_adj : [N, n_state] EAD vectors
+    """
+    cube = _actual_cube(actual_results, states)
+    mobs = cube.mobs
+    j = np.flatnonzero(np.diff(mobs) == 1)                     # mobs[j + 1] == mobs[j] + 1
+    pair = cube.present[:, j] & cube.present[:, j + 1]
+    c_idx, jj = np.nonzero(pair)
+    j_from = j[jj]
+
+    keys = list(cube.key_index())
+    v_m = cube.values[c_idx, j_from]
+    v_next = cube.values[c_idx, j_from + 1]
+    mob_from = mobs[j_from]
+
+    n_state = len(states)
+    v_hat = np.zeros((0, n_state))
+    v_adj = np.zeros((0, n_state))
+    if len(c_idx):
+        segments = [(keys[c][0], keys[c][1]) for c in range(len(keys))]
+        rows = _k_store_rows(k_store, segments, int(mob_from.max()))[c_idx]
+        P = k_store["fidx"].matrices
+        v_hat = (v_m[:, None, :] @ P[k_store["p_slots"][rows, mob_from]])[:, 0]
+        v_adj = (v_m[:, None, :] @ k_store["matrices"][k_store["slots"][rows, mob_from]])[:, 0]
+    return {
+        "keys": keys,
+        "cohort": c_idx,
+        "mob": mob_from + 1,
+        "v_m": v_m,
+        "v_next": v_next,
+        "v_hat": v_hat,
+        "v_adj": v_adj,
+    }
+
+
 def fit_alpha_segmented(
     actual_results,
     matrices_by_mob,
@@ -607,6 +771,7 @@ def fit_alpha_segmented(
             weight_cache[key] = 1.0 if weight_mode == "equal" else wT
             start_cache[key] = (v0, mob_start, disb_total)
 
+    fidx = _calibration_index(matrices_by_mob, parent_fallback, states)
     best_alpha = None
     best_score = np.inf
     score_rows = []
@@ -631,6 +796,7 @@ def fit_alpha_segmented(
                 states=states,
                 check_P=check_P,
                 tol=tol,
+                fidx=fidx,
             )
             vT_hat = fc[mob_target]
             if denom_mode == "ead":
@@ -727,6 +893,7 @@ def forecast_vintage(
     v_mkv = v_adj.copy()
     _assert_prob_vector(v_adj, tol=tol, name="v_adj")
 
+    fidx = _calibration_index(matrices_by_mob, parent_fallback, states)
     rows = []
     for mob in range(start_mob, mob_target + 1):
         # Track DEL30 path for diagnostics.
@@ -743,12 +910,12 @@ def forecast_vintage(
         if mob == mob_target:
             break
 
-        P_df = _get_P_for_segment(matrices_by_mob, parent_fallback, vintage_key[0], vintage_key[1], mob, states)
+        P = fidx.get(vintage_key[0], vintage_key[1], mob)
         if check_P:
-            _assert_row_stochastic(P_df.values, tol=tol, name=f"P[{vintage_key[0]},{vintage_key[1]},mob={mob}]")
+            _assert_row_stochastic(P, tol=tol, name=f"P[{vintage_key[0]},{vintage_key[1]},mob={mob}]")
 
-        v_hat = v_adj @ P_df.values
-        v_mkv = v_mkv @ P_df.values
+        v_hat = v_adj @ P
+        v_mkv = v_mkv @ P
 
         k_m = float(np.clip(k_by_mob.get(mob, 1.0), 0.0, 1.0))
         if not (0.0 - tol <= k_m <= 1.0 + tol):
@@ -800,8 +967,13 @@ def backtest_error_by_mob(
     disb_total_by_vintage=None,
     min_disb=1e-10,
     weight_mode="ead",
+    k_store=None,
 ):
-    """One-step backtest MAE by MOB: adjusted vs pure Markov."""
+    """
+    One-step backtest MAE by MOB: adjusted vs pure Markov.
+    All (vintage, m -> m+1) pairs are forecast in one batch (one_step_k_forecasts) with
+    the k-adjusted matrices of k_store (None -> k_adjusted_store built here).
+    """
     denom_mode = str(denom_mode).lower()
     if denom_mode not in ("ead", "disb"):
         raise ValueError(f"Unknown denom_mode: {denom_mode}")
@@ -815,49 +987,42 @@ def backtest_error_by_mob(
         s30_states = [s for s in s30_states if s != "CO"]
     s30_idx = np.array([states.index(s) for s in s30_states], dtype=int)
 
-    rows = []
-    for (prod, score, _vintage), mob_dict in actual_results.items():
-        mobs = sorted(mob_dict.keys())
-        mob_set = set(mobs)
-        for m in mobs:
-            if (m + 1) not in mob_set:
-                continue
-            v_m, _w_m = _build_state_vector_from_series(mob_dict[m], states)
-            v_m1, w_m1 = _build_state_vector_from_series(mob_dict[m + 1], states)
-            if v_m is None or v_m1 is None:
-                continue
+    cube = _actual_cube(actual_results, states)
+    if k_store is None:
+        segments = [(p, s) for p, s, _v in cube.key_index()]
+        k_store = k_adjusted_store(
+            matrices_by_mob, parent_fallback, k_by_mob, states, segments, max(int(cube.mobs.max(initial=0)), 0)
+        )
+    one = one_step_k_forecasts(cube, k_store, states)
 
-            P_df = _get_P_for_segment(matrices_by_mob, parent_fallback, prod, score, m, states)
-            v_hat = v_m.values @ P_df.values
-            k_m = float(np.clip(k_by_mob.get(m, 1.0), 0.0, 1.0))
-            # Apply k on the state vector, then compare DEL30 errors.
-            v_adj = v_m + k_m * (pd.Series(v_hat, index=states) - v_m)
+    w_m = one["v_m"].sum(axis=1)
+    w_m1 = one["v_next"].sum(axis=1)
+    keep = (w_m > 0) & (w_m1 > 0)
 
-            if denom_mode == "ead":
-                y_tar = del30_from_v((v_m1 / v_m1.sum()).values, s30_idx)
-                y_adj = del30_from_v((v_adj / v_adj.sum()).values, s30_idx)
-                y_mkv = del30_from_v((v_hat / v_hat.sum()), s30_idx)
-            else:
-                if disb_total_by_vintage is None:
-                    raise ValueError("denom_mode='disb' requires disb_total_by_vintage.")
-                key = (prod, score, _vintage)
-                disb_total = float(disb_total_by_vintage.get(key, 0.0))
-                if disb_total <= min_disb:
-                    continue
-                y_tar = float(np.sum(v_m1.values[s30_idx])) / disb_total
-                y_adj = float(np.sum(v_adj.values[s30_idx])) / disb_total
-                y_mkv = float(np.sum(v_hat[s30_idx])) / disb_total
-
-            rows.append({
-                "mob": int(m + 1),
-                "err_adj": abs(y_adj - y_tar),
-                "err_markov": abs(y_mkv - y_tar),
-                "weight": 1.0 if weight_mode == "equal" else float(w_m1),
-            })
-
-    df_err = pd.DataFrame(rows)
+    with np.errstate(divide="ignore", invalid="ignore"):  # rows with 0 totals are dropped by keep
+        if denom_mode == "ead":
+            # DEL30 share of the normalized vector
+            y_tar = (one["v_next"] / w_m1[:, None])[:, s30_idx].sum(axis=1)
+            y_adj = (one["v_adj"] / one["v_adj"].sum(axis=1)[:, None])[:, s30_idx].sum(axis=1)
+            y_mkv = (one["v_hat"] / one["v_hat"].sum(axis=1)[:, None])[:, s30_idx].sum(axis=1)
+        else:
+            if disb_total_by_vintage is None:
+                raise ValueError("denom_mode='disb' requires disb_total_by_vintage.")
+            disb = np.array([float(disb_total_by_vintage.get(key, 0.0)) for key in one["keys"]])
+            disb = disb[one["cohort"]]
+            keep &= disb > min_disb
+            y_tar = one["v_next"][:, s30_idx].sum(axis=1) / disb
+            y_adj = one["v_adj"][:, s30_idx].sum(axis=1) / disb
+            y_mkv = one["v_hat"][:, s30_idx].sum(axis=1) / disb
+
+    df_err = pd.DataFrame({
+        "mob": one["mob"][keep].astype(int),
+        "err_adj": np.abs(y_adj - y_tar)[keep],
+        "err_markov": np.abs(y_mkv - y_tar)[keep],
+        "weight": np.ones(int(keep.sum())) if weight_mode == "equal" else w_m1[keep],
+    })
     if df_err.empty:
-        return df_err
+        return pd.DataFrame()
 
     out = (
         df_err.groupby("mob")
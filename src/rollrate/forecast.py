@@ -15,7 +15,24 @@ except Exception:
     plt = None
     _HAS_MPL = False
 
-from src.config import CFG, BUCKETS_CANON
+from src.config import CFG, BUCKETS_CANON, BUCKETS_30P, BUCKETS_90P, parse_date_column
+from src.rollrate.forecast_cube import ForecastCube
+from src.rollrate.macro import (
+    multiplier_from_params,
+    roll_split,
+    scenario_multipliers,
+    shock_matrices,
+)
+from src.rollrate.matrix_store import (
+    FallbackIndex,
+    as_nested,
+    banded_diagonals,
+    canonical_form,
+    canonical_step,
+    fallback_index,
+)
+
+FORECAST_KERNELS = ("dense", "canonical", "banded")
 
 
 # ============================================================
@@ -26,13 +43,21 @@ def apply_macro_adjustment(P: pd.DataFrame,
                            macro_params: dict | None = None,
                            enable_macro: bool = False) -> pd.DataFrame:
     """
-    Macro / stress layer (hiện tại chưa dùng, chỉ passthrough).
+    Macro / stress layer: nhân xác suất roll-forward (sang bucket xấu hơn / WRITEOFF)
+    với hệ số macro rồi chuẩn hoá lại hàng (xem macro.shock_matrices).
     P là ma trận transition theo BUCKETS_CANON.
+
+    macro_params:
+        {"multiplier": 1.2}
+        hoặc độ lệch chuẩn hoá của chỉ số: {"GDP_GROWTH": -1.5, "UNEMPLOYMENT_RATE": 2.0, ...}
+        (trọng số MACRO_INDICATORS; "weights" / "method" để ghi đè).
+    Kịch bản theo thời gian / nhiều kịch bản cùng lúc → forecast_scenarios.
     """
-    if not enable_macro:
+    if not enable_macro or not macro_params:
         return P
-    # TODO: implement macro adjustments later
-    return P
+    mult = multiplier_from_params(macro_params)
+    shocked = shock_matrices(P.to_numpy(dtype="float64"), mult, list(P.index), list(P.columns))
+    return pd.DataFrame(shocked, index=P.index, columns=P.columns)
 
 
 # ============================================================
@@ -78,6 +103,7 @@ def forecast_segment(
     max_mob: int,
     enable_macro: bool = False,
     macro_params: dict | None = None,
+    fallback_idx: FallbackIndex | None = None,
 ):
     """
     Forecast EAD theo state từ start_mob → max_mob, sử dụng transition matrices.
@@ -86,6 +112,7 @@ def forecast_segment(
       - initial_ead: vector EAD theo BUCKETS_CANON tại start_mob
       - P: transition matrix amount-weighted (đã build từ ead_t trong transition module)
       - EAD_{t+1} = EAD_t @ P
+      - fallback_idx: FallbackIndex đã build sẵn (policy "forecast"); None → build từ matrices_by_mob
 
     Return:
         result: dict
@@ -93,35 +120,31 @@ def forecast_segment(
             value = Series (index=BUCKETS_CANON, value = EAD theo state)
     """
 
+    if fallback_idx is None:
+        fallback_idx = fallback_index(matrices_by_mob, policy="forecast", states=BUCKETS_CANON)
     result: Dict[int, pd.Series] = {}
 
     # Khởi tạo EAD tại MOB hiện tại
     cur_ead = initial_ead.astype(float).copy()
     result[start_mob] = cur_ead.copy()
+    cur_values = cur_ead.values
 
     for mob in range(start_mob, max_mob):
 
-        # Lấy matrix đúng MOB; nếu không có thì fallback MOB lớn nhất
-        if (
-            product in matrices_by_mob
-            and mob in matrices_by_mob[product]
-            and score in matrices_by_mob[product][mob]
-        ):
-            P: pd.DataFrame = matrices_by_mob[product][mob][score]["P"]
-        else:
-            last_mob = max(matrices_by_mob[product].keys())
-            P = matrices_by_mob[product][last_mob][score]["P"]
+        # Matrix đúng MOB; nếu không có thì fallback MOB lớn nhất (resolve sẵn trong index)
+        P = fallback_idx.get(product, score, mob)
 
         # Macro layer (nếu có)
-        P_adj = apply_macro_adjustment(P, macro_params, enable_macro)
+        if enable_macro:
+            P = apply_macro_adjustment(
+                pd.DataFrame(P, index=BUCKETS_CANON, columns=BUCKETS_CANON), macro_params, enable_macro
+            ).values
 
-        # cur_ead: row vector (1 × n), P_adj: (n × n) → EAD_{t+1}
-        cur_ead_values = cur_ead.values @ P_adj.values
-
-        cur_ead = pd.Series(cur_ead_values, index=BUCKETS_CANON)
+        # cur_ead: row vector (1 × n), P: (n × n) → EAD_{t+1}
+        cur_values = cur_values @ P
 
         # Lưu EAD theo state tại MOB+1
-        result[mob + 1] = cur_ead.copy()
+        result[mob + 1] = pd.Series(cur_values, index=BUCKETS_CANON)
 
     return result
 
@@ -144,6 +167,7 @@ def forecast_vintage(
     enable_macro: bool = False,
     macro_params: dict | None = None,
     df_vintage: pd.DataFrame | None = None,  # ✅ NEW: cho phép truyền sẵn subset
+    fallback_idx: FallbackIndex | None = None,
 ):
     """
     Forecast cho 1 vintage (cohort):
@@ -207,6 +231,7 @@ def forecast_vintage(
         max_mob=max_mob,
         enable_macro=enable_macro,
         macro_params=macro_params,
+        fallback_idx=fallback_idx,
     )
 
     return fc
@@ -216,114 +241,496 @@ def forecast_vintage(
 # 4️⃣ FORECAST FULL PORTFOLIO (EAD-based) – BẢN TỐI ƯU
 # ============================================================
 
-def forecast_all_vintages(
-    df_raw: pd.DataFrame,
-    matrices_by_mob: Dict,
-    max_mob: int = 29,
+def _select_cohorts(df_raw: pd.DataFrame, matrices_by_mob: Dict) -> list:
+    """
+    Danh sách (product, score, vintage) cần forecast, đúng thứ tự loop cũ:
+    product trong matrices → score vừa có matrix (MOB đầu tiên) vừa có data → vintage có data.
+    """
+    from collections import defaultdict
+
+    group_cols = ["PRODUCT_TYPE", "RISK_SCORE", CFG["orig_date"]]
+    group_keys = df_raw[group_cols].drop_duplicates().dropna()
+
+    vintages_by_product: Dict[str, set] = defaultdict(set)
+    scores_by_product: Dict[str, set] = defaultdict(set)
+    existing = set()
+    for p, s, v in group_keys.itertuples(index=False, name=None):
+        vintages_by_product[p].add(v)
+        scores_by_product[p].add(s)
+        existing.add((p, s, v))
+
+    keys = []
+    for product, mob_dict in matrices_by_mob.items():
+        if product not in vintages_by_product or not mob_dict:
+            continue
+        sample_mob = next(iter(mob_dict.keys()))
+        score_list = sorted(set(mob_dict[sample_mob].keys()) & scores_by_product.get(product, set()))
+        vintages = sorted(vintages_by_product[product])
+        for score in score_list:
+            keys.extend((product, score, v) for v in vintages if (product, score, v) in existing)
+    return keys
+
+
+def _cohort_slots(fallback_idx: FallbackIndex, cohorts: list, start_mob: np.ndarray, max_mob: int) -> tuple:
+    """
+    Slot ma trận [n_cohort, mob] theo FallbackIndex + mask bước cần chạy.
+    Returns (keep, mobs, slots, steps, skipped) – keep: index cohort chạy được,
+    skipped: {key: lỗi} cho cohort không có dữ liệu / thiếu matrix.
+    """
+    skipped = {}
+    width = max(int(max_mob), int(start_mob.max())) + 1
+    mobs = np.arange(width)
+    seg_rows = fallback_idx.rows([(p, s) for p, s, _v in cohorts])
+    cols = np.where(mobs <= fallback_idx.max_mob, mobs, fallback_idx.beyond_col)
+    slots = fallback_idx.slots[seg_rows][:, cols]                    # [n_cohort, mob]
+    steps = (mobs[None, :] >= start_mob[:, None]) & (mobs[None, :] < max_mob)
+    ok = (start_mob >= 0) & ~((slots < 0) & steps).any(axis=1)
+    for c in np.flatnonzero(~ok):
+        p, s, v = cohorts[c]
+        if start_mob[c] < 0:
+            skipped[cohorts[c]] = ValueError(
+                f"No rows at latest cutoff for vintage={v}, product={p}, score={s}"
+            )
+        else:
+            bad_mob = int(mobs[(slots[c] < 0) & steps[c]][0])
+            skipped[cohorts[c]] = KeyError(
+                f"Không có transition matrix cho (product={p}, score={s}, mob={bad_mob}) "
+                f"theo policy '{fallback_idx.policy}'."
+            )
+    return np.flatnonzero(ok), mobs, slots, steps, skipped
+
+
+def propagate_cohorts(
+    fallback_idx: FallbackIndex,
+    cohorts: list,
+    init: np.ndarray,
+    start_mob: np.ndarray,
+    max_mob: int,
     enable_macro: bool = False,
     macro_params: dict | None = None,
-):
+    kernel: str = "dense",
+) -> dict:
     """
-    Forecast EAD cho TẤT CẢ SEGMENTS:
-        - mọi Product trong matrices_by_mob
-        - mọi Score trong matrices_by_mob
-        - mọi Vintage (DISBURSAL_DATE) thật sự có trong df_raw
+    Chạy chuỗi Markov cho nhiều cohort cùng lúc từ EAD ban đầu cho trước.
 
-    ✅ BẢN TỐI ƯU:
-      - Group sẵn df_raw theo (PRODUCT_TYPE, RISK_SCORE, orig_date)
-      - Dùng index group để lấy subset thay vì lọc boolean nhiều lần
-      - Chỉ loop qua những (product, score) thật sự có data
-      - Giữ nguyên output:
-          results[(product, score, vintage_date)] = {mob: Series(EAD)}
-    """
+    Args:
+        cohorts  : list (product, score, vintage) – segment lookup theo (product, score)
+        init     : [n_cohort, n_state] EAD tại start_mob (thứ tự BUCKETS_CANON)
+        start_mob: [n_cohort] MOB bắt đầu (-1 = cohort không có dữ liệu → skipped)
+        kernel   : "dense" / "canonical" / "banded" (xem forecast_cohorts_batched)
 
-    from collections import defaultdict
+    Returns:
+        dict keys / start_mob / mobs / ead / states / skipped / kernel / work_per_step
+        như forecast_cohorts_batched (chỉ gồm cohort chạy được).
+    """
+    if kernel not in FORECAST_KERNELS:
+        raise ValueError(f"kernel='{kernel}' không hợp lệ ({', '.join(FORECAST_KERNELS)}).")
+    n_states = len(BUCKETS_CANON)
+    start_mob = np.asarray(start_mob, dtype=np.int64)
+    init = np.asarray(init, dtype="float64")
+    if len(cohorts) == 0:
+        return {
+            "keys": [], "start_mob": np.zeros(0, dtype=np.int64), "mobs": np.arange(max_mob + 1),
+            "ead": np.zeros((0, max_mob + 1, n_states)), "states": list(BUCKETS_CANON),
+            "skipped": {}, "kernel": kernel, "work_per_step": 0,
+        }
 
-    orig_col = CFG["orig_date"]
-    results: Dict[Tuple[str, str, object], Dict[int, pd.Series]] = {}
+    # ---------------------------------------------
+    # 1️⃣ Slot ma trận cho (cohort, MOB) + cohort lỗi (không có matrix)
+    # ---------------------------------------------
+    keep, mobs, slots, steps, skipped = _cohort_slots(fallback_idx, cohorts, start_mob, max_mob)
+    start_mob, init, slots, steps = start_mob[keep], init[keep], slots[keep], steps[keep]
+    keys = [cohorts[c] for c in keep]
+    width = len(mobs)
+
+    matrices = fallback_idx.matrices
+    used = np.unique(slots[steps])
+    if enable_macro:
+        matrices = matrices.copy()
+        for slot in used:
+            P_df = pd.DataFrame(matrices[slot], index=BUCKETS_CANON, columns=BUCKETS_CANON)
+            matrices[slot] = apply_macro_adjustment(P_df, macro_params, enable_macro).values
+
+    # Kernel canonical / banded: ma trận [Q | R] theo slot, EAD chạy theo thứ tự transient → absorbing
+    canon, band, D_all = None, None, None
+    work_per_step = n_states * n_states
+    if kernel != "dense":
+        canon = canonical_form(matrices, BUCKETS_CANON) if enable_macro else fallback_idx.canonical()
+        bad = used[~canon["ok"][used]]
+        if len(bad):
+            raise ValueError(
+                f"kernel='{kernel}': hàng absorbing của ma trận slot {int(bad[0])} "
+                f"({fallback_idx.slot_segment(bad[0])}) không phải identity → dùng kernel='dense'."
+            )
+        t = canon["n_transient"]
+        work_per_step = t * n_states
+        if kernel == "banded":
+            lower = int(canon["lower"][used].max(initial=0))
+            upper = int(canon["upper"][used].max(initial=0))
+            if lower + upper + 1 < t:  # băng hẹp hơn Q → mới có lợi
+                offsets, D_all = banded_diagonals(canon["QR"][:, :, :t], lower, upper)
+                work_per_step = len(offsets) * t + t * (n_states - t)
+        perm = canon["perm"]
+        inv_perm = np.argsort(perm)
 
     # ---------------------------------------------
-    # 1️⃣ Group sẵn dataset theo (product, score, vintage)
+    # 2️⃣ Chạy chuỗi Markov theo lô: EAD_{t+1} = EAD_t @ P
     # ---------------------------------------------
+    ead = np.full((len(keys), width, n_states), np.nan)
+    ead[np.arange(len(keys)), start_mob] = init
+    cur = init.copy() if canon is None else init[:, perm]
+    for m in range(int(start_mob.min()) if len(keys) else 0, int(max_mob)):
+        active = np.flatnonzero(steps[:, m])
+        if len(active) == 0:
+            continue
+        step_slots = slots[active, m]
+        if canon is None:
+            # (1 × n) @ (n × n) theo lô → cùng kết quả với vector @ P của từng cohort
+            cur[active] = (cur[active, None, :] @ matrices[step_slots])[:, 0]
+            ead[active, m + 1] = cur[active]
+        else:
+            if D_all is not None:
+                band = (offsets, D_all[step_slots])
+            cur[active] = canonical_step(cur[active], canon["QR"][step_slots], t, band)
+            ead[active, m + 1] = cur[active][:, inv_perm]
+
+    return {
+        "keys": keys,
+        "start_mob": start_mob,
+        "mobs": mobs,
+        "ead": ead,
+        "states": list(BUCKETS_CANON),
+        "skipped": skipped,
+        "kernel": kernel,
+        "work_per_step": work_per_step,
+    }
+
+
+def _latest_cohort_state(df_raw: pd.DataFrame, cohorts: list) -> tuple:
+    """
+    Snapshot cutoff mới nhất của mọi cohort (1 lần groupby).
+    Returns (init [n_cohort, n_state], start_mob [n_cohort] (-1 = không có dữ liệu), init_template,
+             cutoff_month [n_cohort]: month index year*12 + month − 1 của snapshot (-1 = không có dữ liệu)).
+    """
+    orig_col = CFG["orig_date"]
+    cutoff_col = CFG["cutoff"]
+    mob_col = CFG["mob"]
+    state_col = CFG["state"]
+    ead_col = CFG["ead"]
     group_cols = ["PRODUCT_TYPE", "RISK_SCORE", orig_col]
 
-    grouped = df_raw.groupby(
-        group_cols,
-        observed=True,
-        sort=False,
+    cohort_index = pd.MultiIndex.from_tuples(cohorts, names=group_cols)
+    row_code = cohort_index.get_indexer(pd.MultiIndex.from_frame(df_raw[group_cols]))
+    rows = df_raw.loc[row_code >= 0, [cutoff_col, mob_col, state_col, ead_col]]
+    code = row_code[row_code >= 0]  # grouper dạng array → không align theo index (index có thể trùng)
+
+    latest_cutoff = rows[cutoff_col].groupby(code).transform("max")
+    is_latest = (rows[cutoff_col] == latest_cutoff).to_numpy()
+    latest = rows[is_latest]
+    latest_code = code[is_latest]
+
+    n_c = len(cohorts)
+    start_mob = np.full(n_c, -1, dtype=np.int64)
+    mob_max = latest[mob_col].groupby(latest_code).max()
+    start_mob[mob_max.index.to_numpy()] = mob_max.to_numpy().astype(np.int64)
+    cutoff_month = np.full(n_c, -1, dtype=np.int64)
+    cutoff_first = latest[cutoff_col].groupby(latest_code).first()
+    cutoff_month[cutoff_first.index.to_numpy()] = parse_date_column(cutoff_first, output="month_index").to_numpy()
+
+    ead_by_state = latest.groupby([latest_code, latest[state_col].to_numpy()], observed=True)[ead_col].sum()
+    init = (
+        ead_by_state.unstack()
+        .reindex(index=range(n_c), columns=BUCKETS_CANON)
+        .fillna(0.0)
+        .to_numpy(dtype="float64")
     )
+    # Series mẫu: index / name giống get_initial_ead_vector (để output trùng khớp)
+    first = int(np.flatnonzero(start_mob >= 0)[0]) if (start_mob >= 0).any() else 0
+    init_template = get_initial_ead_vector(latest[latest_code == first])
+    return init, start_mob, init_template, cutoff_month
 
-    # groups: dict key -> index (Index of rows)
-    group_index = grouped.groups  # type: Dict[Tuple, pd.Index]
-
-    # Map product -> set(vintage), product -> set(score)
-    vintages_by_product: Dict[str, set] = defaultdict(set)
-    scores_by_product: Dict[str, set] = defaultdict(set)
 
-    for (p, s, v) in group_index.keys():
-        vintages_by_product[p].add(v)
-        scores_by_product[p].add(s)
+def forecast_cohorts_batched(
+    df_raw: pd.DataFrame,
+    matrices_by_mob: Dict,
+    max_mob: int = 29,
+    enable_macro: bool = False,
+    macro_params: dict | None = None,
+    cohorts: list | None = None,
+    fallback_idx: FallbackIndex | None = None,
+    kernel: str = "dense",
+) -> dict:
+    """
+    Forecast EAD cho nhiều cohort cùng lúc (engine của forecast_all_vintages).
+
+      - EAD ban đầu của mọi cohort (snapshot cutoff mới nhất) tính bằng 1 groupby → [n_cohort, n_state]
+      - Mỗi bước: cohort gom ma trận theo slot của FallbackIndex (segment, MOB hiện tại)
+        → 1 phép matmul theo lô cho mọi cohort, ghi vào array cấp phát sẵn.
+      - kernel="dense": kết quả từng cohort trùng bit với forecast_vintage (cùng thứ tự cộng / nhân).
+
+    Args:
+        cohorts: list (product, score, vintage); None → như forecast_all_vintages.
+        kernel:
+            "dense"     : EAD @ P đủ n × n (trùng bit với forecast_vintage)
+            "canonical" : P = [[Q, R], [0, I]] → chỉ nhân mass transient qua [Q | R] (t × n),
+                          mass absorbing (ABSORBING_BASE) cộng dồn → ~½ phép nhân / bước.
+                          Khác dense chỉ ở sai số làm tròn (thứ tự cộng), ~1e-16 tương đối.
+            "banded"    : như canonical, Q nhân theo đường chéo (chỉ băng khác 0 của Q
+                          trên các slot dùng tới; có lợi khi nhiều bucket DPD).
+
+    Returns:
+        dict:
+            keys      : list (product, score, vintage) forecast được
+            start_mob : ndarray [n_cohort]
+            mobs      : ndarray MOB (trục 1 của ead)
+            ead       : ndarray [n_cohort, n_mob, n_state] (NaN ngoài [start_mob, max_mob])
+            states    : BUCKETS_CANON
+            init_template : Series EAD ban đầu mẫu (index / name như get_initial_ead_vector)
+            skipped   : {key: lỗi} – cohort không forecast được
+            kernel    : kernel đã dùng
+            work_per_step : số phép nhân-cộng / cohort / bước của kernel
+    """
+    if kernel not in FORECAST_KERNELS:
+        raise ValueError(f"kernel='{kernel}' không hợp lệ ({', '.join(FORECAST_KERNELS)}).")
+    n_states = len(BUCKETS_CANON)
+
+    if fallback_idx is None:
+        fallback_idx = fallback_index(matrices_by_mob, policy="forecast", states=BUCKETS_CANON)
+    if cohorts is None:
+        cohorts = _select_cohorts(df_raw, as_nested(matrices_by_mob)[0])
+    empty = {
+        "keys": [], "start_mob": np.zeros(0, dtype=np.int64), "mobs": np.arange(max_mob + 1),
+        "ead": np.zeros((0, max_mob + 1, n_states)), "states": list(BUCKETS_CANON),
+        "init_template": None, "skipped": {}, "kernel": kernel, "work_per_step": 0,
+    }
+    if not cohorts:
+        return empty
 
     # ---------------------------------------------
-    # 2️⃣ Loop qua các product có matrix
-    #    và match với các score/vintage có data
+    # 1️⃣ Snapshot mới nhất + EAD ban đầu của mọi cohort (1 lần groupby)
     # ---------------------------------------------
-    for product, mob_dict in matrices_by_mob.items():
-
-        # Nếu product không có data trong df_raw → bỏ qua
-        if product not in vintages_by_product:
-            continue
-
-        # Score list bên phía matrices
-        sample_mob = next(iter(mob_dict.keys()))
-        scores_in_matrices = set(mob_dict[sample_mob].keys())
+    init, start_mob, init_template, _cutoff_month = _latest_cohort_state(df_raw, cohorts)
 
-        # Score list thực tế từ data
-        scores_in_data = scores_by_product.get(product, set())
+    batched = propagate_cohorts(
+        fallback_idx, cohorts, init, start_mob, max_mob,
+        enable_macro=enable_macro, macro_params=macro_params, kernel=kernel,
+    )
+    batched["init_template"] = init_template
+    return batched
+
+
+def batched_to_dict(batched: dict, max_mob: int) -> Dict[Tuple[str, str, object], Dict[int, pd.Series]]:
+    """Output forecast_cohorts_batched → {(product, score, vintage): {mob: Series}} như forecast_vintage."""
+    template = batched["init_template"]
+    states_index = pd.Index(BUCKETS_CANON)
+    results = {}
+    for c, key in enumerate(batched["keys"]):
+        start = int(batched["start_mob"][c])
+        arr = batched["ead"][c]
+        fc = {start: pd.Series(arr[start], index=template.index, name=template.name)}
+        for mob in range(start + 1, int(max_mob) + 1):
+            fc[mob] = pd.Series(arr[mob], index=states_index)
+        results[key] = fc
+    return results
 
-        # Chỉ giữ những score vừa có matrix vừa có data
-        score_list = sorted(scores_in_matrices & scores_in_data)
-        if not score_list:
-            continue
 
-        # Các vintages thực sự có trong data cho product này
-        vintages = sorted(vintages_by_product[product])
+def forecast_all_vintages(
+    df_raw: pd.DataFrame,
+    matrices_by_mob: Dict,
+    max_mob: int = 29,
+    enable_macro: bool = False,
+    macro_params: dict | None = None,
+    as_array: bool = False,
+    kernel: str = "dense",
+    as_cube: bool = False,
+):
+    """
+    Forecast EAD cho TẤT CẢ SEGMENTS:
+        - mọi Product trong matrices_by_mob
+        - mọi Score trong matrices_by_mob
+        - mọi Vintage (DISBURSAL_DATE) thật sự có trong df_raw
 
-        for score in score_list:
-            for v in vintages:
+    ✅ BẢN BATCH (forecast_cohorts_batched):
+      - EAD ban đầu mọi cohort tính 1 lần, cohort cùng (segment, MOB) đi chung 1 matmul / bước
+      - Giữ nguyên output (trùng bit với forecast_vintage từng cohort):
+          results[(product, score, vintage_date)] = {mob: Series(EAD)}
+      - as_array=True → trả thẳng dict array của forecast_cohorts_batched (nhanh nhất,
+        không tạo Series cho từng MOB).
+      - as_cube=True → ForecastCube [cohort, mob, state] (to_long / to_wide / DEL không lặp cohort).
+      - kernel="canonical" / "banded" → chỉ nhân mass transient (xem forecast_cohorts_batched).
+    """
+    batched = forecast_cohorts_batched(
+        df_raw,
+        matrices_by_mob,
+        max_mob=max_mob,
+        enable_macro=enable_macro,
+        macro_params=macro_params,
+        kernel=kernel,
+    )
+    for (product, score, v), e in batched["skipped"].items():
+        # Giữ nguyên behavior: log và skip segment lỗi
+        print(f"⚠️ Skip ({product}, {score}, vintage={v}) due to error:")
+        print("   ", e)
 
-                key = (product, score, v)
-                idx = group_index.get(key)
+    if as_array:
+        return batched
+    if as_cube:
+        return ForecastCube.from_batched(batched)
+    return batched_to_dict(batched, max_mob)
 
-                # Không có data cho (product, score, vintage) này → skip
-                if idx is None:
-                    continue
 
-                # Lấy subset nhanh bằng index thay vì lọc boolean
-                df_seg = df_raw.loc[idx]
-
-                try:
-                    # Forecast cho 1 segment duy nhất
-                    fc = forecast_vintage(
-                        df_raw=df_raw,
-                        matrices_by_mob=matrices_by_mob,
-                        product=product,
-                        score=score,
-                        vintage_date=v,
-                        max_mob=max_mob,
-                        enable_macro=enable_macro,
-                        macro_params=macro_params,
-                        df_vintage=df_seg,   # ✅ Truyền subset đã lọc sẵn
-                    )
+# ============================================================
+# 4️⃣b FORECAST NHIỀU KỊCH BẢN MACRO (IFRS9 / STRESS) – 1 LẦN CHẠY
+# ============================================================
 
-                    results[(product, score, v)] = fc
+def forecast_scenarios(
+    df_raw: pd.DataFrame,
+    matrices_by_mob: Dict,
+    scenarios,
+    max_mob: int = 29,
+    weights: Dict | None = None,
+    method: str | None = None,
+    lag: int | None = None,
+    probabilities: Dict | None = None,
+    keep_cohorts: bool = True,
+    cohorts: list | None = None,
+    fallback_idx: FallbackIndex | None = None,
+) -> dict:
+    """
+    Forecast EAD cho S kịch bản macro cùng lúc (base / downside / severe / upside, hoặc
+    hàng trăm path stress): kịch bản là thêm 1 trục của array, không chạy lại S lần.
+
+      - Trục macro / portfolio theo tháng lịch tính từ cutoff mới nhất của toàn bộ df_raw (as-of).
+        Cohort có snapshot sớm hơn lag_c tháng: bước forecast thứ h (MOB start+h → start+h+1)
+        rơi vào horizon h − lag_c → dùng M[s, h − lag_c] (macro.scenario_multipliers);
+        các bước trước as-of (h < lag_c) là tháng đã qua → m = 1 (không shock).
+      - Shock theo hàng: v @ P' = (v·a) @ P_fwd + (v·b) @ P_rest → 2 matmul theo lô
+        [S, cohort, 1, n] @ [cohort, n, n], không dựng S bộ ma trận.
+      - Kịch bản với M ≡ 1 trùng forecast_cohorts_batched (sai số làm tròn ~1e-16 tương đối).
+
+    Args:
+        scenarios    : dict {tên: {indicator: scalar | path theo tháng forecast}}
+                       hoặc ndarray [S, H, n_indicator] (thứ tự MACRO_INDICATORS / weights).
+        weights, method, lag : ghi đè MACRO_INDICATORS / ADJUST_METHOD / MACRO_LAG.
+        probabilities: {tên: xác suất} → "weighted" = portfolio bình quân theo xác suất (IFRS9).
+        keep_cohorts : False → bỏ ead theo cohort (chỉ giữ portfolio, tiết kiệm bộ nhớ khi S lớn).
+
+    Returns:
+        dict:
+            scenarios  : tên kịch bản
+            multipliers: ndarray [S, H] hệ số roll-forward theo bước
+            keys / start_mob / mobs / states / skipped : như forecast_cohorts_batched
+            ead        : ndarray [S, n_cohort, n_mob, n_state] (None nếu keep_cohorts=False)
+            cutoff_lag : ndarray [n_cohort] số tháng snapshot của cohort sớm hơn as-of
+            portfolio  : ndarray [S, H + 1, n_state] – tổng EAD các cohort tại tháng lịch as-of + h
+                         (cohort đã tới max_mob không còn tính)
+            weighted   : ndarray [H + 1, n_state] hoặc None
+    """
+    n_states = len(BUCKETS_CANON)
+    if fallback_idx is None:
+        fallback_idx = fallback_index(matrices_by_mob, policy="forecast", states=BUCKETS_CANON)
+    if cohorts is None:
+        cohorts = _select_cohorts(df_raw, as_nested(matrices_by_mob)[0])
+    if not cohorts:
+        raise ValueError("Không có cohort nào để forecast.")
+
+    init, start_mob, _template, cutoff_month = _latest_cohort_state(df_raw, cohorts)
+    keep, mobs, slots, steps, skipped = _cohort_slots(fallback_idx, cohorts, start_mob, max_mob)
+    start_mob, init, slots, steps = start_mob[keep], init[keep], slots[keep], steps[keep]
+    keys = [cohorts[c] for c in keep]
+    if not keys:
+        raise ValueError("Không có cohort nào forecast được (xem skipped của forecast_cohorts_batched).")
+
+    # Lệch tháng lịch của snapshot từng cohort so với as-of (cutoff mới nhất của df_raw)
+    as_of = int(parse_date_column(df_raw[CFG["cutoff"]].drop_duplicates(), output="month_index").max())
+    cutoff_lag = as_of - cutoff_month[keep]
+    horizon = max(int((int(max_mob) - start_mob - cutoff_lag).max()), 0)
+    names, M = scenario_multipliers(scenarios, horizon, weights=weights, method=method, lag=lag)
+    n_s = len(names)
+    M_pad = np.concatenate([np.ones((n_s, 1)), M], axis=1)           # cột 0: tháng trước as-of → m = 1
+
+    # Tách ma trận theo phần roll-forward / phần còn lại (1 lần cho mọi slot)
+    P_fwd, P_rest, F = roll_split(fallback_idx.matrices, BUCKETS_CANON)   # F: [n_slot, n]
+    with np.errstate(divide="ignore"):
+        inv_F = np.where(F > 0, 1.0 / F, np.inf)                     # a = min(m, 1 / F)
+        inv_rest = np.where(F < 1, 1.0 / (1.0 - F), 0.0)             # b = (1 − aF) / (1 − F)
+
+    n_c, width = len(keys), len(mobs)
+    ead = np.full((n_s, n_c, width, n_states), np.nan) if keep_cohorts else None
+    portfolio = np.zeros((horizon + 1, n_s, n_states))
+    portfolio[0] = init[cutoff_lag == 0].sum(axis=0)
+    if ead is not None:
+        ead[:, np.arange(n_c), start_mob] = init
+
+    # cur [cohort, S, n]: mỗi cohort 1 phép (S × n) @ (n × n) → gemm theo lô trên trục cohort
+    cur = np.repeat(init[:, None, :], n_s, axis=1)
+    for m in range(int(start_mob.min()), int(max_mob)):
+        active = np.flatnonzero(steps[:, m])
+        if len(active) == 0:
+            continue
+        step_slots = slots[active, m]
+        h = m - start_mob[active] - cutoff_lag[active]               # horizon lịch của bước (< 0: trước as-of)
+        a = np.minimum(M_pad[:, np.maximum(h + 1, 0)].T[..., None], inv_F[step_slots][:, None, :])  # [k, S, n]
+        b = (1.0 - a * F[step_slots][:, None, :]) * inv_rest[step_slots][:, None, :]
+        v = cur[active]
+        v = (v * a) @ P_fwd[step_slots] + (v * b) @ P_rest[step_slots]
+        cur[active] = v
+        if ead is not None:
+            ead[:, active, m + 1] = v.transpose(1, 0, 2)
+        # cộng vào portfolio theo horizon lịch: one-hot [H + 1, k] @ [k, S·n] (bỏ tháng trước as-of)
+        onehot = np.zeros((horizon + 1, len(active)))
+        in_range = h + 1 >= 0
+        onehot[h[in_range] + 1, np.flatnonzero(in_range)] = 1.0
+        portfolio += (onehot @ v.reshape(len(active), -1)).reshape(horizon + 1, n_s, n_states)
+    portfolio = portfolio.transpose(1, 0, 2)
+
+    weighted = None
+    if probabilities is not None:
+        missing = [k for k in probabilities if k not in names]
+        if missing:
+            raise ValueError(f"probabilities có kịch bản không tồn tại: {missing}")
+        w = np.array([float(probabilities.get(k, 0.0)) for k in names])
+        if w.sum() <= 0:
+            raise ValueError("Tổng probabilities phải > 0.")
+        weighted = np.tensordot(w / w.sum(), portfolio, axes=1)
+
+    return {
+        "scenarios": names,
+        "multipliers": M,
+        "keys": keys,
+        "start_mob": start_mob,
+        "cutoff_lag": cutoff_lag,
+        "mobs": mobs,
+        "states": list(BUCKETS_CANON),
+        "skipped": skipped,
+        "ead": ead,
+        "portfolio": portfolio,
+        "weighted": weighted,
+    }
 
-                except Exception as e:
-                    # Giữ nguyên behavior: log và skip segment lỗi
-                    print(f"⚠️ Skip ({product}, {score}, vintage={v}) due to error:")
-                    print("   ", e)
 
-    return results
+def scenario_summary(result: dict) -> pd.DataFrame:
+    """
+    Portfolio theo kịch bản × horizon: EAD, DEL30 / DEL90 (tỷ lệ trên EAD) và hệ số roll-forward.
+    """
+    states = result["states"]
+    idx30 = [states.index(s) for s in BUCKETS_30P if s in states]
+    idx90 = [states.index(s) for s in BUCKETS_90P if s in states]
+    port = result["portfolio"]
+    n_s, n_h = port.shape[:2]
+    total = port.sum(axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        del30 = port[..., idx30].sum(axis=2) / total
+        del90 = port[..., idx90].sum(axis=2) / total
+    mult = np.concatenate([np.ones((n_s, 1)), result["multipliers"]], axis=1)[:, :n_h]
+    return pd.DataFrame({
+        "SCENARIO": np.repeat(result["scenarios"], n_h),
+        "HORIZON": np.tile(np.arange(n_h), n_s),
+        "MULTIPLIER": mult.ravel(),
+        "EAD": total.ravel(),
+        "DEL30": del30.ravel(),
+        "DEL90": del90.ravel(),
+    })
 
 
 # ============================================================
@@ -482,42 +889,28 @@ def forecast_full_history(
         forecast từ MOB0 → max_mob
     cho mọi (product, score, vintage) đã có trong df_raw.
 
+    ✅ BẢN BATCH: mọi cohort chạy chung forecast_cohorts_batched (1 groupby + 1 matmul / MOB),
+    kết quả như forecast_vintage từng cohort.
+
     Output: DataFrame long-format
     """
 
     orig_col = CFG["orig_date"]
-    records = []
-
-    grouped = df_raw.groupby(["PRODUCT_TYPE", "RISK_SCORE", orig_col])
-
-    for (prod, score, vintage), df_seg in grouped:
-
-        try:
-            fc_dict = forecast_vintage(
-                df_raw=df_raw,
-                matrices_by_mob=matrices_by_mob,
-                product=prod,
-                score=score,
-                vintage_date=vintage,
-                max_mob=max_mob,
-                enable_macro=False,
-                df_vintage=df_seg,   # subset để chạy nhanh
-            )
-
-            for mob, series in fc_dict.items():
-                rec = {
-                    "PRODUCT_TYPE": prod,
-                    "RISK_SCORE": score,
-                    "VINTAGE_DATE": vintage,
-                    "MOB": mob,
-                }
-                rec.update(series.to_dict())
-                records.append(rec)
+    group_cols = ["PRODUCT_TYPE", "RISK_SCORE", orig_col]
+    fallback_idx = fallback_index(matrices_by_mob, policy="forecast", states=BUCKETS_CANON)
 
-        except Exception as e:
-            print(f"⚠️ Skip ({prod}, {score}, {vintage}) → {e}")
+    cohorts = list(df_raw.groupby(group_cols, observed=True).size().index)
+    batched = forecast_cohorts_batched(
+        df_raw,
+        matrices_by_mob,
+        max_mob=max_mob,
+        cohorts=cohorts,
+        fallback_idx=fallback_idx,
+    )
+    for (prod, score, vintage), e in batched["skipped"].items():
+        print(f"⚠️ Skip ({prod}, {score}, {vintage}) → {e}")
 
-    df = pd.DataFrame(records)
+    df = ForecastCube.from_batched(batched).to_long()
     df = df.sort_values(
         ["PRODUCT_TYPE", "RISK_SCORE", "VINTAGE_DATE", "MOB"]
     ).reset_index(drop=True)
@@ -0,0 +1,262 @@
+# ============================================================
+#  forecast_cube.py – Kết quả forecast / lifecycle dạng array 3D
+#
+#  Thay cho {(product, score, vintage): {mob: Series(EAD)}}:
+#    values  [cohort, mob, state]   EAD (NaN ở ô không có)
+#    present [cohort, mob]          ô có dữ liệu (actual hoặc forecast)
+#    keys    DataFrame cohort       PRODUCT_TYPE, RISK_SCORE, VINTAGE_DATE
+#  → long / wide / DEL chỉ là reshape + sum theo trục state, không lặp cohort × MOB.
+# ============================================================
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+from src.config import CFG, BUCKETS_CANON, BUCKETS_30P, BUCKETS_60P, BUCKETS_90P
+
+KEY_COLS = ["PRODUCT_TYPE", "RISK_SCORE", "VINTAGE_DATE"]
+DEL_BUCKETS = {"DEL30": BUCKETS_30P, "DEL60": BUCKETS_60P, "DEL90": BUCKETS_90P}
+
+
+class ForecastCube:
+    """
+    EAD theo cohort × MOB × state trong 1 array float64.
+
+    Ví dụ:
+        cube = forecast_all_vintages(df_raw, matrices_by_mob, as_cube=True)
+        lifecycle = ForecastCube.from_actual(df_raw).combine(cube)
+        df_long = lifecycle.to_long()                   # như lifecycle_to_long_df_amount
+        del30 = lifecycle.to_wide("DEL30_PCT", disb=lifecycle.disb_total(df_raw))
+        sub = lifecycle.select(product="A", mobs=range(0, 13))
+    """
+
+    def __init__(
+        self,
+        keys: pd.DataFrame,
+        values: np.ndarray,
+        mobs,
+        states=None,
+        present: np.ndarray | None = None,
+    ):
+        self.keys = keys.reset_index(drop=True)
+        self.values = np.asarray(values, dtype="float64")
+        self.mobs = np.asarray(mobs, dtype=np.int64)
+        self.states = list(BUCKETS_CANON if states is None else states)
+        self.present = (
+            ~np.isnan(self.values).all(axis=-1) if present is None else np.asarray(present, dtype=bool)
+        )
+        if self.values.shape != (len(self.keys), len(self.mobs), len(self.states)):
+            raise ValueError(
+                f"ForecastCube: values {self.values.shape} không khớp "
+                f"(cohort={len(self.keys)}, mob={len(self.mobs)}, state={len(self.states)})."
+            )
+        self._key_index = None
+
+    # ------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------
+    @classmethod
+    def from_batched(cls, batched: dict) -> "ForecastCube":
+        """Output forecast_cohorts_batched (ô ngoài [start_mob, max_mob] là NaN)."""
+        keys = pd.DataFrame(list(batched["keys"]), columns=KEY_COLS) if batched["keys"] else \
+            pd.DataFrame(columns=KEY_COLS)
+        return cls(keys, batched["ead"], batched["mobs"], batched["states"])
+
+    @classmethod
+    def from_dict(cls, results: Dict, states=None) -> "ForecastCube":
+        """{(product, score, vintage): {mob: Series}} → cube (tương thích output cũ)."""
+        states = list(BUCKETS_CANON if states is None else states)
+        cohort_keys = list(results)
+        mobs = np.array(sorted({int(m) for d in results.values() for m in d}), dtype=np.int64)
+        values = np.full((len(cohort_keys), len(mobs), len(states)), np.nan)
+        present = np.zeros((len(cohort_keys), len(mobs)), dtype=bool)
+        for c, key in enumerate(cohort_keys):
+            for mob, vec in results[key].items():
+                j = np.searchsorted(mobs, int(mob))
+                vec = vec if isinstance(vec, pd.Series) else pd.Series(vec, dtype="float64")
+                values[c, j] = vec.reindex(states, fill_value=0.0).to_numpy(dtype="float64")
+                present[c, j] = True
+        keys = pd.DataFrame(cohort_keys, columns=KEY_COLS) if cohort_keys else pd.DataFrame(columns=KEY_COLS)
+        return cls(keys, values, mobs, states, present)
+
+    @classmethod
+    def from_actual(cls, df_raw: pd.DataFrame, states=None) -> "ForecastCube":
+        """
+        EAD actual theo (product, score, vintage) × MOB × state bằng 1 groupby
+        (như get_actual_all_vintages_amount; state thiếu → 0, thứ tự cohort như groupby).
+        """
+        states = list(BUCKETS_CANON if states is None else states)
+        group_cols = ["PRODUCT_TYPE", "RISK_SCORE", CFG["orig_date"]]
+        mob_col, state_col, ead_col = CFG["mob"], CFG["state"], CFG["ead"]
+
+        groups = df_raw.groupby(group_cols, observed=True, sort=True)
+        cohort_code = groups.ngroup().to_numpy()
+        cohort_uniq = groups.size().index
+        mob_code, mobs = pd.factorize(df_raw[mob_col].to_numpy(), sort=True)
+        valid = (cohort_code >= 0) & (mob_code >= 0)  # MOB NaN → bỏ dòng (như groupby)
+        mob_code = mob_code[valid]
+        state_code = pd.Index(states).get_indexer(df_raw[state_col].to_numpy()[valid])
+
+        n_c, n_m, n_s = len(cohort_uniq), len(mobs), len(states)
+        cell = cohort_code[valid] * n_m + mob_code
+        present = np.bincount(cell, minlength=n_c * n_m).reshape(n_c, n_m) > 0
+
+        # groupby sum (cộng bù sai số như pandas) → trùng giá trị với bản dict
+        ok = state_code >= 0
+        ead = pd.Series(df_raw[ead_col].to_numpy(dtype="float64")[valid][ok])
+        sums = ead.groupby(cell[ok] * n_s + state_code[ok]).sum()
+        values = np.zeros(n_c * n_m * n_s)
+        values[sums.index.to_numpy()] = sums.to_numpy()
+        values = values.reshape(n_c, n_m, n_s)
+        values[~present] = np.nan
+
+        keys = pd.DataFrame(list(cohort_uniq), columns=KEY_COLS) if n_c else pd.DataFrame(columns=KEY_COLS)
+        return cls(keys, values, np.asarray(mobs, dtype=np.int64), states, present)
+
+    def combine(self, forecast: "ForecastCube") -> "ForecastCube":
+        """
+        Lifecycle = actual (self) rồi forecast đè lên ô forecast có giá trị
+        (như combine_all_lifecycle_amount: chỉ giữ cohort có trong forecast, theo thứ tự forecast).
+        """
+        if forecast.states != self.states:
+            raise ValueError("ForecastCube.combine: 2 cube có states khác nhau.")
+        mobs = np.union1d(self.mobs, forecast.mobs).astype(np.int64)
+        n_c = len(forecast)
+        values = np.full((n_c, len(mobs), len(self.states)), np.nan)
+        present = np.zeros((n_c, len(mobs)), dtype=bool)
+
+        rows = self.key_index().get_indexer(forecast.key_index())
+        hit = np.flatnonzero(rows >= 0)
+        cols = np.searchsorted(mobs, self.mobs)
+        values[hit[:, None], cols[None, :]] = self.values[rows[hit]]
+        present[hit[:, None], cols[None, :]] = self.present[rows[hit]]
+
+        cols = np.searchsorted(mobs, forecast.mobs)
+        sub_v = values[:, cols]
+        sub_p = present[:, cols]
+        sub_v[forecast.present] = forecast.values[forecast.present]
+        sub_p |= forecast.present
+        values[:, cols] = sub_v
+        present[:, cols] = sub_p
+        return ForecastCube(forecast.keys, values, mobs, self.states, present)
+
+    # ------------------------------------------------------------
+    # Truy cập / slicing
+    # ------------------------------------------------------------
+    def key_index(self) -> pd.MultiIndex:
+        if self._key_index is None:
+            self._key_index = pd.MultiIndex.from_frame(self.keys)
+        return self._key_index
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __getitem__(self, idx) -> "ForecastCube":
+        """Cắt theo trục cohort (int / slice / mask / list vị trí)."""
+        idx = np.arange(len(self))[idx]
+        idx = np.atleast_1d(idx)
+        return ForecastCube(self.keys.iloc[idx], self.values[idx], self.mobs, self.states, self.present[idx])
+
+    def select(self, product=None, score=None, vintage=None, mobs=None) -> "ForecastCube":
+        """Lọc cohort theo product / score / vintage (giá trị hoặc list) và MOB."""
+        mask = np.ones(len(self), dtype=bool)
+        for col, val in zip(KEY_COLS, (product, score, vintage)):
+            if val is None:
+                continue
+            vals = list(val) if isinstance(val, (list, tuple, set, np.ndarray, pd.Index)) else [val]
+            mask &= self.keys[col].isin(vals).to_numpy()
+        cube = self[mask]
+        if mobs is not None:
+            j = np.flatnonzero(np.isin(self.mobs, np.asarray(list(mobs), dtype=np.int64)))
+            cube = ForecastCube(cube.keys, cube.values[:, j], self.mobs[j], self.states, cube.present[:, j])
+        return cube
+
+    def cohort(self, product, score, vintage) -> pd.DataFrame:
+        """EAD 1 cohort: index MOB (ô có dữ liệu), cột state."""
+        c = self.key_index().get_loc((product, score, vintage))
+        j = self.present[c]
+        return pd.DataFrame(self.values[c, j], index=pd.Index(self.mobs[j], name="MOB"), columns=self.states)
+
+    # ------------------------------------------------------------
+    # DEL
+    # ------------------------------------------------------------
+    def del_amount(self, buckets) -> np.ndarray:
+        """Σ EAD các bucket (có trong states) → [cohort, mob] (NaN ở ô không có)."""
+        idx = [self.states.index(b) for b in buckets if b in self.states]
+        return self.values[..., idx].sum(axis=-1)
+
+    def disb_total(self, df_raw: pd.DataFrame) -> np.ndarray:
+        """DISB_TOTAL theo cohort (mỗi loan 1 lần, như add_del_metrics) → [cohort] (NaN nếu không có)."""
+        group_cols = ["PRODUCT_TYPE", "RISK_SCORE", CFG["orig_date"]]
+        disb = (
+            df_raw.groupby(group_cols + [CFG["loan"]])[CFG["disb"]].first()
+            .groupby(level=[0, 1, 2]).sum()
+        )
+        return disb.reindex(self.key_index()).to_numpy(dtype="float64")
+
+    def del_metrics(self, disb=None) -> Dict[str, np.ndarray]:
+        """
+        {DEL30_AMT, DEL60_AMT, DEL90_AMT[, DEL30_PCT, DEL60_PCT, DEL90_PCT]} → [cohort, mob].
+        disb: [cohort] (vd disb_total(df_raw)); 0 / NaN → PCT = NaN.
+        """
+        out = {f"{name}_AMT": self.del_amount(buckets) for name, buckets in DEL_BUCKETS.items()}
+        if disb is not None:
+            denom = np.asarray(disb, dtype="float64").copy()
+            denom[denom == 0] = np.nan
+            for name in DEL_BUCKETS:
+                out[f"{name}_PCT"] = out[f"{name}_AMT"] / denom[:, None]
+        return out
+
+    # ------------------------------------------------------------
+    # Xuất DataFrame
+    # ------------------------------------------------------------
+    def to_long(self, disb=None, del_metrics: bool = False) -> pd.DataFrame:
+        """
+        Long-form như lifecycle_to_long_df_amount: 1 dòng / (cohort, MOB có dữ liệu),
+        cột KEY_COLS + MOB + states. del_metrics=True → thêm DEL*_AMT (+ DISB_TOTAL, DEL*_PCT nếu có disb).
+        """
+        c, j = np.nonzero(self.present)
+        df = self.keys.iloc[c].reset_index(drop=True)
+        df["MOB"] = self.mobs[j]
+        df = pd.concat([df, pd.DataFrame(self.values[c, j], columns=self.states)], axis=1)
+        if del_metrics:
+            if disb is not None:
+                df["DISB_TOTAL"] = np.asarray(disb, dtype="float64")[c]
+            for name, arr in self.del_metrics(disb).items():
+                df[name] = arr[c, j]
+        return df
+
+    def to_wide(self, metric: str = "DEL30_PCT", disb=None) -> pd.DataFrame:
+        """
+        Bảng cohort × MOB cho 1 state (vd "WRITEOFF") hoặc 1 chỉ tiêu DEL (DEL30_AMT, DEL90_PCT, ...).
+        Index = KEY_COLS, columns = MOB, ô không có = NaN.
+        """
+        if metric in self.states:
+            arr = self.values[..., self.states.index(metric)]
+        else:
+            metrics = self.del_metrics(disb)
+            if metric not in metrics:
+                raise KeyError(f"to_wide: metric '{metric}' không có (state hoặc {list(metrics)}; PCT cần disb).")
+            arr = metrics[metric]
+        arr = np.where(self.present, arr, np.nan)
+        return pd.DataFrame(arr, index=self.key_index(), columns=pd.Index(self.mobs, name="MOB"))
+
+    def to_dict(self) -> Dict:
+        """{(product, score, vintage): {mob: Series}} như output cũ của forecast_all_vintages."""
+        out = {}
+        states = pd.Index(self.states)
+        for c, key in enumerate(self.key_index()):
+            out[key] = {
+                int(m): pd.Series(self.values[c, j], index=states)
+                for j, m in enumerate(self.mobs) if self.present[c, j]
+            }
+        return out
+
+    def __repr__(self) -> str:
+        mob_range = f"{self.mobs.min()}..{self.mobs.max()}" if len(self.mobs) else "-"
+        return (
+            f"ForecastCube(cohorts={len(self)}, mobs={mob_range}, states={len(self.states)}, "
+            f"cells={int(self.present.sum())})"
+        )
@@ -3,41 +3,46 @@ import numpy as np
 from typing import Dict
 
 from src.config import CFG, BUCKETS_CANON
-from src.rollrate.forecast import forecast_segment
+from src.rollrate.forecast import propagate_cohorts
+from src.rollrate.forecast_cube import ForecastCube
+from src.rollrate.matrix_store import fallback_index
 
 
-def _get_disb_total_for_cohort(df_seg: pd.DataFrame) -> float:
+def cohort_disb_totals(df_raw: pd.DataFrame) -> pd.Series:
     """
-    DISB_TOTAL cho 1 cohort (PRODUCT_TYPE, RISK_SCORE, VINTAGE_DATE).
-    Ưu tiên dùng cột DISB trong CFG; nếu không có thì fallback về EAD tại MOB0.
+    DISB_TOTAL cho MỌI cohort (PRODUCT_TYPE, RISK_SCORE, VINTAGE_DATE) bằng 1 groupby,
+    DISB mỗi loan tính 1 lần; không có cột DISB → tổng EAD tại MOB0.
+
+    Returns:
+        Series index = MultiIndex cohort (thứ tự groupby), value = DISB_TOTAL
     """
     disb_col = CFG.get("disb")
     loan_col = CFG.get("loan")
     mob_col  = CFG["mob"]
     ead_col  = CFG["ead"]
+    group_cols = ["PRODUCT_TYPE", "RISK_SCORE", CFG["orig_date"]]
+
+    cohorts = df_raw.groupby(group_cols, observed=True).size().index
 
-    # Trường hợp có DISB
-    if disb_col and disb_col in df_seg.columns:
-        if loan_col and loan_col in df_seg.columns:
+    if disb_col and disb_col in df_raw.columns:
+        if loan_col and loan_col in df_raw.columns:
             disb = (
-                df_seg.groupby(loan_col)[disb_col]
+                df_raw.groupby(group_cols + [loan_col], observed=True)[disb_col]
                 .first()
+                .groupby(level=[0, 1, 2], observed=True)
                 .sum()
             )
         else:
-            disb = df_seg[disb_col].sum()
-        return float(disb)
+            disb = df_raw.groupby(group_cols, observed=True)[disb_col].sum()
+        return disb.reindex(cohorts, fill_value=0.0).astype(float)
 
-    # Fallback: dùng tổng EAD tại MOB0 làm mẫu số
-    if mob_col not in df_seg.columns or ead_col not in df_seg.columns:
+    if mob_col not in df_raw.columns or ead_col not in df_raw.columns:
         raise KeyError(
-            f"Missing mob_col ({mob_col}) hoặc ead_col ({ead_col}) trong df_seg.columns"
+            f"Missing mob_col ({mob_col}) hoặc ead_col ({ead_col}) trong df_raw.columns"
         )
-
-    df0 = df_seg[df_seg[mob_col] == 0]
-    if df0.empty:
-        return 0.0
-    return float(df0[ead_col].sum())
+    df0 = df_raw[df_raw[mob_col] == 0]
+    ead0 = df0.groupby(group_cols, observed=True)[ead_col].sum()
+    return ead0.reindex(cohorts, fill_value=0.0).astype(float)
 
 
 def forecast_full_history(
@@ -53,6 +58,10 @@ def forecast_full_history(
     Giả định:
         - Tại MOB0, toàn bộ EAD nằm ở bucket BUCKETS_CANON[0] (thường là 'DPD0')
         - Tổng EAD ban đầu = DISB_TOTAL của cohort
+
+    ✅ BẢN BATCH: DISB_TOTAL mọi cohort tính 1 groupby (cohort_disb_totals), vector MOB0
+    của mọi cohort xếp thành 1 array và chạy chuỗi Markov cùng lúc (propagate_cohorts)
+    → kết quả như forecast_segment từng cohort.
     """
 
     orig_col = CFG["orig_date"]
@@ -61,80 +70,35 @@ def forecast_full_history(
             f"CFG['orig_date'] = {orig_col}, nhưng df_raw không có cột này. "
             f"(df_raw.columns = {list(df_raw.columns)[:20]} ...)"
         )
+    if not BUCKETS_CANON:
+        raise ValueError("BUCKETS_CANON rỗng – kiểm tra lại src.config")
+
+    # 1️⃣ DISB_TOTAL mọi cohort (1 groupby)
+    disb = cohort_disb_totals(df_raw)
+    print(f"⚙️ forecast_full_history(): có {len(disb)} cohort để backtest")
+
+    cohorts = [(str(p), str(s), v) for p, s, v in disb.index]
+    disb_total = disb.to_numpy(dtype=float)
+    for c in np.flatnonzero(disb_total <= 0):
+        prod, score, vintage = cohorts[c]
+        print(f"⚠️ Skip ({prod}, {score}, {vintage}) vì DISB_TOTAL <= 0")
+    keep = np.flatnonzero(~(disb_total <= 0))
+    cohorts = [cohorts[c] for c in keep]
+
+    # 2️⃣ Vector EAD tại MOB0: toàn bộ nằm ở BUCKETS_CANON[0] (thường là "DPD0")
+    init = np.zeros((len(cohorts), len(BUCKETS_CANON)))
+    init[:, 0] = disb_total[keep]
+
+    # 3️⃣ Chạy chuỗi Markov MOB0 → max_mob cho mọi cohort cùng lúc
+    fallback_idx = fallback_index(matrices_by_mob, policy="forecast", states=BUCKETS_CANON)
+    batched = propagate_cohorts(
+        fallback_idx, cohorts, init, np.zeros(len(cohorts), dtype=np.int64), max_mob
+    )
+    for (prod, score, vintage), e in batched["skipped"].items():
+        print(f"⚠️ Skip ({prod}, {score}, {vintage}) → {e}")
 
-    records = []
-
-    grouped = df_raw.groupby(["PRODUCT_TYPE", "RISK_SCORE", orig_col])
-
-    print(f"⚙️ forecast_full_history(): có {len(grouped)} cohort để backtest")
-
-    for (prod, score, vintage), df_seg in grouped:
-        prod_str  = str(prod)
-        score_str = str(score)
-
-        # 1️⃣ Lấy DISB_TOTAL cho cohort này
-        try:
-            disb_total = _get_disb_total_for_cohort(df_seg)
-        except Exception as e:
-            print(f"⚠️ Lỗi DISB_TOTAL tại ({prod_str}, {score_str}, {vintage}): {e}")
-            continue
-
-        if disb_total <= 0:
-            print(f"⚠️ Skip ({prod_str}, {score_str}, {vintage}) vì DISB_TOTAL <= 0")
-            continue
-
-        # 2️⃣ Khởi tạo vector EAD tại MOB0: toàn bộ nằm ở DPD0
-        if not BUCKETS_CANON:
-            raise ValueError("BUCKETS_CANON rỗng – kiểm tra lại src.config")
-
-        init_ead = pd.Series(0.0, index=BUCKETS_CANON, dtype=float)
-        init_ead.iloc[0] = disb_total  # BUCKETS_CANON[0] thường là "DPD0"
-
-        # 3️⃣ Chạy chuỗi Markov từ MOB0 → max_mob
-        try:
-            fc_dict = forecast_segment(
-                matrices_by_mob=matrices_by_mob,
-                product=prod_str,
-                score=score_str,
-                start_mob=0,
-                initial_ead=init_ead,
-                max_mob=max_mob,
-                enable_macro=False,
-                # ❗ Nếu version cũ không có macro_params, bỏ dòng này:
-                macro_params=None,
-            )
-        except TypeError as e:
-            # Trường hợp forecast_segment không nhận macro_params
-            if "macro_params" in str(e):
-                print("ℹ️ forecast_segment không có tham số macro_params – gọi lại không tham số này.")
-                fc_dict = forecast_segment(
-                    matrices_by_mob=matrices_by_mob,
-                    product=prod_str,
-                    score=score_str,
-                    start_mob=0,
-                    initial_ead=init_ead,
-                    max_mob=max_mob,
-                    enable_macro=False,
-                )
-            else:
-                print(f"⚠️ Skip ({prod_str}, {score_str}, {vintage}) → {e}")
-                continue
-        except Exception as e:
-            print(f"⚠️ Skip ({prod_str}, {score_str}, {vintage}) → {e}")
-            continue
-
-        # 4️⃣ Ghi lại long-format
-        for mob, series in fc_dict.items():
-            rec = {
-                "PRODUCT_TYPE": prod_str,
-                "RISK_SCORE": score_str,
-                "VINTAGE_DATE": vintage,
-                "MOB": mob,
-            }
-            rec.update(series.to_dict())
-            records.append(rec)
-
-    df = pd.DataFrame(records)
+    # 4️⃣ Long-format (1 reshape)
+    df = ForecastCube.from_batched(batched).to_long()
     if df.empty:
         print("⚠️ forecast_full_history(): không tạo được record nào – trả về DataFrame rỗng.")
         return df
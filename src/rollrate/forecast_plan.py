@@ -4,6 +4,7 @@ from typing import Dict, List
 
 from src.config import BUCKETS_CANON, ABSORBING_BASE
 from src.rollrate.transition import STATE_SPACE
+from src.rollrate.matrix_store import fallback_index
 
 
 def forecast_sale_plan_by_mob(
@@ -50,45 +51,31 @@ def forecast_sale_plan_by_mob(
     records = []
 
     # -----------------------------
-    # Helper: chọn ma trận P cho (product, score, mob)
+    # Bảng resolve P cho (product, score, mob), tính 1 lần:
+    #   đúng MOB → parent_fallback (product, score) → parent score khác cùng product → identity
     # -----------------------------
-    def _get_P(product: str, score: str, mob: int) -> pd.DataFrame:
-        prod_str = str(product)
-        score_str = str(score)
-
-        # 1) Thử lấy đúng theo (product, mob, score)
-        mob_dict = matrices_by_mob.get(prod_str, {})
-        score_block = mob_dict.get(mob)
-
-        if score_block is not None and score_str in score_block:
-            P_df = score_block[score_str]["P"]
-            return P_df.reindex(index=states, columns=states, fill_value=0.0)
-
-        # 2) Fallback parent_fallback exact (product, score)
-        key_exact = (prod_str, score_str)
-        if key_exact in parent_fallback:
-            P_df = parent_fallback[key_exact]
-            return P_df.reindex(index=states, columns=states, fill_value=0.0)
-
-        # 3) Fallback bất kỳ score có thật của product đó
-        candidate_keys = [k for k in parent_fallback.keys() if k[0] == prod_str]
-        if candidate_keys:
-            use_key = candidate_keys[0]
-            print(
-                f"⚠️ Fallback (product={prod_str}, score={score_str}, mob={mob}) "
-                f"→ dùng parent_fallback với score='{use_key[1]}'"
-            )
-            P_df = parent_fallback[use_key]
-            return P_df.reindex(index=states, columns=states, fill_value=0.0)
-
-        # 4) Không có bất cứ ma trận nào cho product → dùng identity (giữ nguyên state)
-        print(
-            f"⚠️ Không tìm thấy bất kỳ parent_fallback nào cho product='{prod_str}'. "
-            f"Dùng identity matrix cho MOB={mob}."
-        )
-        eye = np.eye(len(states))
-        P_df = pd.DataFrame(eye, index=states, columns=states)
-        return P_df
+    fidx = fallback_index(matrices_by_mob, parent_fallback, policy="plan", states=states)
+    warned = set()
+
+    def _warn_fallback(product: str, score: str) -> None:
+        if (product, score) in warned:
+            return
+        warned.add((product, score))
+        for mob in range(mob_target):
+            reason = fidx.reason(product, score, mob)
+            if reason == "product_parent":
+                use_score = fidx.slot_segment(fidx.slot(product, score, mob))[1]
+                print(
+                    f"⚠️ Fallback (product={product}, score={score}, mob={mob}) "
+                    f"→ dùng parent_fallback với score='{use_score}'"
+                )
+                return
+            if reason == "identity":
+                print(
+                    f"⚠️ Không tìm thấy bất kỳ parent_fallback nào cho product='{product}'. "
+                    f"Dùng identity matrix cho MOB={mob}."
+                )
+                return
 
     # -----------------------------
     # LOOP TỪNG DÒNG SALE PLAN
@@ -105,6 +92,8 @@ def forecast_sale_plan_by_mob(
         ead_vec[state_idx[start_state]] = ead0
 
         # Chạy từ MOB 0 → MOB_target
+        slots = fidx.slots_for(product, score, range(mob_target))
+        _warn_fallback(product, score)
         for mob in range(mob_target + 1):
 
             rec = {
@@ -120,10 +109,7 @@ def forecast_sale_plan_by_mob(
             if mob == mob_target:
                 break
 
-            P_df = _get_P(product, score, mob)
-            P = P_df.values
-
-            ead_vec = ead_vec @ P
+            ead_vec = ead_vec @ fidx.matrices[slots[mob]]
 
     result = pd.DataFrame(records).sort_values(
         by=["PRODUCT_TYPE", "RISK_SCORE", "VINTAGE_DATE", "MOB"]
@@ -7,6 +7,7 @@ from src.config import CFG, BUCKETS_CANON, parse_date_column
 
 # Forecast engine đã amount-based
 from src.rollrate.forecast import forecast_all_vintages
+from src.rollrate.forecast_cube import ForecastCube
 
 
 # ============================================================
@@ -35,14 +36,14 @@ def get_actual_all_vintages_amount(df_raw: pd.DataFrame):
     results = {}
 
     for (product, score, vintage_date), df_vintage in \
-        df_raw.groupby(["PRODUCT_TYPE", "RISK_SCORE", orig_col]):
+        df_raw.groupby(["PRODUCT_TYPE", "RISK_SCORE", orig_col], observed=True):
 
         mob_dict = {}
 
-        for mob, df_m in df_vintage.groupby(mob_col):
+        for mob, df_m in df_vintage.groupby(mob_col, observed=True):
 
             ead_vec = (
-                df_m.groupby(state_col)[ead_col].sum()
+                df_m.groupby(state_col, observed=True)[ead_col].sum()
                 .reindex(BUCKETS_CANON, fill_value=0.0)
             )
 
@@ -58,6 +59,12 @@ def get_actual_all_vintages_amount(df_raw: pd.DataFrame):
 # ============================================================
 
 def combine_all_lifecycle_amount(actual, forecast):
+    # ForecastCube → ghép trên array (forecast đè actual), không lặp cohort × MOB
+    if isinstance(forecast, ForecastCube):
+        if not isinstance(actual, ForecastCube):
+            actual = ForecastCube.from_dict(actual, forecast.states)
+        return actual.combine(forecast)
+
     lifecycle = {}
 
     for key in forecast.keys():
@@ -84,7 +91,10 @@ def combine_all_lifecycle_amount(actual, forecast):
 # 3️⃣ Convert lifecycle → Long Format (EAD columns)
 # ============================================================
 
-def lifecycle_to_long_df_amount(lifecycle: Dict):
+def lifecycle_to_long_df_amount(lifecycle: Dict | ForecastCube):
+    if isinstance(lifecycle, ForecastCube):
+        return lifecycle.to_long()
+
     rows = []
 
     for (product, score, vintage_date), mob_dict in lifecycle.items():
@@ -114,11 +124,12 @@ def build_full_lifecycle_amount(df_raw, matrices_by_mob, max_mob=29):
         df_raw=df_raw,
         matrices_by_mob=matrices_by_mob,
         max_mob=max_mob,
-        enable_macro=False
+        enable_macro=False,
+        as_cube=True,
     )
 
     # Actual
-    actual_results = get_actual_all_vintages_amount(df_raw)
+    actual_results = ForecastCube.from_actual(df_raw)
 
     # Merge
     lifecycle = combine_all_lifecycle_amount(actual_results, forecast_results)
@@ -848,14 +859,14 @@ def get_actual_all_vintages_amount(df_raw: pd.DataFrame):
     results = {}
 
     for (product, score, vintage_date), df_vintage in \
-        df_raw.groupby(["PRODUCT_TYPE", "RISK_SCORE", orig_col]):
+        df_raw.groupby(["PRODUCT_TYPE", "RISK_SCORE", orig_col], observed=True):
 
         mob_dict = {}
 
-        for mob, df_m in df_vintage.groupby(mob_col):
+        for mob, df_m in df_vintage.groupby(mob_col, observed=True):
 
             ead_vec = (
-                df_m.groupby(state_col)[ead_col].sum()
+                df_m.groupby(state_col, observed=True)[ead_col].sum()
                 .reindex(BUCKETS_CANON, fill_value=0.0)
             )
 
@@ -873,10 +884,10 @@ def build_full_lifecycle_amount(
 ):
     """
     Pipeline:
-        1) forecast_all_vintages → forecast_results (dict)
-        2) get_actual_all_vintages_amount → actual_results (dict)
-        3) combine_all_lifecycle_amount → lifecycle (dict)
-        4) lifecycle_to_long_df_amount → DataFrame long-format
+        1) forecast_all_vintages(as_cube=True) → forecast_results (ForecastCube)
+        2) ForecastCube.from_actual → actual_results (ForecastCube, 1 groupby)
+        3) combine_all_lifecycle_amount → lifecycle (ForecastCube)
+        4) lifecycle_to_long_df_amount → DataFrame long-format (1 reshape)
 
     Output:
         df_long với cột BUCKETS_CANON (EAD per state), PRODUCT_TYPE, RISK_SCORE, VINTAGE_DATE, MOB
@@ -888,10 +899,11 @@ def build_full_lifecycle_amount(
         matrices_by_mob=matrices_by_mob,
         max_mob=max_mob,
         enable_macro=False,
+        as_cube=True,
     )
 
     # 2️⃣ Actual
-    actual_results = get_actual_all_vintages_amount(df_raw)
+    actual_results = ForecastCube.from_actual(df_raw)
 
     # 3️⃣ Merge actual + forecast
     lifecycle = combine_all_lifecycle_amount(actual_results, forecast_results)
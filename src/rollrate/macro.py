@@ -0,0 +1,145 @@
+# ============================================================
+#  macro.py – Macro / stress shock cho transition matrices
+#
+#  Chỉ số macro  s = Σ_i w_i · x_i   (x_i: độ lệch chuẩn hoá so với baseline,
+#                                     w_i: MACRO_INDICATORS[i]["weight"], + = xấu đi)
+#  Hệ số roll-forward  m = 1 + s (multiplicative, ≥ 0) hoặc exp(s) (exponential)
+#  Shock 1 hàng i (state transient):
+#      xác suất roll-forward (sang bucket xấu hơn / WRITEOFF) × a_i,  phần còn lại × b_i
+#      a_i = min(m, 1 / F_i),  b_i = (1 − a_i F_i) / (1 − F_i)   (F_i = tổng roll-forward)
+#  → tổng hàng vẫn = 1, hàng absorbing giữ nguyên identity.
+#  Vì P' = a ∘ (P ∘ fwd) + b ∘ (P ∘ ¬fwd) theo hàng, v @ P' = (v·a) @ P_fwd + (v·b) @ P_rest
+#  → S kịch bản chạy chung 1 trục array, không cần dựng S bộ ma trận.
+# ============================================================
+
+from __future__ import annotations
+
+import numpy as np
+from typing import Dict
+
+from src.config import ABSORBING_BASE, ADJUST_METHOD, MACRO_INDICATORS, MACRO_LAG
+
+# Thứ tự mức độ xấu: sang state đứng sau (và còn trong list) = roll-forward.
+# PREPAY / SOLDOUT là thoát trung tính, không tính roll-forward.
+ROLL_ORDER = ["DPD0", "DPD1+", "DPD30+", "DPD60+", "DPD90+", "DPD120+", "DPD180+", "WRITEOFF"]
+MACRO_METHODS = ("multiplicative", "exponential")
+
+
+def roll_forward_mask(states_from, states_to=None, absorbing=None) -> np.ndarray:
+    """fwd[i, j] = True nếu from_i → to_j là roll-forward (from_i không absorbing)."""
+    states_from = list(states_from)
+    states_to = states_from if states_to is None else list(states_to)
+    absorbing = set(ABSORBING_BASE if absorbing is None else absorbing)
+    rank = {s: r for r, s in enumerate(ROLL_ORDER)}
+    r_from = np.array([rank.get(s, -1) if s not in absorbing else len(ROLL_ORDER) for s in states_from])
+    r_to = np.array([rank.get(s, -1) for s in states_to])
+    return (r_from[:, None] >= 0) & (r_to[None, :] > r_from[:, None])
+
+
+def macro_index(values: Dict, weights: Dict | None = None) -> np.ndarray:
+    """s = Σ w_i · x_i (x_i scalar hoặc array cùng shape; chỉ số thiếu trong values → 0)."""
+    weights = {k: v["weight"] if isinstance(v, dict) else v for k, v in (weights or MACRO_INDICATORS).items()}
+    out = 0.0
+    for name, w in weights.items():
+        if name in values:
+            out = out + float(w) * np.asarray(values[name], dtype="float64")
+    return np.asarray(out, dtype="float64")
+
+
+def macro_multiplier(index, method: str | None = None) -> np.ndarray:
+    """Chỉ số macro → hệ số nhân roll-forward (≥ 0)."""
+    method = (method or ADJUST_METHOD).lower()
+    if method not in MACRO_METHODS:
+        raise ValueError(f"macro method '{method}' không hợp lệ ({', '.join(MACRO_METHODS)}).")
+    index = np.asarray(index, dtype="float64")
+    return np.exp(index) if method == "exponential" else np.maximum(1.0 + index, 0.0)
+
+
+def multiplier_from_params(macro_params: Dict) -> float:
+    """
+    macro_params của apply_macro_adjustment → hệ số m:
+        {"multiplier": 1.2}
+        {"GDP_GROWTH": -1.5, "UNEMPLOYMENT_RATE": 2.0, "weights": {...}, "method": "exponential"}
+    """
+    if "multiplier" in macro_params:
+        return float(macro_params["multiplier"])
+    values = {k: v for k, v in macro_params.items() if k not in ("weights", "method")}
+    return float(macro_multiplier(macro_index(values, macro_params.get("weights")), macro_params.get("method")))
+
+
+def roll_factors(F: np.ndarray, mult: np.ndarray) -> tuple:
+    """a, b theo hàng (F: tổng roll-forward của hàng, mult broadcast cùng F)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = np.where(F > 0, np.minimum(mult, 1.0 / F), mult)
+        b = np.where(F < 1, (1.0 - a * F) / (1.0 - F), 1.0)
+    return a, b
+
+
+def roll_split(P: np.ndarray, states, states_to=None) -> tuple:
+    """P [..., n, n] → (P_fwd, P_rest, F): phần roll-forward, phần còn lại, F = tổng roll-forward theo hàng."""
+    P = np.asarray(P, dtype="float64")
+    P_fwd = P * roll_forward_mask(states, states_to)
+    return P_fwd, P - P_fwd, P_fwd.sum(axis=-1)
+
+
+def shock_matrices(P: np.ndarray, mult, states, states_to=None) -> np.ndarray:
+    """
+    Shock roll-forward cho ma trận [..., n, n] (hệ số mult broadcast theo P.shape[:-2]),
+    chuẩn hoá lại hàng bằng phần không roll-forward.
+    """
+    P_fwd, P_rest, F = roll_split(P, states, states_to)
+    a, b = roll_factors(F, np.asarray(mult, dtype="float64")[..., None])
+    return a[..., None] * P_fwd + b[..., None] * P_rest
+
+
+def scenario_paths(scenarios, horizon: int, indicators=None) -> tuple:
+    """
+    Chuẩn hoá kịch bản → (names, X [S, horizon, n_indicator], indicators).
+
+    scenarios:
+        dict {tên: {indicator: scalar | list theo tháng forecast}} (path ngắn hơn horizon → giữ giá trị cuối)
+        hoặc ndarray [S, H, n_indicator] theo thứ tự `indicators` (mặc định MACRO_INDICATORS).
+    """
+    indicators = list(MACRO_INDICATORS if indicators is None else indicators)
+    if isinstance(scenarios, dict):
+        names = list(scenarios)
+        X = np.zeros((len(names), horizon, len(indicators)))
+        for s, name in enumerate(names):
+            for i, ind in enumerate(indicators):
+                if ind not in scenarios[name]:
+                    continue
+                path = np.atleast_1d(np.asarray(scenarios[name][ind], dtype="float64"))
+                if len(path) == 0:
+                    continue
+                idx = np.minimum(np.arange(horizon), len(path) - 1)
+                X[s, :, i] = path[idx]
+        return names, X, indicators
+
+    X = np.asarray(scenarios, dtype="float64")
+    if X.ndim != 3 or X.shape[2] != len(indicators):
+        raise ValueError(f"scenarios array phải có shape [S, H, {len(indicators)}] (indicators={indicators}).")
+    if X.shape[1] < horizon:
+        X = np.concatenate([X, np.repeat(X[:, -1:], horizon - X.shape[1], axis=1)], axis=1)
+    names = [f"S{s}" for s in range(X.shape[0])]
+    return names, X[:, :horizon], indicators
+
+
+def scenario_multipliers(
+    scenarios,
+    horizon: int,
+    weights: Dict | None = None,
+    method: str | None = None,
+    lag: int | None = None,
+) -> tuple:
+    """
+    (names, M [S, horizon]): hệ số roll-forward cho bước forecast thứ h (MOB start+h → start+h+1).
+    Bước h dùng macro tại h − lag (MACRO_LAG); h < lag → m = 1 (chưa có shock).
+    """
+    weights = weights or MACRO_INDICATORS
+    lag = MACRO_LAG if lag is None else int(lag)
+    names, X, indicators = scenario_paths(scenarios, horizon, list(weights))
+    index = macro_index({ind: X[..., i] for i, ind in enumerate(indicators)}, weights)
+    M = np.ones((len(names), horizon))
+    if horizon > lag:
+        M[:, lag:] = macro_multiplier(index[:, : horizon - lag], method)
+    return names, M
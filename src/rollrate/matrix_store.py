@@ -0,0 +1,628 @@
+# ============================================================
+#  matrix_store.py – Lưu transition matrices dạng array liền khối
+#
+#  Thay cho matrices_by_mob[product][mob][score]["P"] (DataFrame) + parent_fallback:
+#    P           [segment, mob, from, to]
+#    parent      [segment, from, to]
+#    is_fallback [segment, mob]
+#    reason      [segment, mob]
+#  segment = (product, score). Lookup O(1) qua dict index → trả ndarray view.
+#
+#  Migrate dần: store.to_nested() / as_nested() trả lại dict lồng nhau như cũ
+#  cho các module chưa chuyển sang MatrixStore.
+#
+#  FallbackIndex: bảng resolve (segment, MOB) → slot ma trận + lý do fallback,
+#  tính 1 lần theo policy fallback của từng engine (forecast / calibration /
+#  plan / allocation) → engine chỉ còn lookup số nguyên.
+#
+#  canonical_form: P = [[Q, R], [0, I]] (transient trước, absorbing sau) →
+#  mỗi bước forecast chỉ nhân phần transient (v_T @ [Q | R]), mass absorbing cộng dồn.
+# ============================================================
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from src.config import ABSORBING_BASE
+from src.rollrate.transition import STATE_SPACE, tensor_to_nested
+
+
+class MatrixStore:
+    """
+    Transition matrices theo Segment × MOB trong 1 array float64 liền khối.
+
+    Ví dụ:
+        store = compute_transition_by_mob(df, return_store=True)
+        P = store.get("A", "B", 12)                 # ndarray (n_states × n_states), view
+        P = store.get("A", "B", 12, states=BUCKETS_CANON)   # theo thứ tự state khác (copy)
+        matrices_by_mob, parent_fallback = store.to_nested()  # tương thích code cũ
+    """
+
+    def __init__(
+        self,
+        P: np.ndarray,
+        parent: np.ndarray,
+        segments: list,
+        mobs,
+        states: list | None = None,
+        present: np.ndarray | None = None,
+        is_fallback: np.ndarray | None = None,
+        reason: np.ndarray | None = None,
+        has_parent: np.ndarray | None = None,
+    ):
+        self.P = np.ascontiguousarray(P, dtype="float64")
+        self.parent = np.ascontiguousarray(parent, dtype="float64")
+        self.segments = [(str(p), str(s)) for p, s in segments]
+        self.mobs = np.asarray(mobs, dtype="int64")
+        self.states = list(STATE_SPACE if states is None else states)
+
+        shape = (len(self.segments), len(self.mobs))
+        if self.P.shape != shape + (len(self.states),) * 2:
+            raise ValueError(f"MatrixStore: P shape {self.P.shape} không khớp segments × mobs × states {shape}.")
+        self.present = np.ones(shape, dtype=bool) if present is None else np.asarray(present, dtype=bool)
+        self.is_fallback = np.zeros(shape, dtype=bool) if is_fallback is None else np.asarray(is_fallback, dtype=bool)
+        self.reason = np.full(shape, "", dtype=object) if reason is None else np.asarray(reason, dtype=object)
+        # Segment có parent thật (dict cũ có thể thiếu key trong parent_fallback)
+        self.has_parent = (
+            np.ones(len(self.segments), dtype=bool) if has_parent is None else np.asarray(has_parent, dtype=bool)
+        )
+
+        # Index maps
+        self.seg_index: Dict[Tuple[str, str], int] = {k: i for i, k in enumerate(self.segments)}
+        self.mob_index: Dict[int, int] = {int(m): j for j, m in enumerate(self.mobs)}
+        self.state_index: Dict[str, int] = {s: i for i, s in enumerate(self.states)}
+        self._nested = None
+        self._indexes: Dict[tuple, "FallbackIndex"] = {}
+
+    # ------------------------------------------------------------
+    # Khởi tạo
+    # ------------------------------------------------------------
+    @classmethod
+    def from_tensor(cls, tensor: dict) -> "MatrixStore":
+        """Từ output của transition.build_transition_tensor."""
+        return cls(
+            P=tensor["P"],
+            parent=tensor["parent"],
+            segments=tensor["segments"],
+            mobs=tensor["mobs"],
+            states=tensor["states"],
+            present=tensor["present"],
+            is_fallback=tensor["is_fallback"],
+            reason=tensor["reason"],
+        )
+
+    @classmethod
+    def from_nested(cls, matrices_by_mob: Dict, parent_fallback: Dict | None = None,
+                    states: list | None = None) -> "MatrixStore":
+        """Từ dict lồng nhau cũ (vd: đã pickle từ trước). State thiếu → 0."""
+        states = list(STATE_SPACE if states is None else states)
+        parent_fallback = parent_fallback or {}
+
+        segments = list(dict.fromkeys(
+            list(parent_fallback.keys())
+            + [(str(p), str(s)) for p, mob_dict in matrices_by_mob.items()
+               for score_dict in mob_dict.values() for s in score_dict]
+        ))
+        segments = [(str(p), str(s)) for p, s in segments]
+        mobs = sorted({int(m) for mob_dict in matrices_by_mob.values() for m in mob_dict})
+        seg_index = {k: i for i, k in enumerate(segments)}
+        mob_index = {m: j for j, m in enumerate(mobs)}
+
+        n = len(states)
+        P = np.zeros((len(segments), len(mobs), n, n))
+        parent = np.broadcast_to(np.eye(n), (len(segments), n, n)).copy()
+        present = np.zeros((len(segments), len(mobs)), dtype=bool)
+        has_parent = np.zeros(len(segments), dtype=bool)
+        is_fallback = np.zeros_like(present)
+        reason = np.full(present.shape, "", dtype=object)
+
+        def _arr(P_df):
+            return P_df.reindex(index=states, columns=states, fill_value=0.0).to_numpy(dtype="float64")
+
+        for key, P_df in parent_fallback.items():
+            parent[seg_index[(str(key[0]), str(key[1]))]] = _arr(P_df)
+            has_parent[seg_index[(str(key[0]), str(key[1]))]] = True
+        for prod, mob_dict in matrices_by_mob.items():
+            for mob, score_dict in mob_dict.items():
+                for score, entry in score_dict.items():
+                    i, j = seg_index[(str(prod), str(score))], mob_index[int(mob)]
+                    P[i, j] = _arr(entry["P"])
+                    present[i, j] = True
+                    is_fallback[i, j] = bool(entry.get("is_fallback", False))
+                    reason[i, j] = entry.get("reason", "")
+        return cls(P, parent, segments, mobs, states, present, is_fallback, reason, has_parent)
+
+    # ------------------------------------------------------------
+    # Lookup O(1)
+    # ------------------------------------------------------------
+    def _ij(self, product, score, mob):
+        i = self.seg_index.get((str(product), str(score)))
+        j = self.mob_index.get(int(mob))
+        if i is None or j is None or not self.present[i, j]:
+            return i, None
+        return i, j
+
+    def _reorder(self, arr: np.ndarray, states) -> np.ndarray:
+        """Reindex 2 trục cuối theo states (state thiếu → 0); arr có thể là 1 ma trận hoặc chồng ma trận."""
+        if states is None or list(states) == self.states:
+            return arr
+        idx = np.array([self.state_index.get(s, -1) for s in states])
+        ok = np.flatnonzero(idx >= 0)
+        out = np.zeros(arr.shape[:-2] + (len(states), len(states)))
+        out[..., ok[:, None], ok[None, :]] = arr[..., idx[ok][:, None], idx[ok][None, :]]
+        return out
+
+    def has(self, product, score, mob) -> bool:
+        """Có ma trận đúng (product, score, mob) không (kể cả ô đã fallback về parent)."""
+        return self._ij(product, score, mob)[1] is not None
+
+    def get(self, product, score, mob, states=None, use_parent: bool = True, default=None):
+        """
+        Ma trận của (product, score, mob):
+          - có ô (product, score, mob) → P[segment, mob] (view)
+          - không có, use_parent=True → parent của (product, score) (view)
+          - còn lại → default
+        states: thứ tự state mong muốn (khác self.states → trả bản copy đã reindex, state thiếu → 0).
+        """
+        i, j = self._ij(product, score, mob)
+        if j is not None:
+            return self._reorder(self.P[i, j], states)
+        if use_parent and i is not None:
+            return self._reorder(self.parent[i], states)
+        return default
+
+    def get_parent(self, product, score, states=None, default=None):
+        i = self.seg_index.get((str(product), str(score)))
+        return default if i is None else self._reorder(self.parent[i], states)
+
+    def info(self, product, score, mob) -> dict:
+        """is_fallback / reason của ô (product, score, mob)."""
+        i, j = self._ij(product, score, mob)
+        if j is None:
+            return {"is_fallback": True, "reason": "missing (product, score, mob)"}
+        return {"is_fallback": bool(self.is_fallback[i, j]), "reason": self.reason[i, j]}
+
+    def mobs_of(self, product, score) -> list[int]:
+        i = self.seg_index.get((str(product), str(score)))
+        return [] if i is None else [int(m) for m in self.mobs[self.present[i]]]
+
+    @property
+    def products(self) -> list[str]:
+        return list(dict.fromkeys(p for p, _ in self.segments))
+
+    def as_frame(self, arr: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(arr, index=self.states, columns=self.states)
+
+    def __len__(self) -> int:
+        return int(self.present.sum())
+
+    def __repr__(self) -> str:
+        return (f"MatrixStore(segments={len(self.segments)}, mobs={len(self.mobs)}, "
+                f"states={len(self.states)}, matrices={len(self)}, fallback={int(self.is_fallback.sum())})")
+
+    # ------------------------------------------------------------
+    # Adapter dict lồng nhau (tương thích code cũ)
+    # ------------------------------------------------------------
+    def to_nested(self):
+        """(matrices_by_mob, parent_fallback) như compute_transition_by_mob cũ; DataFrame là view của store."""
+        if self._nested is None:
+            self._nested = tensor_to_nested({
+                "segments": self.segments,
+                "mobs": self.mobs,
+                "states": self.states,
+                "present": self.present,
+                "P": self.P,
+                "parent": self.parent,
+                "is_fallback": self.is_fallback,
+                "reason": self.reason,
+            })
+            if not self.has_parent.all():
+                nested, parents = self._nested
+                keep = {k for k, ok in zip(self.segments, self.has_parent) if ok}
+                self._nested = (nested, {k: v for k, v in parents.items() if k in keep})
+        return self._nested
+
+
+def as_nested(matrices_by_mob, parent_fallback=None):
+    """
+    Cho phép hàm cũ nhận cả MatrixStore lẫn dict lồng nhau:
+        matrices_by_mob, parent_fallback = as_nested(matrices_by_mob, parent_fallback)
+    """
+    if isinstance(matrices_by_mob, MatrixStore):
+        nested, parents = matrices_by_mob.to_nested()
+        return nested, (parents if parent_fallback is None else parent_fallback)
+    return matrices_by_mob, parent_fallback
+
+
+# ============================================================
+# Fallback resolution index
+# ============================================================
+
+# Thứ tự fallback của từng engine (giữ đúng logic cũ của engine đó):
+#   exact          : đúng ô (product, score, mob)
+#   max_mob        : MOB lớn nhất của product (nếu score có ở MOB đó)
+#   parent         : parent_fallback[(product, score)]
+#   product_parent : parent đầu tiên cùng product (score bất kỳ)
+#   identity       : ma trận đơn vị (giữ nguyên state)
+# Không resolve được → "missing" (get() raise KeyError).
+FALLBACK_POLICIES: Dict[str, tuple] = {
+    "forecast": ("exact", "max_mob"),
+    "calibration": ("exact", "max_mob", "parent", "product_parent", "identity"),
+    "plan": ("exact", "parent", "product_parent", "identity"),
+    "allocation": ("exact", "parent", "identity"),
+}
+
+FALLBACK_REASONS = ["missing", "exact", "max_mob", "parent", "product_parent", "identity"]
+
+# Số target giữ trong cache chain_products của mỗi FallbackIndex (LRU)
+CHAIN_CACHE_SIZE = 4
+_REASON_CODE = {r: c for c, r in enumerate(FALLBACK_REASONS)}
+
+
+class FallbackIndex:
+    """
+    Bảng resolve transition matrix tính 1 lần cho 1 policy fallback.
+
+        matrices [n_slot, n_states, n_states]  = P (mọi ô) + parent (mọi segment) + identity
+        slots    [segment, mob_col]            = slot trong matrices (-1 = missing)
+        reasons  [segment, mob_col]            = mã lý do (FALLBACK_REASONS)
+
+    mob_col = mob với 0 <= mob <= MOB lớn nhất của store; MOB ngoài khoảng đó dùng
+    chung cột cuối ("beyond"). Segment không có trong store được resolve khi gặp lần đầu.
+
+    Ví dụ:
+        fidx = fallback_index(matrices_by_mob, parent_fallback, policy="calibration", states=states)
+        P = fidx.get(product, score, mob)           # ndarray, không copy
+        slots = fidx.slots_for(product, score, range(m0, m1))
+    """
+
+    def __init__(self, store: MatrixStore, policy: str = "calibration", states: list | None = None):
+        if policy not in FALLBACK_POLICIES:
+            raise ValueError(f"FallbackIndex: policy '{policy}' không hợp lệ ({list(FALLBACK_POLICIES)}).")
+        self.policy = policy
+        self.steps = FALLBACK_POLICIES[policy]
+        self.states = list(store.states if states is None else states)
+
+        n_seg, n_mob = store.present.shape
+        n = len(self.states)
+        self.n_cells = n_seg * n_mob
+        self.parent_offset = self.n_cells
+        self.identity_slot = self.n_cells + n_seg
+        self.matrices = np.concatenate([
+            store._reorder(store.P, self.states).reshape(self.n_cells, n, n),
+            store._reorder(store.parent, self.states).reshape(n_seg, n, n),
+            np.eye(n)[None],
+        ])
+        self.matrices.flags.writeable = False
+
+        self._segments = list(store.segments)
+        self._seg_index = dict(store.seg_index)
+        self._n_mob = n_mob
+        self.max_mob = int(store.mobs.max()) if n_mob else -1
+        self.beyond_col = self.max_mob + 1
+
+        # exact_slot[i, col]: slot ô đúng MOB (-1 nếu không có)
+        self._exact = np.full((n_seg, self.beyond_col + 1), -1, dtype=np.int64)
+        valid = store.mobs >= 0
+        seg_i, mob_j = np.nonzero(store.present[:, valid])
+        mob_j = np.flatnonzero(valid)[mob_j]
+        self._exact[seg_i, store.mobs[mob_j]] = seg_i * n_mob + mob_j
+
+        # MOB lớn nhất theo product (như max(matrices_by_mob[product].keys()))
+        self._product_max_j: Dict[str, int] = {}
+        for i, (prod, _score) in enumerate(self._segments):
+            js = np.flatnonzero(store.present[i])
+            if len(js):
+                self._product_max_j[prod] = max(self._product_max_j.get(prod, -1), int(js.max()))
+        # Parent đầu tiên theo product (thứ tự segments = thứ tự key parent_fallback)
+        self._product_parent: Dict[str, int] = {}
+        for i, (prod, _score) in enumerate(self._segments):
+            if store.has_parent[i]:
+                self._product_parent.setdefault(prod, i)
+        self._present = store.present
+        self._has_parent = store.has_parent
+
+        self._chains: "OrderedDict[int, np.ndarray]" = OrderedDict()  # LRU, tối đa CHAIN_CACHE_SIZE target
+        self._canonical: Dict[tuple, dict] = {}
+
+        rows = [self._resolve_row(i, prod) for i, (prod, _score) in enumerate(self._segments)]
+        width = self.beyond_col + 1
+        self.slots = np.stack([r[0] for r in rows]) if rows else np.empty((0, width), dtype=np.int64)
+        self.reasons = np.stack([r[1] for r in rows]) if rows else np.empty((0, width), dtype=np.int8)
+
+    # ------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------
+    def _resolve_row(self, i, product):
+        """slots / reasons 1 segment theo thứ tự self.steps (i=None: segment không có trong store)."""
+        width = self.beyond_col + 1
+        slots = np.full(width, -1, dtype=np.int64)
+        reasons = np.zeros(width, dtype=np.int8)
+
+        for step in self.steps:
+            todo = slots < 0
+            if not todo.any():
+                break
+            slot = -1
+            if step == "exact":
+                if i is not None:
+                    exact = self._exact[i]
+                    fill = todo & (exact >= 0)
+                    slots[fill] = exact[fill]
+                    reasons[fill] = _REASON_CODE["exact"]
+                continue
+            if step == "max_mob":
+                j = self._product_max_j.get(product)
+                if i is not None and j is not None and self._present[i, j]:
+                    slot = i * self._n_mob + j
+            elif step == "parent":
+                if i is not None and self._has_parent[i]:
+                    slot = self.parent_offset + i
+            elif step == "product_parent":
+                k = self._product_parent.get(product)
+                if k is not None:
+                    slot = self.parent_offset + k
+            elif step == "identity":
+                slot = self.identity_slot
+            if slot >= 0:
+                slots[todo] = slot
+                reasons[todo] = _REASON_CODE[step]
+        return slots, reasons
+
+    def _row(self, product, score) -> int:
+        key = (str(product), str(score))
+        i = self._seg_index.get(key)
+        if i is None:
+            # Segment chưa có matrix → resolve 1 lần, nối thêm vào bảng
+            slots, reasons = self._resolve_row(None, key[0])
+            i = len(self._segments)
+            self._segments.append(key)
+            self._seg_index[key] = i
+            self.slots = np.vstack([self.slots, slots[None]])
+            self.reasons = np.vstack([self.reasons, reasons[None]])
+        return i
+
+    def _col(self, mob) -> int:
+        mob = int(mob)
+        return mob if 0 <= mob <= self.max_mob else self.beyond_col
+
+    # ------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------
+    def slot(self, product, score, mob) -> int:
+        """Slot trong self.matrices (-1 = không resolve được)."""
+        i = self._row(product, score)
+        return int(self.slots[i, self._col(mob)])
+
+    def rows(self, segments) -> np.ndarray:
+        """Hàng trong self.slots cho list (product, score) (segment lạ được resolve và nối thêm)."""
+        return np.array([self._row(p, s) for p, s in segments], dtype=np.int64)
+
+    def slots_for(self, product, score, mobs) -> np.ndarray:
+        """Slot cho 1 dãy MOB của cùng segment (vd range(start_mob, max_mob))."""
+        mobs = np.asarray(list(mobs) if not isinstance(mobs, np.ndarray) else mobs, dtype=np.int64)
+        cols = np.where((mobs >= 0) & (mobs <= self.max_mob), mobs, self.beyond_col)
+        i = self._row(product, score)
+        return self.slots[i, cols]
+
+    def get(self, product, score, mob) -> np.ndarray:
+        """Ma trận đã resolve (view read-only vào self.matrices); không có → KeyError."""
+        s = self.slot(product, score, mob)
+        if s < 0:
+            raise KeyError(
+                f"Không có transition matrix cho (product={product}, score={score}, mob={mob}) "
+                f"theo policy '{self.policy}'."
+            )
+        return self.matrices[s]
+
+    def slot_segment(self, slot: int):
+        """(product, score) sở hữu slot (ô P hoặc parent); identity / missing → None."""
+        slot = int(slot)
+        if 0 <= slot < self.n_cells:
+            return self._segments[slot // self._n_mob]
+        if self.parent_offset <= slot < self.identity_slot:
+            return self._segments[slot - self.parent_offset]
+        return None
+
+    def reason(self, product, score, mob) -> str:
+        i = self._row(product, score)
+        return FALLBACK_REASONS[int(self.reasons[i, self._col(mob)])]
+
+    # ------------------------------------------------------------
+    # Tích ma trận m → target (cache LRU theo target)
+    # ------------------------------------------------------------
+    def chain_products(self, target: int) -> np.ndarray:
+        """
+        C[row, m] = P(m) · P(m+1) · … · P(target-1) cho mọi segment và mọi m = 0..target
+        (C[:, target] = I). Build ngược từ target: C[m] = P(m) · C[m+1] → target phép matmul
+        theo lô trên mọi segment. MOB không resolve được → NaN.
+        Giữ CHAIN_CACHE_SIZE target dùng gần nhất (mỗi chain [segment, target+1, n, n]).
+        """
+        target = int(target)
+        chain = self._chains.get(target)
+        if chain is not None and chain.shape[0] == len(self.slots):
+            self._chains.move_to_end(target)
+            return chain
+
+        n = len(self.states)
+        n_rows = len(self.slots)
+        mats = np.concatenate([self.matrices, np.full((1, n, n), np.nan)])  # slot -1 → NaN
+        chain = np.empty((n_rows, target + 1, n, n))
+        chain[:, target] = np.eye(n)
+        for m in range(target - 1, -1, -1):
+            chain[:, m] = mats[self.slots[:, self._col(m)]] @ chain[:, m + 1]
+        chain.flags.writeable = False
+        self._chains[target] = chain
+        self._chains.move_to_end(target)
+        while len(self._chains) > CHAIN_CACHE_SIZE:
+            self._chains.popitem(last=False)
+        return chain
+
+    def transition(self, product, score, mob_from, mob_to) -> np.ndarray:
+        """
+        Ma trận chuyển mob_from → mob_to (= P(mob_from) · … · P(mob_to-1)), O(1) sau lần build
+        đầu tiên của mob_to. mob_from >= mob_to → I. Có MOB không resolve được → KeyError.
+        """
+        mob_from, mob_to = int(mob_from), int(mob_to)
+        if mob_from >= mob_to:
+            return np.eye(len(self.states))
+        if mob_from < 0:
+            out = np.eye(len(self.states))
+            for slot in self.slots_for(product, score, range(mob_from, mob_to)):
+                if slot < 0:
+                    raise KeyError(f"Không có transition matrix cho ({product}, {score}) theo policy '{self.policy}'.")
+                out = out @ self.matrices[slot]
+            return out
+        i = self._row(product, score)
+        out = self.chain_products(mob_to)[i, mob_from]
+        if np.isnan(out[0, 0]):
+            raise KeyError(
+                f"Không có transition matrix cho (product={product}, score={score}, "
+                f"mob {mob_from}→{mob_to}) theo policy '{self.policy}'."
+            )
+        return out
+
+    def canonical(self, absorbing=None) -> dict:
+        """canonical_form(self.matrices) (cache theo tập absorbing)."""
+        key = tuple(ABSORBING_BASE if absorbing is None else absorbing)
+        if key not in self._canonical:
+            self._canonical[key] = canonical_form(self.matrices, self.states, key)
+        return self._canonical[key]
+
+    def table(self, max_mob: int | None = None) -> pd.DataFrame:
+        """Bảng resolve dạng long: product, score, mob, slot, reason (để audit fallback)."""
+        max_mob = self.max_mob if max_mob is None else int(max_mob)
+        mobs = np.arange(max_mob + 1)
+        cols = np.minimum(mobs, self.beyond_col)
+        n_seg = len(self._segments)
+        return pd.DataFrame({
+            "product": np.repeat([p for p, _ in self._segments], len(mobs)),
+            "score": np.repeat([s for _, s in self._segments], len(mobs)),
+            "mob": np.tile(mobs, n_seg),
+            "slot": self.slots[:, cols].ravel(),
+            "reason": np.array(FALLBACK_REASONS, dtype=object)[self.reasons[:, cols].ravel()],
+        })
+
+    def __repr__(self) -> str:
+        counts = np.bincount(self.reasons.ravel(), minlength=len(FALLBACK_REASONS))
+        detail = ", ".join(f"{r}={c}" for r, c in zip(FALLBACK_REASONS, counts) if c)
+        return f"FallbackIndex(policy='{self.policy}', segments={len(self._segments)}, {detail})"
+
+
+# ============================================================
+# Dạng chính tắc của chuỗi hấp thụ (Q transient, R absorbing)
+# ============================================================
+
+def canonical_form(matrices: np.ndarray, states, absorbing=None, atol: float = 0.0) -> dict:
+    """
+    Sắp lại ma trận [n_slot, n, n] theo thứ tự transient → absorbing:
+
+        P = | Q  R |    Q [t × t]: transient → transient
+            | 0  I |    R [t × a]: transient → absorbing
+
+    Hàng absorbing là identity (_enforce_absorbing) → 1 bước chỉ cần
+        v_T' = v_T @ Q,   v_A' = v_A + v_T @ R
+    tức 1 phép (1 × t) @ (t × n) trên QR = [Q | R] thay vì (1 × n) @ (n × n).
+
+    Returns dict:
+        states, transient, absorbing : tên state
+        perm        : vị trí trong states theo thứ tự transient → absorbing
+        n_transient : t
+        QR          : [n_slot, t, n] (read-only)
+        ok          : [n_slot] hàng absorbing đúng là identity (±atol)
+        lower, upper: [n_slot] băng của Q (Q[i, j] != 0 chỉ khi -lower <= j - i <= upper)
+    """
+    states = list(states)
+    absorbing = [s for s in (ABSORBING_BASE if absorbing is None else absorbing) if s in states]
+    transient = [s for s in states if s not in absorbing]
+    T = np.array([states.index(s) for s in transient], dtype=np.int64)
+    A = np.array([states.index(s) for s in absorbing], dtype=np.int64)
+    perm = np.concatenate([T, A])
+    t = len(T)
+
+    QR = np.ascontiguousarray(matrices[:, T][:, :, perm])
+    QR.flags.writeable = False
+    ok = (np.abs(matrices[:, A] - np.eye(len(states))[A]) <= atol).all(axis=(1, 2))
+
+    offset = np.arange(t)[None, :] - np.arange(t)[:, None]     # j - i
+    nz = QR[:, :, :t] != 0
+    upper = np.maximum(np.where(nz, offset, 0).max(axis=(1, 2), initial=0), 0)
+    lower = np.maximum(np.where(nz, -offset, 0).max(axis=(1, 2), initial=0), 0)
+    return {
+        "states": states,
+        "transient": transient,
+        "absorbing": absorbing,
+        "perm": perm,
+        "n_transient": t,
+        "QR": QR,
+        "ok": ok,
+        "lower": lower,
+        "upper": upper,
+    }
+
+
+def banded_diagonals(Q: np.ndarray, lower: int, upper: int) -> tuple:
+    """
+    Q [k, t, t] → (offsets, D [k, n_diag, t]) với D[:, d, i] = Q[:, i, i + offsets[d]]
+    (ngoài ma trận = 0). Chỉ giữ lower + upper + 1 đường chéo.
+    """
+    t = Q.shape[-1]
+    offsets = np.arange(-int(lower), int(upper) + 1)
+    i = np.arange(t)
+    j = i[None, :] + offsets[:, None]                          # [n_diag, t]
+    valid = (j >= 0) & (j < t)
+    D = np.where(valid, Q[:, i[None, :], np.clip(j, 0, t - 1)], 0.0)
+    return offsets, D
+
+
+def canonical_step(v: np.ndarray, QR: np.ndarray, n_transient: int, band: tuple | None = None) -> np.ndarray:
+    """
+    1 bước chuỗi hấp thụ cho lô vector (thứ tự canonical): v [k, n], QR [k, t, n] đã gom theo slot.
+    band = (offsets, D [k, n_diag, t]) → phần Q nhân theo đường chéo, R vẫn dense.
+    """
+    t = n_transient
+    vT = v[:, None, :t]
+    out = np.empty_like(v)
+    if band is None:
+        flow = (vT @ QR)[:, 0]
+        out[:, :t] = flow[:, :t]
+        out[:, t:] = v[:, t:] + flow[:, t:]
+        return out
+
+    offsets, D = band
+    out[:, t:] = v[:, t:] + (vT @ QR[:, :, t:])[:, 0]
+    prod = v[:, None, :t] * D                                  # [k, n_diag, t] theo hàng i
+    out[:, :t] = 0.0
+    for d_i, d in enumerate(offsets):
+        lo, hi = max(-d, 0), t - max(d, 0)                     # i hợp lệ → j = i + d
+        out[:, lo + d:hi + d] += prod[:, d_i, lo:hi]
+    return out
+
+
+def fallback_index(
+    matrices_by_mob,
+    parent_fallback: Dict | None = None,
+    policy: str = "calibration",
+    states: list | None = None,
+) -> FallbackIndex:
+    """
+    FallbackIndex cho MatrixStore hoặc dict lồng nhau (+ parent_fallback).
+        MatrixStore    → index gắn vào store (store._indexes), gọi lại cùng policy / states dùng lại
+        dict lồng nhau → dựng mới mỗi lần gọi: hàm dùng nhiều lần nên dựng 1 lần rồi truyền
+                         FallbackIndex xuống (FallbackIndex truyền vào được trả về nguyên trạng)
+    """
+    if isinstance(matrices_by_mob, FallbackIndex):
+        return matrices_by_mob
+    states_key = None if states is None else tuple(states)
+
+    if isinstance(matrices_by_mob, MatrixStore):
+        store = matrices_by_mob
+        key = (policy, states_key)
+        if key not in store._indexes:
+            store._indexes[key] = FallbackIndex(store, policy, states)
+        return store._indexes[key]
+
+    return FallbackIndex(MatrixStore.from_nested(matrices_by_mob, parent_fallback), policy, states)
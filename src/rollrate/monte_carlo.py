@@ -0,0 +1,246 @@
+# ============================================================
+#  monte_carlo.py – Monte Carlo theo loan cho phân phối tổn thất
+#
+#  Forecast engine chỉ cho EAD kỳ vọng theo state. Ở đây mỗi loan (snapshot cutoff
+#  mới nhất) đi N path ngẫu nhiên qua chuỗi matrices_by_mob tới max_mob:
+#      state_{t+1} = số cột j có cumsum(P[slot, state_t])_j ≤ u,   u ~ U(0, 1)
+#  EAD của loan giữ nguyên (như forecast engine chuyển mass EAD) → trung bình các path
+#  hội tụ về forecast_cohorts_batched; phân phối quanh nó cho quantile / VaR.
+#
+#  Chạy theo task (khối path × khối loan): bộ nhớ mỗi task ~ path_chunk × loan_chunk,
+#  mỗi task 1 SeedSequence con riêng (spawn theo thứ tự task) → kết quả chỉ phụ thuộc
+#  seed + kích thước khối, không phụ thuộc số luồng.
+# ============================================================
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from src.config import CFG, BUCKETS_CANON, BUCKETS_30P, BUCKETS_90P
+from src.rollrate.forecast import _cohort_slots, _select_cohorts
+from src.rollrate.matrix_store import FallbackIndex, as_nested, fallback_index
+
+MC_METRICS = ("DEL30", "DEL90", "WRITEOFF")
+
+
+# ============================================================
+# 1️⃣ Snapshot loan
+# ============================================================
+
+def loan_snapshot(df_raw: pd.DataFrame, cohorts: list) -> dict:
+    """
+    Loan tại cutoff mới nhất của từng cohort (cùng snapshot với forecast_cohorts_batched).
+
+    Returns:
+        dict cohort [n_loan] (index trong cohorts), state [n_loan] (index BUCKETS_CANON),
+             ead [n_loan], start_mob [n_cohort] (-1 = cohort không có dữ liệu).
+        Loan có state ngoài BUCKETS_CANON bị bỏ (forecast cũng không tính).
+    """
+    group_cols = ["PRODUCT_TYPE", "RISK_SCORE", CFG["orig_date"]]
+    cutoff_col, mob_col = CFG["cutoff"], CFG["mob"]
+
+    cohort_index = pd.MultiIndex.from_tuples(cohorts, names=group_cols)
+    row_code = cohort_index.get_indexer(pd.MultiIndex.from_frame(df_raw[group_cols]))
+    rows = df_raw.loc[row_code >= 0, [cutoff_col, mob_col, CFG["state"], CFG["ead"]]]
+    code = row_code[row_code >= 0]
+
+    is_latest = (rows[cutoff_col] == rows[cutoff_col].groupby(code).transform("max")).to_numpy()
+    latest, latest_code = rows[is_latest], code[is_latest]
+
+    start_mob = np.full(len(cohorts), -1, dtype=np.int64)
+    mob_max = latest[mob_col].groupby(latest_code).max()
+    start_mob[mob_max.index.to_numpy()] = mob_max.to_numpy().astype(np.int64)
+
+    state = pd.Index(BUCKETS_CANON).get_indexer(latest[CFG["state"]].astype(str))
+    ok = state >= 0
+    return {
+        "cohort": latest_code[ok],
+        "state": state[ok].astype(np.int8),
+        "ead": latest[CFG["ead"]].to_numpy(dtype="float64")[ok],
+        "start_mob": start_mob,
+    }
+
+
+# ============================================================
+# 2️⃣ Mô phỏng 1 task (khối path × khối loan)
+# ============================================================
+
+def _simulate_task(seed_seq, n_paths, cohort, state, ead, start, slots, cum, max_mob, metric_idx, n_cohort):
+    """
+    Returns [n_paths, n_cohort, n_metric]: Σ EAD loan ở nhóm state của metric tại max_mob.
+    Loan của task sort theo (start_mob, cohort) → loan đang chạy ở MOB m là 1 đoạn đầu.
+    cohort / start / slots đã lọc theo loan của task (slots: [n_loan, mob]).
+    """
+    rng = np.random.default_rng(seed_seq)
+    n_states = cum.shape[-1]
+    cum_rows = cum.reshape(-1, n_states)[:, :-1]                     # [slot·state, n − 1]
+    cur = np.repeat(state[:, None], n_paths, axis=1)                 # [loan, path]
+
+    for m in range(int(start[0]), int(max_mob)):
+        n_act = int(np.searchsorted(start, m, side="right"))
+        # Hàng absorbing là identity → mẫu rơi đúng lại state cũ, không cần lọc riêng
+        row = slots[:n_act, m, None].astype(np.int64) * n_states + cur[:n_act]
+        u = rng.random(row.shape)
+        thresholds = np.take(cum_rows, row.ravel(), axis=0)
+        cur[:n_act] = (u.reshape(-1, 1) >= thresholds).sum(axis=1, dtype=np.int8).reshape(row.shape)
+
+    # Σ EAD theo cohort (loan liền nhau theo cohort) cho từng metric
+    starts = np.flatnonzero(np.r_[True, cohort[1:] != cohort[:-1]])
+    out = np.zeros((n_paths, n_cohort, len(metric_idx)))
+    for k, idx in enumerate(metric_idx):
+        amt = np.isin(cur, idx) * ead[:, None]
+        out[:, cohort[starts], k] = np.add.reduceat(amt, starts, axis=0).T
+    return out
+
+
+# ============================================================
+# 3️⃣ Monte Carlo toàn portfolio
+# ============================================================
+
+def simulate_loss_paths(
+    df_raw: pd.DataFrame,
+    matrices_by_mob: Dict,
+    max_mob: int = 29,
+    n_paths: int = 1000,
+    seed: int | None = 42,
+    path_chunk: int = 200,
+    loan_chunk: int = 2500,
+    n_jobs: int | None = None,
+    cohorts: list | None = None,
+    fallback_idx: FallbackIndex | None = None,
+) -> dict:
+    """
+    Mô phỏng N path cho từng loan (snapshot cutoff mới nhất) tới max_mob.
+
+    Args:
+        n_paths   : số path N (mỗi loan).
+        seed      : seed gốc của SeedSequence (tái lập được).
+        path_chunk, loan_chunk : kích thước 1 task (giới hạn RAM: ~ path_chunk × loan_chunk state / task).
+        n_jobs    : số luồng (None → os.cpu_count()); không ảnh hưởng kết quả.
+        cohorts / fallback_idx : như forecast_cohorts_batched.
+
+    Returns:
+        dict:
+            keys      : list (product, score, vintage) mô phỏng được
+            start_mob : ndarray [n_cohort]
+            metrics   : MC_METRICS (DEL30 = Σ EAD BUCKETS_30P, DEL90 = BUCKETS_90P, WRITEOFF)
+            amounts   : ndarray [N, n_cohort, n_metric] – số tiền tại max_mob theo path
+            portfolio : ndarray [N, n_metric] – tổng các cohort theo path
+            ead       : ndarray [n_cohort] – EAD snapshot (mẫu số cho tỷ lệ)
+            n_loans   : số loan mô phỏng
+            skipped   : {key: lỗi} – cohort không mô phỏng được
+    """
+    if fallback_idx is None:
+        fallback_idx = fallback_index(matrices_by_mob, policy="forecast", states=BUCKETS_CANON)
+    if cohorts is None:
+        cohorts = _select_cohorts(df_raw, as_nested(matrices_by_mob)[0])
+    if not cohorts:
+        raise ValueError("Không có cohort nào để mô phỏng.")
+
+    snap = loan_snapshot(df_raw, cohorts)
+    keep, _mobs, slots, _steps, skipped = _cohort_slots(fallback_idx, cohorts, snap["start_mob"], max_mob)
+    if len(keep) == 0:
+        raise ValueError("Không có cohort nào mô phỏng được (xem skipped của forecast_cohorts_batched).")
+
+    # Cohort giữ lại → đánh lại index 0..n_cohort-1, bỏ loan của cohort lỗi
+    remap = np.full(len(cohorts), -1, dtype=np.int64)
+    remap[keep] = np.arange(len(keep))
+    loan_cohort = remap[snap["cohort"]]
+    ok = loan_cohort >= 0
+    loan_cohort, loan_state, loan_ead = loan_cohort[ok], snap["state"][ok], snap["ead"][ok]
+    start_mob, slots = snap["start_mob"][keep], slots[keep]
+    n_cohort, n_loans = len(keep), len(loan_cohort)
+    # Sort loan theo (start_mob, cohort): loan đang chạy là đoạn đầu, cohort vẫn liền nhau
+    order = np.lexsort((loan_cohort, start_mob[loan_cohort]))
+    loan_cohort, loan_state, loan_ead = loan_cohort[order], loan_state[order], loan_ead[order]
+
+    cum = np.cumsum(fallback_idx.matrices, axis=-1)
+    states = list(BUCKETS_CANON)
+    metric_idx = [
+        np.array([states.index(s) for s in group if s in states])
+        for group in (BUCKETS_30P, BUCKETS_90P, ["WRITEOFF"])
+    ]
+
+    # Task: khối path × khối loan, mỗi task 1 SeedSequence con (thứ tự cố định)
+    path_blocks = [(p0, min(path_chunk, n_paths - p0)) for p0 in range(0, n_paths, path_chunk)]
+    loan_blocks = [slice(l0, min(l0 + loan_chunk, n_loans)) for l0 in range(0, n_loans, loan_chunk)]
+    children = np.random.SeedSequence(seed).spawn(len(path_blocks) * len(loan_blocks))
+    tasks = [(p, l) for p in range(len(path_blocks)) for l in range(len(loan_blocks))]
+
+    def _run(t):
+        p, l = tasks[t]
+        sl = loan_blocks[l]
+        c = loan_cohort[sl]
+        return _simulate_task(
+            children[t], path_blocks[p][1], c, loan_state[sl], loan_ead[sl],
+            start_mob[c], slots[c], cum, max_mob, metric_idx, n_cohort,
+        )
+
+    amounts = np.zeros((n_paths, n_cohort, len(MC_METRICS)))
+    workers = n_jobs or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        # map giữ thứ tự task → cộng dồn cùng thứ tự dù chạy bao nhiêu luồng
+        for t, res in enumerate(ex.map(_run, range(len(tasks)))):
+            p0, n_p = path_blocks[tasks[t][0]]
+            amounts[p0:p0 + n_p] += res
+
+    print(f"✅ Monte Carlo {n_paths:,} path × {n_loans:,} loans ({n_cohort} cohort, {len(tasks)} task, {workers} luồng)")
+    return {
+        "keys": [cohorts[c] for c in keep],
+        "start_mob": start_mob,
+        "metrics": list(MC_METRICS),
+        "amounts": amounts,
+        "portfolio": amounts.sum(axis=1),
+        "ead": np.bincount(loan_cohort, weights=loan_ead, minlength=n_cohort),
+        "n_loans": n_loans,
+        "skipped": skipped,
+    }
+
+
+# ============================================================
+# 4️⃣ Phân phối: quantile / VaR / expected shortfall
+# ============================================================
+
+def loss_distribution(sim: dict, q=(0.5, 0.95, 0.99, 0.999), by_cohort: bool = True) -> pd.DataFrame:
+    """
+    Thống kê phân phối số tiền DEL30 / DEL90 / WRITEOFF tại max_mob.
+    Cột: PRODUCT_TYPE, RISK_SCORE, VINTAGE_DATE (PORTFOLIO → "ALL"), METRIC, EAD, MEAN, STD,
+         Q<q> (vd Q50, Q99, Q99.9), ES<q> (trung bình đuôi ≥ quantile), VAR<q> (= Q − MEAN).
+    """
+    def _label(qq):
+        pct = qq * 100
+        return f"{pct:g}" if pct != int(pct) else f"{int(pct):02d}"
+
+    def _stats(x, ead):
+        # x: [N, k] → dict cột [k]
+        qs = np.quantile(x, q, axis=0)
+        mean = x.mean(axis=0)
+        out = {"EAD": ead, "MEAN": mean, "STD": x.std(axis=0, ddof=1) if len(x) > 1 else np.zeros_like(mean)}
+        for qq, v in zip(q, qs):
+            tail = np.where(x >= v[None, :], x, np.nan)
+            out[f"Q{_label(qq)}"] = v
+            out[f"ES{_label(qq)}"] = np.nanmean(tail, axis=0)
+            out[f"VAR{_label(qq)}"] = v - mean
+        return out
+
+    frames = []
+    metrics = sim["metrics"]
+    if by_cohort and len(sim["keys"]):
+        keys = pd.DataFrame(sim["keys"], columns=["PRODUCT_TYPE", "RISK_SCORE", "VINTAGE_DATE"])
+        for k, metric in enumerate(metrics):
+            f = keys.copy()
+            f["METRIC"] = metric
+            for col, v in _stats(sim["amounts"][:, :, k], sim["ead"]).items():
+                f[col] = v
+            frames.append(f)
+    port = _stats(sim["portfolio"], np.full(len(metrics), sim["ead"].sum()))
+    f = pd.DataFrame({"PRODUCT_TYPE": "ALL", "RISK_SCORE": "ALL", "VINTAGE_DATE": "ALL", "METRIC": metrics})
+    for col, v in port.items():
+        f[col] = v
+    frames.append(f)
+    return pd.concat(frames, ignore_index=True)
@@ -11,11 +11,11 @@ import numpy as np
 # --- Transition & Forecast Engines ---
 from src.rollrate.transition import compute_transition_by_mob
 from src.rollrate.forecast import forecast_all_vintages
+from src.rollrate.forecast_cube import ForecastCube
 from src.rollrate.forecast_plan import forecast_sale_plan_by_mob
 
 # --- Lifecycle ---
 from src.rollrate.lifecycle import (
-    get_actual_all_vintages_amount,
     combine_all_lifecycle_amount,
     lifecycle_to_long_df_amount,
     tag_forecast_rows_amount,
@@ -70,6 +70,7 @@ def run_full_pipeline(
         matrices_by_mob=matrices_by_mob,
         max_mob=max_mob,
         enable_macro=False,
+        as_cube=True,
     )
 
 
@@ -89,9 +90,9 @@ def run_full_pipeline(
     print("\n======================")
     print("4) BUILD LIFECYCLE ACTUAL + FORECAST")
     print("======================")
-    actual_results = get_actual_all_vintages_amount(df_raw)
-    lifecycle_dict = combine_all_lifecycle_amount(actual_results, forecast_results)
-    df_lifecycle = lifecycle_to_long_df_amount(lifecycle_dict)
+    actual_results = ForecastCube.from_actual(df_raw)
+    lifecycle_cube = combine_all_lifecycle_amount(actual_results, forecast_results)
+    df_lifecycle = lifecycle_to_long_df_amount(lifecycle_cube)
 
 
     print("\n======================")
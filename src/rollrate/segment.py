@@ -1,39 +1,53 @@
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from src.config import CFG, OUT_ROOT, MIN_OBS  # dùng SEGMENT_MAP ở dưới nếu bạn có
-from src.rollrate.transition import compute_transition
-
-def _matrix_to_long(P: pd.DataFrame, type_label: str, segment_label: str) -> pd.DataFrame:
-    """Chuyển ma trận vuông sang long-form để lưu kèm TYPE/SEGMENT."""
-    out = P.copy()
-    out["FROM_STATE"] = out.index
-    out = out.melt(id_vars="FROM_STATE", var_name="TO_STATE", value_name="PROB")
-    out["TYPE"] = type_label
-    out["SEGMENT"] = segment_label
-    # Sắp xếp đẹp
-    return out[["SEGMENT", "TYPE", "FROM_STATE", "TO_STATE", "PROB"]]
+from src.rollrate.transition import STATE_SPACE, make_pairs, segment_transition_matrices
+
+
+def _tensor_to_long(P: np.ndarray, type_label: str, segment_labels: list) -> pd.DataFrame:
+    """
+    Chuyển ma trận [segment, from, to] sang long-form để lưu kèm TYPE/SEGMENT
+    (thứ tự dòng như melt từng ma trận: theo TO_STATE rồi FROM_STATE).
+    """
+    n_seg, n = len(segment_labels), len(STATE_SPACE)
+    return pd.DataFrame({
+        "SEGMENT": np.repeat(np.asarray(segment_labels, dtype=object), n * n),
+        "TYPE": type_label,
+        "FROM_STATE": np.tile(np.asarray(STATE_SPACE, dtype=object), n_seg * n),
+        "TO_STATE": np.tile(np.repeat(np.asarray(STATE_SPACE, dtype=object), n), n_seg),
+        "PROB": P.transpose(0, 2, 1).reshape(-1),
+    })
+
 
 def generate_all_transitions(
     df: pd.DataFrame,
     segment_map: dict[str, list] | None = None,
     by_product_file: bool = True,
+    output: str | None = "excel",
 ) -> pd.DataFrame:
     """
     Tính và lưu toàn bộ ma trận transition theo các segment đã cấu hình.
-    - CONTRACT (đếm) và AMOUNT (theo EAD)
-    - Chuẩn long-form để ghi Excel
+    - CONTRACT (đếm), AMOUNT (theo EAD) và AMOUNT_TW (EAD × time weight)
+      → mỗi segment có thêm TYPE AMOUNT_TW (lọc TYPE nếu chỉ cần CONTRACT / AMOUNT)
+    - make_pairs 1 lần cho cả df, mọi segment / loại trọng số tính trong 1 lượt bincount;
+      cặp (t → t+1) gán segment theo giá trị của dòng t (như product_t / score_t của make_pairs),
+      nên loan đổi giá trị cột segment giữa t và t+1 vẫn tính cặp đó cho segment tại t
+    - Chuẩn long-form để ghi Excel / parquet
 
     Args:
         df: dữ liệu panel có cột loan/mob/state/ead theo CFG
         segment_map: dict như {"PRODUCT_TYPE": ["A","B"], "RISK_SCORE":[1,2,3]}.
                      Nếu None, mặc định duyệt theo cột PRODUCT_TYPE đang có trong data.
-        by_product_file: True → ghi 1 file/PRODUCT_TYPE, False → ghi 1 file tổng.
+        by_product_file: (output="excel") True → 1 file/PRODUCT_TYPE, False → 1 file tổng.
+        output: "excel" (mỗi workbook mở/ghi 1 lần; workbook đã có → ghi thêm / thay sheet cùng tên,
+                giữ các sheet khác), "parquet" (1 file tổng), None → không ghi.
 
     Returns:
         DataFrame long-form gộp tất cả (SEGMENT, TYPE, FROM_STATE, TO_STATE, PROB)
     """
-    OUT_ROOT.mkdir(parents=True, exist_ok=True)
-    results = []
+    if output not in ("excel", "parquet", None):
+        raise ValueError(f"output='{output}' không hợp lệ (excel / parquet / None).")
 
     # --- xác định segment_map mặc định nếu không truyền vào
     if segment_map is None:
@@ -42,51 +56,78 @@ def generate_all_transitions(
         else:
             segment_map = {"_ALL_": ["ALL"]}
 
-    # --- vòng lặp theo từng cột segment và từng giá trị
+    # --- pairs 1 lần, index = vị trí dòng t trong df
+    pairs = make_pairs(df.reset_index(drop=True))
+    if pairs.empty:
+        return pd.DataFrame()
+    pos = pairs.index.to_numpy()
+
+    if CFG["ead"] not in df.columns:
+        print(f"⚠️ Không thấy cột EAD ({CFG['ead']}), AMOUNT dùng COUNT thay thế.")
+
+    # --- mã segment cho từng cặp, theo từng cột segment (chung 1 trục segment)
+    seg_labels, seg_files, seg_rows, seg_codes = [], [], [], []
     for seg_col, seg_vals in segment_map.items():
+        offset = len(seg_labels)
+        if seg_col == "_ALL_":
+            seg_labels.append("ALL")
+            seg_files.append("ALL")
+            seg_rows.append(len(df))
+            seg_codes.append(np.full(len(pairs), offset, dtype=np.int64))
+            continue
+
+        seg_vals = list(dict.fromkeys(seg_vals))
         for seg_val in seg_vals:
-            if seg_col == "_ALL_":
-                subset = df.copy()
-                seg_label = "ALL"
-                product_for_file = "ALL"
-            else:
-                subset = df[df[seg_col] == seg_val].copy()
-                seg_label = f"{seg_col}={seg_val}"
-                product_for_file = str(seg_val) if seg_col == "PRODUCT_TYPE" else "ALL"
-
-            if len(subset) < MIN_OBS:
-                print(f"⚠️ Bỏ qua {seg_label} (obs={len(subset)} < MIN_OBS={MIN_OBS})")
-                continue
-
-            # --- CONTRACT (đếm)
-            subset["__COUNT__"] = 1.0
-            P_count = compute_transition(subset, value_col="__COUNT__")
-            long_count = _matrix_to_long(P_count, "CONTRACT", seg_label)
-
-            # --- AMOUNT (EAD)
-            if CFG["ead"] in subset.columns:
-                P_amt = compute_transition(subset, value_col=CFG["ead"])
-            else:
-                print(f"⚠️ Không thấy cột EAD ({CFG['ead']}) trong {seg_label}, dùng COUNT thay thế.")
-                P_amt = compute_transition(subset, value_col="__COUNT__")
-            long_amt = _matrix_to_long(P_amt, "AMOUNT", seg_label)
-
-            # --- gộp hai loại
-            res = pd.concat([long_count, long_amt], ignore_index=True)
-            results.append(res)
-
-            # --- xuất Excel
-            if by_product_file:
-                out_file = OUT_ROOT / f"rollrate_{product_for_file}.xlsx"
-                sheet = seg_label[:31]  # excel limit
-            else:
-                out_file = OUT_ROOT / "rollrate_all_segments.xlsx"
-                sheet = seg_label[:31]
-
-            with pd.ExcelWriter(out_file, engine="openpyxl", mode="a" if out_file.exists() else "w") as writer:
-                # mỗi sheet ghi long-form (dễ đọc + pivot lại khi cần)
-                res.to_excel(writer, sheet_name=sheet, index=False)
+            seg_labels.append(f"{seg_col}={seg_val}")
+            seg_files.append(str(seg_val) if seg_col == "PRODUCT_TYPE" else "ALL")
+        rows = df[seg_col].value_counts()
+        seg_rows.extend(int(rows.get(v, 0)) for v in seg_vals)
+
+        local = pd.Index(seg_vals).get_indexer(df[seg_col].to_numpy()[pos])
+        seg_codes.append(np.where(local >= 0, local + offset, -1))
+
+    res = segment_transition_matrices(pairs, seg_codes, len(seg_labels))
 
-            print(f"✅ Saved matrices (CONTRACT/AMOUNT) for {seg_label} → {out_file.name}:{sheet}")
+    keep = np.array([n >= MIN_OBS for n in seg_rows], dtype=bool)
+    for label, n in zip(seg_labels, seg_rows):
+        if n < MIN_OBS:
+            print(f"⚠️ Bỏ qua {label} (obs={n} < MIN_OBS={MIN_OBS})")
+    if not keep.any():
+        return pd.DataFrame()
+
+    labels = [s for s, k in zip(seg_labels, keep) if k]
+    files = [f for f, k in zip(seg_files, keep) if k]
+    long_by_type = {
+        name: _tensor_to_long(P[keep], name, labels) for name, P in res["P"].items()
+    }
+    # Thứ tự: từng segment → CONTRACT, AMOUNT, AMOUNT_TW
+    n_cell = len(STATE_SPACE) ** 2
+    order = np.concatenate([
+        np.arange(i * n_cell, (i + 1) * n_cell) + t * len(labels) * n_cell
+        for i in range(len(labels)) for t in range(len(long_by_type))
+    ])
+    result = pd.concat(long_by_type.values(), ignore_index=True).iloc[order].reset_index(drop=True)
+
+    # --- xuất file: mỗi file ghi đúng 1 lần
+    if output is not None:
+        OUT_ROOT.mkdir(parents=True, exist_ok=True)
+    if output == "parquet":
+        out_file = OUT_ROOT / "rollrate_all_segments.parquet"
+        result.to_parquet(out_file, index=False)
+        print(f"✅ Saved matrices ({', '.join(long_by_type)}) for {len(labels)} segments → {out_file.name}")
+    elif output == "excel":
+        label_file = dict(zip(labels, files))
+        groups = result.groupby(
+            result["SEGMENT"].map(label_file) if by_product_file else pd.Series("all_segments", index=result.index),
+            sort=False,
+        )
+        for file_key, res_file in groups:
+            out_file = OUT_ROOT / f"rollrate_{file_key}.xlsx"
+            excel_mode = {"mode": "a", "if_sheet_exists": "replace"} if out_file.exists() else {"mode": "w"}
+            with pd.ExcelWriter(out_file, engine="openpyxl", **excel_mode) as writer:
+                # mỗi sheet ghi long-form (dễ đọc + pivot lại khi cần)
+                for seg_label, res_seg in res_file.groupby("SEGMENT", sort=False):
+                    res_seg.to_excel(writer, sheet_name=seg_label[:31], index=False)  # excel limit
+            print(f"✅ Saved matrices ({', '.join(long_by_type)}) for {res_file['SEGMENT'].nunique()} segments → {out_file.name}")
 
-    return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+    return result
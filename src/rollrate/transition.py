@@ -15,6 +15,7 @@ from src.config import (
     ABSORBING_BASE,  # ["PREPAY","WRITEOFF","SOLDOUT"]
     MIN_OBS,         # ngưỡng tối thiểu số cặp
     MIN_EAD,         # ngưỡng tối thiểu EAD (tổng weight)
+    parse_date_column,
 )
 
 # Optional alpha smoothing (không dùng nếu =0)
@@ -104,7 +105,46 @@ def _enforce_absorbing(P: pd.DataFrame, absorbing) -> pd.DataFrame:
 
 
 
-def make_pairs(df: pd.DataFrame) -> pd.DataFrame:
+def _cutoff_month_index(cutoff_series: pd.Series) -> np.ndarray:
+    """
+    Month index (year*12 + month - 1) của cột cutoff, NaN nếu không parse được.
+    Dùng parse_date_column (hiểu cả YYYYMM số / Int32 / string / datetime) như monthly_pair_counts.
+    """
+    month_v = parse_date_column(cutoff_series, output="month_index")
+    return pd.array(month_v).to_numpy(dtype="float64", na_value=np.nan)
+
+
+def _consecutive_pairs(loan_series: pd.Series, mob_v: np.ndarray, keep: np.ndarray):
+    """
+    Vị trí (i_t, i_t1) của các cặp dòng liên tiếp cùng loan có MOB tăng đúng 1,
+    trong các dòng keep. Sort 1 lần theo (mã loan, MOB) bằng np.lexsort (stable).
+    """
+    loan_codes = pd.factorize(loan_series, sort=True)[0]  # NaN → -1 (không ghép cặp, như groupby)
+    pos = np.flatnonzero(keep)
+    pos = pos[np.lexsort((mob_v[pos], loan_codes[pos]))]
+
+    lc = loan_codes[pos]
+    mv = mob_v[pos]
+    valid = (lc[:-1] == lc[1:]) & (lc[:-1] >= 0) & (mv[1:] - mv[:-1] == 1)
+    return pos[:-1][valid], pos[1:][valid]
+
+
+def make_pairs(df: pd.DataFrame, compact: bool = False) -> pd.DataFrame:
+    """
+    Tạo cặp (t → t+1) theo loan: MOB liên tiếp (mob_t1 = mob_t + 1), lọc ROLL_WINDOW
+    và gắn trọng số thời gian (exp/linear) × EAD.
+
+    Vectorized: sort 1 lần theo (mã loan, MOB) bằng np.lexsort, dòng kế tiếp lấy bằng
+    shift mảng + mask cùng loan → không copy toàn bộ df, không groupby().shift().
+
+    Args:
+        compact: True → mob int16, state/product/score dạng category, weight float32
+                 (tiết kiệm RAM với panel 10M+ dòng). Mặc định giữ dtype như cũ.
+
+    Returns:
+        DataFrame [loan, mob_t, mob_t1, state_t, state_t1, ead_raw, time_weight, ead_t,
+        product_t, score_t], index = index gốc của dòng t.
+    """
     loan   = CFG["loan"]
     mob    = CFG["mob"]
     state  = CFG["state"]
@@ -118,65 +158,69 @@ def make_pairs(df: pd.DataFrame) -> pd.DataFrame:
     product_col = "PRODUCT_TYPE" if "PRODUCT_TYPE" in df.columns else None
     score_col   = "RISK_SCORE"   if "RISK_SCORE" in df.columns else None
 
-    # Chuẩn hoá
-    work = df.copy()
-    work[mob]    = _safe_int_series(work[mob])
-    work[cutoff] = pd.to_datetime(work[cutoff], errors="coerce")
-    work = work.dropna(subset=[mob, state, cutoff])
-    work = work.sort_values([loan, mob])
-
-    # ====== WHA PREP ======
-    month_idx = work[cutoff].dt.to_period("M").astype(int)
-    max_idx   = month_idx.max()
-    age_raw   = max_idx - month_idx
+    # Chuẩn hoá (chỉ trên mảng cột cần dùng)
+    mob_v = pd.to_numeric(df[mob], errors="coerce").to_numpy(dtype="float64", na_value=np.nan).round(0)
+    month_idx = _cutoff_month_index(df[cutoff])
+    keep = ~np.isnan(mob_v) & ~np.isnan(month_idx) & df[state].notna().to_numpy()
 
     # ====== ❗ LỌC THEO ROLL_WINDOW ======
-    mask = age_raw <= ROLL_WINDOW
-    work = work[mask].copy()
-    age  = age_raw[mask].clip(0, ROLL_WINDOW)
+    if keep.any():
+        age_raw = month_idx[keep].max() - month_idx
+        keep &= age_raw <= ROLL_WINDOW
+
+    # ====== SORT 1 LẦN + SHIFT MẢNG ======
+    i_t, i_t1 = _consecutive_pairs(df[loan], mob_v, keep)
+
+    if len(i_t) == 0:
+        print("⚠️ make_pairs(): Không có cặp hợp lệ.")
+        return pd.DataFrame()
 
     # ====== TIME WEIGHT ======
+    age = np.clip(age_raw[i_t], 0, ROLL_WINDOW)
     if WEIGHT_METHOD == "exp":
         time_w = (DECAY_LAMBDA ** age).astype(float)
     elif WEIGHT_METHOD == "linear":
-        time_w = (1 - age/ROLL_WINDOW).clip(0)
+        time_w = np.clip(1 - age / ROLL_WINDOW, 0, None)
     else:
-        time_w = pd.Series(1.0, index=work.index)
+        time_w = np.ones(len(i_t))
 
     # EAD WEIGHT
-    if eadcol and eadcol in work.columns:
-        ead_raw = pd.to_numeric(work[eadcol], errors="coerce").fillna(0.0)
+    if eadcol and eadcol in df.columns:
+        ead_raw = pd.to_numeric(pd.Series(df[eadcol].array.take(i_t)), errors="coerce").fillna(0.0)
     else:
-        ead_raw = pd.Series(1.0, index=work.index)
-
-    work["ead_raw"] = ead_raw
-    work["time_weight"] = time_w
-    work["ead_t"] = ead_raw * time_w
-
-    # ====== TẠO PAIRS ======
-    mob_next = work.groupby(loan)[mob].shift(-1)
-    st_t     = work.groupby(loan)[state].shift(0)
-    st_t1    = work.groupby(loan)[state].shift(-1)
-
-    valid = (mob_next - work[mob] == 1)
-    pairs = work[valid].copy()
-
-    if pairs.empty:
-        print("⚠️ make_pairs(): Không có cặp hợp lệ.")
-        return pd.DataFrame()
-
-    pairs["mob_t"] = work.loc[pairs.index, mob].astype(int)
-    pairs["mob_t1"] = mob_next.loc[pairs.index].astype(int)
-    pairs["state_t"] = st_t.loc[pairs.index]
-    pairs["state_t1"] = st_t1.loc[pairs.index]
+        ead_raw = pd.Series(1.0, index=range(len(i_t)))
+    ead_raw = ead_raw.to_numpy()
+    ead_t = ead_raw * time_w
+
+    pairs = pd.DataFrame(
+        {
+            loan: df[loan].array.take(i_t),
+            "mob_t": mob_v[i_t].astype(int),
+            "mob_t1": mob_v[i_t1].astype(int),
+            "state_t": df[state].array.take(i_t),
+            "state_t1": df[state].array.take(i_t1),
+            "ead_raw": ead_raw,
+            "time_weight": time_w,
+            "ead_t": ead_t,
+        },
+        index=df.index[i_t],
+    )
+    pairs["product_t"] = df[product_col].array.take(i_t) if product_col else "ALL"
+    pairs["score_t"]   = df[score_col].array.take(i_t)   if score_col   else "ALL"
 
-    pairs["product_t"] = work[product_col].loc[pairs.index] if product_col else "ALL"
-    pairs["score_t"]   = work[score_col].loc[pairs.index]   if score_col   else "ALL"
+    if compact:
+        pairs["mob_t"] = pairs["mob_t"].astype("int16")
+        pairs["mob_t1"] = pairs["mob_t1"].astype("int16")
+        states = pd.concat([pairs["state_t"], pairs["state_t1"]]).astype(str).unique()
+        state_cats = list(dict.fromkeys(STATE_SPACE + sorted(set(states) - set(STATE_SPACE))))
+        for col in ["state_t", "state_t1"]:
+            pairs[col] = pd.Categorical(pairs[col].astype(str), categories=state_cats)
+        for col in ["product_t", "score_t"]:
+            pairs[col] = pairs[col].astype("category")
+        for col in ["ead_raw", "time_weight", "ead_t"]:
+            pairs[col] = pairs[col].astype("float32")
 
-    return pairs[
-        [loan, "mob_t", "mob_t1", "state_t", "state_t1",
-         "ead_raw", "time_weight", "ead_t", "product_t", "score_t"]
-    ]
+    return pairs
 
 
 # ============================================================
@@ -246,11 +290,293 @@ def compute_transition_from_pairs(
 
 
 # ============================================================
-# 3️⃣ compute_transition_by_mob – Product × MOB × Score
+# 3️⃣ build_transition_tensor – 1 pass cho mọi Segment × MOB
+# ============================================================
+
+def _state_codes(values) -> np.ndarray:
+    """Mã vị trí trong STATE_SPACE (-1 nếu ngoài STATE_SPACE / NaN)."""
+    return pd.Categorical(values, categories=STATE_SPACE).codes.astype(np.int64)
+
+
+def _normalize_tensor(counts: np.ndarray) -> np.ndarray:
+    """Chuẩn hoá theo hàng (trục cuối), hàng tổng 0 → 0."""
+    rs = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        P = np.where(rs != 0, counts / rs, 0.0)
+    return P
+
+
+def _finalize_tensor(P: np.ndarray, zero_rows: np.ndarray, fill: np.ndarray) -> np.ndarray:
+    """
+    Vectorized của _backfill_zero_rows + _enforce_absorbing + check tổng hàng:
+    - hàng tổng weight = 0 → lấy hàng tương ứng của fill (parent / identity)
+    - absorbing → identity
+    - hàng không cộng về 1 → normalize lại
+    """
+    P = np.where(zero_rows[..., None], fill, P)
+    abs_idx = [STATE_SPACE.index(st) for st in ABSORBING_BASE if st in STATE_SPACE]
+    if abs_idx:
+        P[..., abs_idx, :] = 0.0
+        P[..., abs_idx, abs_idx] = 1.0
+    bad = ~np.isclose(P.sum(axis=-1), 1.0, atol=1e-6)
+    if bad.any():
+        print(f"⚠️ {int(bad.sum())} hàng không cộng về 1 sau backfill → normalize lại.")
+        P = np.where(bad[..., None], _normalize_tensor(P), P)
+    return P
+
+
+def build_transition_tensor(pairs: pd.DataFrame, value_col: str = "ead_t") -> dict:
+    """
+    Tính toàn bộ ma trận transition Segment × MOB trong 1 lần bincount
+    (thay cho vòng lặp groupby + crosstab của từng (product, score, mob)).
+
+    Returns:
+        dict:
+            segments     : list[(product, score)]          – theo thứ tự groupby
+            mobs         : ndarray[int]                    – MOB tăng dần
+            states       : STATE_SPACE
+            counts       : [segment, mob, from, to]        – tổng weight
+            n_obs        : [segment, mob]                  – số cặp
+            total_ead    : [segment, mob]                  – tổng value_col
+            present      : [segment, mob] bool             – (segment, mob) có quan sát
+            P            : [segment, mob, from, to]        – ma trận cuối (đã fallback)
+            parent       : [segment, from, to]             – ma trận parent (không tách MOB)
+            is_fallback  : [segment, mob] bool
+            reason       : [segment, mob] object (str)
+
+    Logic giống compute_transition_by_mob:
+      - parent: hàng không có quan sát → identity, absorbing → identity.
+      - MOB: n_obs < MIN_OBS hoặc total_ead < MIN_EAD → dùng parent (is_fallback=True);
+             còn lại hàng không có quan sát → lấy hàng của parent.
+    """
+    grouper = pairs.groupby(["product_t", "score_t"], observed=True)
+    seg_code = grouper.ngroup().to_numpy()
+    segments = [(str(p), str(s)) for p, s in grouper.size().index]
+
+    mob_t = pairs["mob_t"].to_numpy()
+    mobs = np.unique(mob_t)
+    mob_code = np.searchsorted(mobs, mob_t)
+
+    weights = pd.to_numeric(pairs[value_col], errors="coerce").fillna(0.0).to_numpy(dtype="float64")
+
+    counts, n_obs, total_ead = _bincount_cells(
+        np.zeros(len(pairs), dtype=np.int64), seg_code, mob_code,
+        _state_codes(pairs["state_t"]), _state_codes(pairs["state_t1"]),
+        weights, shape=(1, len(segments), len(mobs)),
+    )
+    return transition_tensor_from_counts(counts[0], n_obs[0], total_ead[0], segments, mobs)
+
+
+def _bincount_cells(month_code, seg_code, mob_code, s_from, s_to, weights, shape):
+    """
+    1 lần bincount cho các cặp → counts [month, segment, mob, from, to] (tổng weight, chỉ state
+    trong STATE_SPACE), n_obs / total_ead [month, segment, mob] (mọi cặp có segment).
+    """
+    n_month, n_seg, n_mob = shape
+    n_states = len(STATE_SPACE)
+
+    in_seg = seg_code >= 0
+    cell = (month_code[in_seg] * n_seg + seg_code[in_seg]) * n_mob + mob_code[in_seg]
+    n_cells = n_month * n_seg * n_mob
+    n_obs = np.bincount(cell, minlength=n_cells).reshape(shape)
+    total_ead = np.bincount(cell, weights=weights[in_seg], minlength=n_cells).reshape(shape)
+
+    ok = in_seg & (s_from >= 0) & (s_to >= 0)
+    flat = (
+        ((month_code[ok] * n_seg + seg_code[ok]) * n_mob + mob_code[ok]) * n_states + s_from[ok]
+    ) * n_states + s_to[ok]
+    counts = np.bincount(flat, weights=weights[ok], minlength=n_cells * n_states * n_states)
+    return counts.reshape(shape + (n_states, n_states)), n_obs, total_ead
+
+
+def transition_tensor_from_counts(counts, n_obs, total_ead, segments, mobs) -> dict:
+    """
+    Từ counts [segment, mob, from, to] + n_obs / total_ead [segment, mob] → tensor đầy đủ
+    (parent, P, fallback) như build_transition_tensor. Dùng chung cho build 1 lần,
+    update incremental và sweep theo tháng.
+    """
+    n_states = len(STATE_SPACE)
+    n_seg, n_mob = len(segments), len(mobs)
+    present = n_obs > 0
+
+    # ---- parent theo segment ----
+    parent_counts = counts.sum(axis=1)
+    identity = np.broadcast_to(np.eye(n_states), parent_counts.shape)
+    parent = _finalize_tensor(
+        _normalize_tensor(parent_counts), parent_counts.sum(axis=-1) == 0, identity
+    )
+
+    # ---- MOB-level, hàng trống lấy từ parent ----
+    child_zero = counts.sum(axis=-1) == 0
+    parent_b = np.broadcast_to(parent[:, None], counts.shape)
+    P = _finalize_tensor(_normalize_tensor(counts), child_zero, parent_b)
+
+    n_backfill = int((child_zero & present[..., None]).sum())
+    if n_backfill:
+        print(f"⚠️ Backfill {n_backfill} hàng (segment × MOB × state) có tổng weight = 0 từ parent.")
+
+    # ---- Fallback ----
+    insufficient = present & ((n_obs < MIN_OBS) | (total_ead < MIN_EAD))
+    all_zero = present & ~insufficient & (P.sum(axis=-1) == 0).all(axis=-1)
+    is_fallback = insufficient | all_zero
+    P = np.where(is_fallback[..., None, None], parent_b, P)
+
+    reason = np.full((n_seg, n_mob), "", dtype=object)
+    for i, j in zip(*np.nonzero(insufficient)):
+        reason[i, j] = f"insufficient data (n_obs={n_obs[i, j]}, total_ead={total_ead[i, j]:,.0f})"
+    reason[all_zero] = "no valid pairs at MOB-level (all rows = 0)"
+
+    return {
+        "segments": list(segments),
+        "mobs": np.asarray(mobs),
+        "states": list(STATE_SPACE),
+        "counts": counts,
+        "n_obs": n_obs,
+        "total_ead": total_ead,
+        "present": present,
+        "P": P,
+        "parent": parent,
+        "is_fallback": is_fallback,
+        "reason": reason,
+    }
+
+
+def monthly_pair_counts(df: pd.DataFrame) -> dict:
+    """
+    Đếm cặp (t → t+1) CHƯA gắn trọng số thời gian, tách theo tháng cutoff của dòng t:
+        counts [month, segment, mob, from, to] = Σ ead_raw
+        n_obs  [month, segment, mob]           = số cặp
+        ead    [month, segment, mob]           = Σ ead_raw (mọi state)
+    Tháng = parse_date_column(cutoff, "month_index") (year*12 + month - 1).
+    Mọi ROLL_WINDOW / WEIGHT_METHOD sau đó chỉ là tổng có trọng số theo trục month
+    (xem weight_monthly_counts).
+    """
+    loan   = CFG["loan"]
+    mob    = CFG["mob"]
+    state  = CFG["state"]
+    cutoff = CFG["cutoff"]
+    eadcol = CFG.get("ead")
+
+    mob_v = pd.to_numeric(df[mob], errors="coerce").to_numpy(dtype="float64", na_value=np.nan).round(0)
+    month_v = _cutoff_month_index(df[cutoff])
+    keep = ~np.isnan(mob_v) & ~np.isnan(month_v) & df[state].notna().to_numpy()
+
+    i_t, i_t1 = _consecutive_pairs(df[loan], mob_v, keep)
+
+    def _seg_values(col):
+        return df[col].array.take(i_t) if col in df.columns else np.full(len(i_t), "ALL", dtype=object)
+
+    seg_keys = pd.DataFrame({"product_t": _seg_values("PRODUCT_TYPE"), "score_t": _seg_values("RISK_SCORE")})
+    grouper = seg_keys.groupby(["product_t", "score_t"], observed=True)
+    seg_code = grouper.ngroup().to_numpy()
+    segments = [(str(p), str(s)) for p, s in grouper.size().index]
+
+    months, month_code = np.unique(month_v[i_t].astype(np.int64), return_inverse=True)
+    mobs, mob_code = np.unique(mob_v[i_t].astype(np.int64), return_inverse=True)
+
+    if eadcol and eadcol in df.columns:
+        ead_raw = pd.to_numeric(pd.Series(df[eadcol].array.take(i_t)), errors="coerce").fillna(0.0)
+        ead_raw = ead_raw.to_numpy(dtype="float64")
+    else:
+        ead_raw = np.ones(len(i_t))
+
+    counts, n_obs, ead = _bincount_cells(
+        month_code.ravel(), seg_code, mob_code.ravel(),
+        _state_codes(df[state].array.take(i_t)), _state_codes(df[state].array.take(i_t1)),
+        ead_raw, shape=(len(months), len(segments), len(mobs)),
+    )
+    return {
+        "months": months,
+        "segments": segments,
+        "mobs": mobs,
+        "counts": counts,
+        "n_obs": n_obs,
+        "ead": ead,
+    }
+
+
+def month_weights(
+    months,
+    last_month: int,
+    roll_window: int | None = None,
+    weight_method: str | None = None,
+    decay_lambda: float | None = None,
+):
+    """
+    Trọng số thời gian cho từng tháng (giống make_pairs): age = last_month - month,
+    exp: λ^age, linear: 1 - age/ROLL_WINDOW, khác: 1.
+
+    Returns:
+        (weights, in_window): tháng ngoài ROLL_WINDOW có weight 0 và in_window=False
+        (linear có thể cho weight 0 ngay trong window – cặp vẫn tính vào n_obs như make_pairs).
+    """
+    roll_window = CFG.get("ROLL_WINDOW", 12) if roll_window is None else roll_window
+    weight_method = CFG.get("WEIGHT_METHOD", "exp") if weight_method is None else weight_method
+    decay_lambda = CFG.get("DECAY_LAMBDA", 0.9) if decay_lambda is None else decay_lambda
+
+    age = last_month - np.asarray(months, dtype="int64")
+    in_window = (age >= 0) & (age <= roll_window)
+    age = np.clip(age, 0, roll_window)
+    if weight_method == "exp":
+        w = decay_lambda ** age.astype(float)
+    elif weight_method == "linear":
+        w = np.clip(1 - age / roll_window, 0, None)
+    else:
+        w = np.ones(len(age))
+    return np.where(in_window, w, 0.0), in_window
+
+
+def weight_monthly_counts(monthly: dict, weights: np.ndarray, in_window: np.ndarray | None = None) -> dict:
+    """
+    Gộp counts theo tháng thành tensor transition với trọng số từng tháng.
+    in_window: tháng được tính vào n_obs (mặc định: weight > 0).
+    """
+    weights = np.asarray(weights, dtype="float64")
+    in_window = weights > 0 if in_window is None else np.asarray(in_window, dtype=bool)
+    counts = np.tensordot(weights, monthly["counts"], axes=(0, 0))
+    n_obs = monthly["n_obs"][in_window].sum(axis=0)
+    total_ead = np.tensordot(weights, monthly["ead"], axes=(0, 0))
+    return transition_tensor_from_counts(counts, n_obs, total_ead, monthly["segments"], monthly["mobs"])
+
+
+def tensor_to_nested(tensor: dict):
+    """
+    View tương thích: tensor → (matrices_by_mob, parent_fallback) dạng dict lồng nhau như cũ.
+    DataFrame bọc trực tiếp lát cắt của tensor (không copy) qua view read-only → sửa tại chỗ
+    raise thay vì âm thầm ghi vào tensor dùng chung; MOB fallback dùng chung object parent.
+    """
+    states = tensor["states"]
+    matrices_by_mob: Dict[str, Dict[int, Dict[str, Dict[str, pd.DataFrame]]]] = defaultdict(
+        lambda: defaultdict(dict)
+    )
+    parent_fallback: Dict[tuple, pd.DataFrame] = {}
+
+    def _frame(arr):
+        arr = arr.view()
+        arr.flags.writeable = False  # chỉ view này, tensor gốc không đổi
+        return pd.DataFrame(arr, index=pd.Index(states, name="state_t"),
+                            columns=pd.Index(states, name="state_t1"), copy=False)
+
+    for i, (prod, score) in enumerate(tensor["segments"]):
+        parent_P = _frame(tensor["parent"][i])
+        parent_fallback[(prod, score)] = parent_P
+        for j in np.flatnonzero(tensor["present"][i]):
+            fb = bool(tensor["is_fallback"][i, j])
+            matrices_by_mob[prod][int(tensor["mobs"][j])][score] = {
+                "P": parent_P if fb else _frame(tensor["P"][i, j]),
+                "is_fallback": fb,
+                "reason": tensor["reason"][i, j],
+            }
+    return matrices_by_mob, parent_fallback
+
+
+# ============================================================
+# 4️⃣ compute_transition_by_mob – Product × MOB × Score
 # ============================================================
 
 def compute_transition_by_mob(
     df: pd.DataFrame,
+    return_store: bool = False,
 ) -> Tuple[Dict[str, Dict[int, Dict[str, Dict[str, pd.DataFrame]]]],
            Dict[tuple, pd.DataFrame]]:
     """
@@ -265,87 +591,102 @@ def compute_transition_by_mob(
 
     Logic:
       - Bước 1: make_pairs(df) → pairs.
-      - Bước 2: group theo (product_t, score_t) → tính P_parent cho từng nhóm.
-      - Bước 3: trong mỗi (product, score), group tiếp theo mob_t:
+      - Bước 2: build_transition_tensor(pairs) → parent theo (product, score) + P theo MOB
+        trong 1 lần bincount:
           + nếu n_obs < MIN_OBS hoặc EAD < MIN_EAD → dùng parent (is_fallback=True).
           + nếu tính P_child ra ma trận toàn 0 → dùng parent.
+      - Bước 3: tensor_to_nested → dict lồng nhau như cũ.
+
+    return_store=True → trả MatrixStore (array liền khối, lookup O(1)) thay cho 2 dict.
     """
     pairs = make_pairs(df)
     if pairs.empty:
         print("⚠️ compute_transition_by_mob(): không có cặp → trả về rỗng.")
         return {}, {}
 
-    matrices_by_mob: Dict[str, Dict[int, Dict[str, Dict[str, pd.DataFrame]]]] = defaultdict(
-        lambda: defaultdict(dict)
-    )
-    parent_fallback: Dict[tuple, pd.DataFrame] = {}
-
-    # ===========================
-    # 1) Parent FALLBACK theo (product, score)
-    # ===========================
-    for (prod, score), grp in pairs.groupby(["product_t", "score_t"]):
-        prod_str  = str(prod)
-        score_str = str(score)
-
-        P_parent = compute_transition_from_pairs(
-            grp,
-            value_col="ead_t",
-            parent_P=None,
-            zero_row_policy="parent",
-            alpha_smooth=0.0,
-        )
-        parent_fallback[(prod_str, score_str)] = P_parent
+    tensor = build_transition_tensor(pairs, value_col="ead_t")
+    for prod_str, score_str in tensor["segments"]:
         print(f"⚙️ Built parent fallback for (product={prod_str}, score={score_str})")
+    for i, j in zip(*np.nonzero(tensor["is_fallback"])):
+        prod_str, score_str = tensor["segments"][i]
+        print(f"⚠️ Fallback MOB={int(tensor['mobs'][j])} for (product={prod_str}, score={score_str}) "
+              f"→ {tensor['reason'][i, j]}")
+
+    if return_store:
+        from src.rollrate.matrix_store import MatrixStore
 
-    # ===========================
-    # 2) MOB-level trong từng (product, score)
-    # ===========================
-    for (prod, score), grp in pairs.groupby(["product_t", "score_t"]):
-        prod_str  = str(prod)
-        score_str = str(score)
-        parent_P  = parent_fallback[(prod_str, score_str)]
-
-        for mob in sorted(grp["mob_t"].unique()):
-            mob_int = int(mob)
-            mob_grp = grp[grp["mob_t"] == mob_int]
-
-            total_ead = mob_grp["ead_t"].sum()
-            n_obs     = len(mob_grp)
-
-            # Kiểm tra sufficiency
-            if n_obs < MIN_OBS or total_ead < MIN_EAD:
-                reason = f"insufficient data (n_obs={n_obs}, total_ead={total_ead:,.0f})"
-                print(f"⚠️ Fallback MOB={mob_int} for (product={prod_str}, score={score_str}) → {reason}")
-                matrices_by_mob[prod_str][mob_int][score_str] = {
-                    "P": parent_P,
-                    "is_fallback": True,
-                    "reason": reason,
-                }
-                continue
-
-            P_child = compute_transition_from_pairs(
-                mob_grp,
-                value_col="ead_t",
-                parent_P=parent_P,
-                zero_row_policy="parent",
-                alpha_smooth=0.0,
-            )
-
-            if (P_child.sum(axis=1) == 0).all():
-                reason = "no valid pairs at MOB-level (all rows = 0)"
-                print(f"⚠️ MOB={mob_int} (product={prod_str}, score={score_str}) → {reason}, dùng parent.")
-                matrices_by_mob[prod_str][mob_int][score_str] = {
-                    "P": parent_P,
-                    "is_fallback": True,
-                    "reason": reason,
-                }
-            else:
-                matrices_by_mob[prod_str][mob_int][score_str] = {
-                    "P": P_child,
-                    "is_fallback": False,
-                    "reason": "",
-                }
+        store = MatrixStore.from_tensor(tensor)
+        print(f"✅ Generated {store!r}")
+        return store
+
+    matrices_by_mob, parent_fallback = tensor_to_nested(tensor)
 
     total_blocks = sum(len(mob_dict) for mob_dict in matrices_by_mob.values())
     print(f"✅ Generated {total_blocks} MOB-level matrices across products (real + fallback).")
     return matrices_by_mob, parent_fallback
+
+
+# ============================================================
+# 5️⃣ segment_transition_matrices – nhiều loại trọng số trong 1 lượt
+# ============================================================
+
+# Loại ma trận → cột trọng số trong pairs (None = đếm số hợp đồng)
+MULTI_WEIGHT_TYPES = {
+    "CONTRACT": None,        # đếm cặp
+    "AMOUNT": "ead_raw",     # EAD gốc
+    "AMOUNT_TW": "ead_t",    # EAD × time weight (như compute_transition_by_mob)
+}
+
+
+def segment_transition_matrices(
+    pairs: pd.DataFrame,
+    seg_codes: list,
+    n_seg: int,
+    weight_types: dict | None = None,
+) -> dict:
+    """
+    Ma trận transition gộp mọi MOB theo segment, cho nhiều loại trọng số cùng lúc:
+    mã (segment, from, to) tính 1 lần, mỗi loại trọng số chỉ là 1 bincount trên mã đó.
+
+    Args:
+        seg_codes: list mảng mã segment (cùng độ dài pairs, -1 = không thuộc segment nào),
+                   1 mảng cho mỗi cách chia segment (vd theo PRODUCT_TYPE, theo RISK_SCORE);
+                   tất cả dùng chung trục segment [0, n_seg).
+        weight_types: {tên: cột trọng số | None}; mặc định MULTI_WEIGHT_TYPES.
+
+    Returns:
+        dict: n_pairs [segment], counts {tên: [segment, from, to]}, P {tên: [segment, from, to]}
+        (P giống compute_transition_from_pairs(parent_P=None): hàng trống → identity, absorbing → identity).
+    """
+    weight_types = MULTI_WEIGHT_TYPES if weight_types is None else weight_types
+    n_states = len(STATE_SPACE)
+    n_flat = n_seg * n_states * n_states
+
+    s_from = _state_codes(pairs["state_t"])
+    s_to = _state_codes(pairs["state_t1"])
+    valid_state = (s_from >= 0) & (s_to >= 0)
+    state_cell = s_from * n_states + s_to
+
+    weights = {
+        name: None if col is None else pd.to_numeric(pairs[col], errors="coerce").fillna(0.0).to_numpy(dtype="float64")
+        for name, col in weight_types.items()
+    }
+    counts = {name: np.zeros(n_flat) for name in weight_types}
+    n_pairs = np.zeros(n_seg, dtype=np.int64)
+
+    for code in seg_codes:
+        code = np.asarray(code, dtype=np.int64)
+        in_seg = code >= 0
+        n_pairs += np.bincount(code[in_seg], minlength=n_seg)
+        ok = in_seg & valid_state
+        flat = code[ok] * (n_states * n_states) + state_cell[ok]
+        for name, w in weights.items():
+            counts[name] += np.bincount(flat, weights=None if w is None else w[ok], minlength=n_flat)
+
+    identity = np.broadcast_to(np.eye(n_states), (n_seg, n_states, n_states))
+    out_counts, out_P = {}, {}
+    for name, c in counts.items():
+        c = c.reshape(n_seg, n_states, n_states)
+        out_counts[name] = c
+        out_P[name] = _finalize_tensor(_normalize_tensor(c), c.sum(axis=-1) == 0, identity)
+    return {"n_pairs": n_pairs, "counts": out_counts, "P": out_P}
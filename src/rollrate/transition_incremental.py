@@ -0,0 +1,195 @@
+# ============================================================
+#  transition_incremental.py – Cập nhật transition khi có cutoff mới
+#
+#  State lưu counts CHƯA gắn trọng số theo tháng cutoff của dòng t (chỉ các tháng
+#  trong ROLL_WINDOW). Khi có partition tháng mới N:
+#    - chỉ đọc 2 partition N-1 và N → cặp (N-1 → N)
+#    - bỏ tháng rơi khỏi window, tính lại trọng số theo tuổi mới
+#  Với exp: W_N = λ · (W_{N-1} − λ^RW · C_{N-1-RW}) + λ · C_{N-1}
+#  (tính trực tiếp Σ λ^age · C_m trên ≤ RW+1 lát tháng → cùng kết quả, không tích luỹ sai số).
+# ============================================================
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.config import CFG, TRANSITION_STATE_PATH, parse_date_column
+from src.rollrate.transition import (
+    STATE_SPACE,
+    monthly_pair_counts,
+    month_weights,
+    weight_monthly_counts,
+)
+from src.rollrate.matrix_store import MatrixStore
+
+
+def _month_to_yyyymm(month: int) -> int:
+    return (int(month) // 12) * 100 + int(month) % 12 + 1
+
+
+def _reindex_monthly(monthly: dict, segments: list, mobs: np.ndarray) -> dict:
+    """Đưa counts theo tháng về trục segment / MOB mới (segment, MOB thiếu → 0)."""
+    seg_pos = {k: i for i, k in enumerate(segments)}
+    mob_pos = {int(m): j for j, m in enumerate(mobs)}
+    si = np.array([seg_pos[k] for k in monthly["segments"]], dtype=np.int64)
+    mj = np.array([mob_pos[int(m)] for m in monthly["mobs"]], dtype=np.int64)
+
+    n_month = len(monthly["months"])
+    out = {"months": monthly["months"], "segments": list(segments), "mobs": np.asarray(mobs)}
+    for key in ["counts", "n_obs", "ead"]:
+        arr = monthly[key]
+        new = np.zeros((n_month, len(segments), len(mobs)) + arr.shape[3:], dtype=arr.dtype)
+        new[:, si[:, None], mj[None, :]] = arr
+        out[key] = new
+    return out
+
+
+def merge_monthly_counts(old: dict, new: dict) -> dict:
+    """
+    Gộp 2 bộ counts theo tháng: tháng có trong new thay thế tháng cũ.
+    Trục segment / MOB là hợp của 2 bên.
+    """
+    segments = sorted(set(old["segments"]) | set(new["segments"]))
+    mobs = np.union1d(old["mobs"], new["mobs"]).astype(np.int64)
+    old_r = _reindex_monthly(old, segments, mobs)
+    new_r = _reindex_monthly(new, segments, mobs)
+
+    keep_old = ~np.isin(old_r["months"], new_r["months"])
+    months = np.concatenate([old_r["months"][keep_old], new_r["months"]])
+    order = np.argsort(months, kind="stable")
+    out = {"months": months[order].astype(np.int64), "segments": segments, "mobs": mobs}
+    for key in ["counts", "n_obs", "ead"]:
+        out[key] = np.concatenate([old_r[key][keep_old], new_r[key]])[order]
+    return out
+
+
+def _trim_to_window(state: dict, roll_window: int) -> dict:
+    keep = (state["last_month"] - state["months"]) <= roll_window
+    for key in ["months", "counts", "n_obs", "ead"]:
+        state[key] = state[key][keep]
+    return state
+
+
+def build_transition_state(df: pd.DataFrame) -> dict:
+    """
+    State ban đầu từ panel đầy đủ (vd 13 tháng gần nhất):
+    counts theo tháng trong ROLL_WINDOW + last_month (tháng cutoff lớn nhất của df).
+    """
+    months = pd.array(parse_date_column(df[CFG["cutoff"]], output="month_index"))
+    state = monthly_pair_counts(df)
+    state["last_month"] = int(np.nanmax(months.to_numpy(dtype="float64", na_value=np.nan)))
+    state = _trim_to_window(state, CFG.get("ROLL_WINDOW", 12))
+    print(
+        f"✅ Transition state: {len(state['months'])} tháng, {len(state['segments'])} segments, "
+        f"last cutoff {_month_to_yyyymm(state['last_month'])}"
+    )
+    return state
+
+
+def transition_store_from_state(state: dict) -> MatrixStore:
+    """MatrixStore từ state với ROLL_WINDOW / WEIGHT_METHOD / DECAY_LAMBDA hiện tại trong CFG."""
+    weights, in_window = month_weights(state["months"], state["last_month"])
+    return MatrixStore.from_tensor(weight_monthly_counts(state, weights, in_window))
+
+
+def save_transition_state(state: dict, path: str | Path | None = None) -> Path:
+    path = Path(path or TRANSITION_STATE_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    meta = {
+        "segments": [list(s) for s in state["segments"]],
+        "states": list(STATE_SPACE),
+        "last_month": int(state["last_month"]),
+    }
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            months=state["months"],
+            mobs=state["mobs"],
+            counts=state["counts"],
+            n_obs=state["n_obs"],
+            ead=state["ead"],
+            meta=np.array(json.dumps(meta)),
+        )
+    tmp.replace(path)
+    return path
+
+
+def load_transition_state(path: str | Path | None = None) -> dict:
+    path = Path(path or TRANSITION_STATE_PATH)
+    if not path.exists():
+        raise FileNotFoundError(f"Chưa có transition state tại {path} → chạy build_transition_state trước.")
+    with np.load(path) as z:
+        meta = json.loads(str(z["meta"]))
+        if meta["states"] != list(STATE_SPACE):
+            raise ValueError("Transition state được build với STATE_SPACE khác → build lại.")
+        return {
+            "months": z["months"],
+            "segments": [tuple(s) for s in meta["segments"]],
+            "mobs": z["mobs"],
+            "counts": z["counts"],
+            "n_obs": z["n_obs"],
+            "ead": z["ead"],
+            "last_month": meta["last_month"],
+        }
+
+
+def update_transitions(
+    new_partition: pd.DataFrame,
+    prev_partition: pd.DataFrame | None = None,
+    state: dict | None = None,
+    state_path: str | Path | None = None,
+    save: bool = True,
+) -> MatrixStore:
+    """
+    Cập nhật transition matrices khi có partition cutoff mới, không quét lại cả ROLL_WINDOW.
+
+    Args:
+        new_partition: panel của tháng cutoff mới (đã có PRODUCT_TYPE / RISK_SCORE như load_panel).
+        prev_partition: panel tháng liền trước; None → load_panel đúng 1 partition đó.
+        state: state trong bộ nhớ (được cập nhật tại chỗ); None → đọc từ state_path.
+        state_path: file state (mặc định TRANSITION_STATE_PATH).
+        save: ghi state mới ra state_path.
+
+    Returns:
+        MatrixStore của window mới (to_nested() → matrices_by_mob, parent_fallback).
+    """
+    if state is None:
+        state = load_transition_state(state_path)
+
+    cutoff = CFG["cutoff"]
+    new_months = pd.array(parse_date_column(new_partition[cutoff], output="month_index")).dropna()
+    if len(new_months) == 0:
+        raise ValueError("update_transitions(): new_partition không có cutoff hợp lệ.")
+    first_new, last_new = int(new_months.min()), int(new_months.max())
+    if last_new < state["last_month"]:
+        raise ValueError(
+            f"update_transitions(): cutoff mới {_month_to_yyyymm(last_new)} cũ hơn state "
+            f"({_month_to_yyyymm(state['last_month'])})."
+        )
+
+    if prev_partition is None:
+        from src.data_loader import load_panel
+
+        prev_ym = _month_to_yyyymm(first_new - 1)
+        prev_partition = load_panel(cutoff_from=prev_ym, cutoff_to=prev_ym, compact=False)
+
+    panel = pd.concat([prev_partition, new_partition], ignore_index=True)
+    new_counts = monthly_pair_counts(panel)
+
+    merged = merge_monthly_counts(state, new_counts)
+    state.update(merged)
+    state["last_month"] = last_new
+    _trim_to_window(state, CFG.get("ROLL_WINDOW", 12))
+
+    print(
+        f"🔄 update_transitions: +{len(new_counts['months'])} tháng cặp, window "
+        f"{_month_to_yyyymm(state['months'].min())}→{_month_to_yyyymm(state['last_month'])}"
+    )
+    if save:
+        save_transition_state(state, state_path)
+    return transition_store_from_state(state)
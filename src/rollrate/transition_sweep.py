@@ -0,0 +1,92 @@
+# ============================================================
+#  transition_sweep.py – Sweep ROLL_WINDOW / WEIGHT_METHOD không cần make_pairs lại
+#
+#  Cache counts CHƯA gắn trọng số theo tháng cutoff × segment × MOB × from × to
+#  cho toàn bộ lịch sử (1 lần). Mỗi biến thể (window, exp/linear, λ, as-of) chỉ là
+#  tổng có trọng số theo trục tháng → vài chục ms / biến thể.
+# ============================================================
+
+from __future__ import annotations
+
+import time
+from itertools import product as _product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.config import CFG, PAIR_COUNT_CACHE_PATH, parse_date_column
+from src.rollrate.transition import monthly_pair_counts, month_weights, weight_monthly_counts
+from src.rollrate.transition_incremental import save_transition_state, load_transition_state
+from src.rollrate.matrix_store import MatrixStore
+
+
+def build_pair_count_cache(df: pd.DataFrame, path: str | Path | None = None, save: bool = True) -> dict:
+    """
+    Counts theo tháng cho toàn bộ df (không lọc ROLL_WINDOW).
+    save=True → ghi ra path (mặc định PAIR_COUNT_CACHE_PATH), đọc lại bằng load_pair_count_cache.
+    """
+    cache = monthly_pair_counts(df)
+    months = pd.array(parse_date_column(df[CFG["cutoff"]], output="month_index"))
+    cache["last_month"] = int(np.nanmax(months.to_numpy(dtype="float64", na_value=np.nan)))
+    print(
+        f"✅ Pair count cache: {len(cache['months'])} tháng × {len(cache['segments'])} segments × "
+        f"{len(cache['mobs'])} MOB ({cache['counts'].nbytes / 1e6:.1f} MB)"
+    )
+    if save:
+        save_transition_state(cache, path or PAIR_COUNT_CACHE_PATH)
+    return cache
+
+
+def load_pair_count_cache(path: str | Path | None = None) -> dict:
+    return load_transition_state(path or PAIR_COUNT_CACHE_PATH)
+
+
+def transitions_from_cache(
+    cache: dict,
+    roll_window: int | None = None,
+    weight_method: str | None = None,
+    decay_lambda: float | None = None,
+    as_of: int | None = None,
+) -> MatrixStore:
+    """
+    MatrixStore cho 1 biến thể, giống compute_transition_by_mob với CFG tương ứng.
+
+    Args:
+        roll_window / weight_method / decay_lambda: None → lấy từ CFG.
+        as_of: cutoff cuối (YYYYMM hoặc month_index); None → cutoff mới nhất của cache.
+               Chỉ giữ cặp có dòng t trước as_of (dòng t+1 ≤ as_of) → giống build trên panel
+               cắt tới as_of (backtest theo thời điểm, không nhìn dữ liệu tương lai).
+    """
+    last_month = cache["last_month"]
+    if as_of is not None:
+        last_month = int(as_of) if int(as_of) < 190001 else (int(as_of) // 100) * 12 + int(as_of) % 100 - 1
+    weights, in_window = month_weights(cache["months"], last_month, roll_window, weight_method, decay_lambda)
+    if as_of is not None:
+        in_window &= np.asarray(cache["months"]) < last_month
+        weights = np.where(in_window, weights, 0.0)
+    return MatrixStore.from_tensor(weight_monthly_counts(cache, weights, in_window))
+
+
+def sweep_transitions(
+    cache: dict,
+    roll_windows=(6, 12, 18),
+    weight_methods=("exp", "linear"),
+    decay_lambdas=(None,),
+    as_of: int | None = None,
+) -> dict:
+    """
+    Chạy mọi tổ hợp (roll_window, weight_method, decay_lambda).
+
+    Returns:
+        {(roll_window, weight_method, decay_lambda): MatrixStore}
+        (decay_lambda=None → CFG["DECAY_LAMBDA"]; với linear/khác λ không ảnh hưởng.)
+    """
+    t0 = time.time()
+    out = {}
+    for rw, method, lam in _product(roll_windows, weight_methods, decay_lambdas):
+        out[(rw, method, lam)] = transitions_from_cache(
+            cache, roll_window=rw, weight_method=method, decay_lambda=lam, as_of=as_of
+        )
+    print(f"⚡ Sweep {len(out)} biến thể transition trong {time.time() - t0:.2f}s")
+    return out
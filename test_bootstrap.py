@@ -0,0 +1,55 @@
+"""
+Test script: bootstrap theo loan (B ma trận / segment trên trục batch) + dải forecast.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.config import BUCKETS_CANON
+from src.rollrate.transition import make_pairs
+from panel_fixture import make_panel
+
+df = make_panel()
+pairs = make_pairs(df)
+
+print("=" * 70)
+print("TEST: BOOTSTRAP THEO LOAN (trục batch)")
+print("=" * 70)
+
+from src.rollrate.transition import build_transition_tensor
+from src.rollrate.bootstrap import bootstrap_transitions, bootstrap_forecast, forecast_bands
+
+boot = bootstrap_transitions(pairs, n_boot=100, seed=7)
+ref = build_transition_tensor(pairs)
+for key in ["P", "parent", "n_obs", "is_fallback"]:
+    np.testing.assert_allclose(boot["point"][key], ref[key], atol=1e-10)  # W = 1 → đúng ước lượng điểm
+assert boot["P"].shape == (100,) + ref["P"].shape
+np.testing.assert_allclose(boot["P"].sum(axis=-1), 1.0, atol=1e-9)
+assert np.array_equal(bootstrap_transitions(pairs, n_boot=100, seed=7)["P"], boot["P"])  # seed tái lập
+
+init = pd.Series(0.0, index=BUCKETS_CANON)
+init[BUCKETS_CANON[0]] = 1000.0
+v = bootstrap_forecast(boot, "A", "S1", init, start_mob=0, max_mob=12)
+assert v.shape == (100, 13, len(BUCKETS_CANON))
+bands = forecast_bands(v, start_mob=0)
+assert (bands["Q05"] <= bands["Q95"] + 1e-12).all()
+print(bands.tail(3))
+
+# Nhánh không scipy: cộng theo từng khúc nnz (khúc nhỏ → cột vắt qua nhiều khúc) = W @ X dense
+from src.rollrate import bootstrap as bootstrap_mod
+
+rng_w = np.random.default_rng(3)
+n_l, n_c = 50, 40
+coo_loan, coo_col = np.divmod(np.sort(rng_w.choice(n_l * n_c, 300, replace=False)), n_c)
+order = np.lexsort((coo_loan, coo_col))
+coo = (coo_loan[order], coo_col[order], rng_w.random(300))
+W = rng_w.poisson(1.0, size=(7, n_l)).astype("float64")
+X = np.zeros((n_l, n_c))
+X[coo[0], coo[1]] = coo[2]
+has_scipy, chunk = bootstrap_mod._HAS_SCIPY, bootstrap_mod._NNZ_CHUNK_ELEMS
+bootstrap_mod._HAS_SCIPY, bootstrap_mod._NNZ_CHUNK_ELEMS = False, 7 * 16
+np.testing.assert_allclose(bootstrap_mod._weighted_sum(W, coo, n_l, n_c), W @ X, rtol=1e-12)
+bootstrap_mod._HAS_SCIPY, bootstrap_mod._NNZ_CHUNK_ELEMS = has_scipy, chunk
+
+print("\n✅ PASSED: bootstrap B ma trận / segment + dải DEL30/DEL90 qua forecast")
+
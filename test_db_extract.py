@@ -0,0 +1,320 @@
+"""
+Test script: streaming extraction SQL → parquet partitions CUTOFF_YYYYMM=...
+Dùng SQLite local thay cho Oracle (cùng interface DB-API qua tham số connect).
+"""
+
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.db import extract_to_parquet
+from src.data_loader import load_data, list_partitions
+
+# ============================================================
+# Tạo bảng giả lập RISK.TV_TRI_MARKOV_ETB_RR trong SQLite
+# ============================================================
+
+tmp = Path(tempfile.mkdtemp())
+db_path = tmp / "etb.db"
+
+rng = np.random.default_rng(0)
+rows = []
+for cutoff in [202501, 202502, 202503]:
+    for loan in range(1, 1201):
+        rows.append((
+            cutoff, loan, 202412, 1000.0, float(rng.uniform(0, 1000)),
+            int(cutoff - 202412 if cutoff < 202500 else cutoff - 202500 + 1),
+            "A", rng.choice(["DPD0", "DPD1+", "DPD30+"]), "B",
+        ))
+
+conn = sqlite3.connect(db_path)
+conn.execute(
+    "create table ETB (CUTOFF_DATE int, AGREEMENT_ID int, DISBURSAL_DATE int, "
+    "DISBURSAL_AMOUNT real, PRINCIPLE_OUTSTANDING real, MOB int, "
+    "PRODUCT_TYPE text, STATE_MODEL text, RISK_SCORE text)"
+)
+conn.executemany("insert into ETB values (?,?,?,?,?,?,?,?,?)", rows)
+conn.commit()
+conn.close()
+
+print("=" * 70)
+print("TEST: STREAMING EXTRACTION → PARQUET PARTITIONS")
+print("=" * 70)
+
+out_dir = tmp / "ETB_Parquet_YYYYMM"
+written = extract_to_parquet(
+    "select * from ETB",
+    out_dir=out_dir,
+    cutoffs=[202501, 202502, 202503],
+    batch_size=500,  # nhỏ để ép nhiều row group
+    connect=lambda: sqlite3.connect(db_path),
+    cutoff_format="yyyymm",  # bảng test lưu CUTOFF_DATE dạng số YYYYMM
+)
+
+# ============================================================
+# Verify
+# ============================================================
+
+assert written == {202501: 1200, 202502: 1200, 202503: 1200}, written
+assert sorted(list_partitions(out_dir)) == [202501, 202502, 202503]
+
+import pyarrow.parquet as pq
+n_row_groups = pq.ParquetFile(out_dir / "CUTOFF_YYYYMM=202502.parquet").num_row_groups
+assert n_row_groups == 3, n_row_groups  # 1200 rows / batch 500 → 3 row groups
+
+df = load_data(str(out_dir), cutoff_from=202502)
+assert sorted(df["CUTOFF_DATE"].unique()) == [202502, 202503]
+assert len(df) == 2400
+
+expected = pd.DataFrame(rows, columns=df.columns[:9]).query("CUTOFF_DATE >= 202502")
+assert np.isclose(df["PRINCIPLE_OUTSTANDING"].sum(), expected["PRINCIPLE_OUTSTANDING"].sum())
+
+# Cutoff không có dữ liệu → không tạo partition, partition cũ (stale) bị xoá
+import shutil
+shutil.copy(out_dir / "CUTOFF_YYYYMM=202503.parquet", out_dir / "CUTOFF_YYYYMM=202504.parquet")
+written = extract_to_parquet(
+    "select * from ETB",
+    out_dir=out_dir,
+    cutoffs=[202504],
+    connect=lambda: sqlite3.connect(db_path),
+    cutoff_format="yyyymm",
+)
+assert written == {202504: 0}
+assert not (out_dir / "CUTOFF_YYYYMM=202504.parquet").exists()
+
+print("\n✅ PASSED: streaming extraction ghi đúng partitions, row groups và dữ liệu")
+
+# ============================================================
+# CUTOFF_DATE kiểu DATE (như Oracle) + cột toàn NULL ở batch đầu
+# ============================================================
+
+print("\n" + "=" * 70)
+print("TEST: CUTOFF_DATE KIỂU DATE")
+print("=" * 70)
+
+from src.db import _stream_cursor_to_parquet
+
+conn = sqlite3.connect(db_path)
+conn.execute("create table ETB_DATE (CUTOFF_DATE date, AGREEMENT_ID int, NOTE text)")
+month_end = {202501: "2025-01-31", 202502: "2025-02-28", 202503: "2025-03-31"}
+conn.executemany(
+    "insert into ETB_DATE values (?,?,?)",
+    [(month_end[c], loan, None if loan <= 700 else f"n{loan}") for c in month_end for loan in range(1, 1001)],
+)
+conn.commit()
+conn.close()
+
+date_dir = tmp / "ETB_date"
+written = extract_to_parquet(
+    "select * from ETB_DATE", out_dir=date_dir, cutoffs=[202501, 202502, 202503, 202504],
+    batch_size=300, connect=lambda: sqlite3.connect(db_path),
+)
+assert written == {202501: 1000, 202502: 1000, 202503: 1000, 202504: 0}, written
+part = pd.read_parquet(date_dir / "CUTOFF_YYYYMM=202502.parquet")
+assert set(part["CUTOFF_DATE"]) == {"2025-02-28"}
+# NOTE toàn NULL ở 2 batch đầu (700 dòng) → vẫn ghi được, kiểu string
+assert part["NOTE"].isna().sum() == 700 and part["NOTE"].notna().sum() == 300
+
+# Lỗi giữa chừng → không để lại file .tmp, partition cũ giữ nguyên
+class _FailingCursor:
+    description = [("AGREEMENT_ID",), ("NOTE",)]
+
+    def __init__(self):
+        self.calls = 0
+
+    def fetchmany(self, n):
+        self.calls += 1
+        if self.calls > 1:
+            raise RuntimeError("mất kết nối")
+        return [(i, "x") for i in range(n)]
+
+target = date_dir / "CUTOFF_YYYYMM=202501.parquet"
+before = target.read_bytes()
+try:
+    _stream_cursor_to_parquet(_FailingCursor(), target, 10)
+    raise AssertionError("phải raise khi cursor lỗi")
+except RuntimeError:
+    pass
+assert not list(date_dir.glob("*.tmp"))
+assert target.read_bytes() == before
+
+# list_source_cutoffs / ingest_incremental mặc định hiểu CUTOFF_DATE là DATE
+from src.db import ingest_incremental, list_source_cutoffs
+
+assert list_source_cutoffs("select * from ETB_DATE", connect=lambda: sqlite3.connect(db_path)) == [202501, 202502, 202503]
+written = ingest_incremental("select * from ETB_DATE", out_dir=tmp / "ETB_date_inc", connect=lambda: sqlite3.connect(db_path))
+assert written == {202501: 1000, 202502: 1000, 202503: 1000}, written
+
+# CLI có --cutoff-format
+import subprocess, sys
+cli_help = subprocess.run([sys.executable, "-m", "src.db", "--help"], capture_output=True, text=True, check=True).stdout
+assert "--cutoff-format" in cli_help and "yyyymm" in cli_help
+
+print("\n✅ PASSED: lọc theo khoảng tháng trên cột DATE, cột NULL đầu file, dọn .tmp khi lỗi")
+
+# ============================================================
+# Incremental ingest + manifest
+# ============================================================
+
+print("\n" + "=" * 70)
+print("TEST: INCREMENTAL INGEST + MANIFEST")
+print("=" * 70)
+
+from src.db import ingest_incremental
+from src.data_loader import read_manifest, validate_manifest
+
+inc_dir = tmp / "ETB_incremental"
+connect = lambda: sqlite3.connect(db_path)
+
+# Lần đầu: fetch toàn bộ cutoff có ở nguồn
+written = ingest_incremental("select * from ETB", out_dir=inc_dir, connect=connect, cutoff_format="yyyymm")
+assert sorted(written) == [202501, 202502, 202503], written
+manifest = read_manifest(inc_dir)
+assert manifest["partitions"]["202502"]["rows"] == 1200
+assert validate_manifest(inc_dir) == []
+
+# Nguồn có thêm 1 cutoff mới → chỉ fetch cutoff đó (+ refresh 1 cutoff gần nhất)
+conn = sqlite3.connect(db_path)
+conn.executemany(
+    "insert into ETB values (?,?,?,?,?,?,?,?,?)",
+    [(202504, loan, 202412, 1000.0, 10.0, 4, "A", "DPD0", "B") for loan in range(1, 801)],
+)
+conn.commit()
+conn.close()
+
+written = ingest_incremental(
+    "select * from ETB", out_dir=inc_dir, refresh_last_n=2, connect=connect, cutoff_format="yyyymm"
+)
+assert sorted(written) == [202503, 202504], written
+assert read_manifest(inc_dir)["partitions"]["202504"]["rows"] == 800
+
+# Không có gì mới → không fetch
+assert ingest_incremental("select * from ETB", out_dir=inc_dir, connect=connect, cutoff_format="yyyymm") == {}
+
+# load_data kiểm tra manifest: file bị sửa → raise
+df = load_data(str(inc_dir), validate_manifest=True)
+assert len(df) == 3 * 1200 + 800
+
+pd.read_parquet(inc_dir / "CUTOFF_YYYYMM=202501.parquet").head(10).to_parquet(
+    inc_dir / "CUTOFF_YYYYMM=202501.parquet"
+)
+try:
+    load_data(str(inc_dir), validate_manifest=True)
+    raise AssertionError("load_data phải raise khi partition lệch manifest")
+except ValueError as e:
+    assert "202501" in str(e)
+# Không đọc partition lệch → vẫn hợp lệ
+load_data(str(inc_dir), cutoff_from=202502, validate_manifest=True)
+
+print("\n✅ PASSED: incremental ingest chỉ fetch cutoff thiếu + manifest phát hiện partition lệch")
+
+# ============================================================
+# Parallel extraction (shard theo cutoff / hash)
+# ============================================================
+
+print("\n" + "=" * 70)
+print("TEST: PARALLEL EXTRACTION")
+print("=" * 70)
+
+from src.db import load_df_parallel
+
+conn = sqlite3.connect(db_path)
+df_serial = pd.read_sql_query("select * from ETB", conn)
+conn.close()
+
+key_cols = ["CUTOFF_DATE", "AGREEMENT_ID"]
+df_by_cutoff = load_df_parallel(
+    "select * from ETB", shard_by="cutoff", workers=3, connect=connect, cutoff_format="yyyymm"
+)
+pd.testing.assert_frame_equal(
+    df_by_cutoff.sort_values(key_cols).reset_index(drop=True),
+    df_serial.sort_values(key_cols).reset_index(drop=True),
+)
+
+df_by_hash = load_df_parallel(
+    "select * from ETB", shard_by="hash", n_shards=5, workers=3,
+    hash_expr="({col} % {n_shards})", connect=connect,
+)
+pd.testing.assert_frame_equal(
+    df_by_hash.sort_values(key_cols).reset_index(drop=True),
+    df_serial.sort_values(key_cols).reset_index(drop=True),
+)
+
+par_dir = tmp / "ETB_parallel"
+written = load_df_parallel(
+    "select * from ETB", shard_by="cutoff", workers=2, out_dir=par_dir, connect=connect, cutoff_format="yyyymm"
+)
+assert written == {202501: 1200, 202502: 1200, 202503: 1200, 202504: 800}, written
+assert len(load_data(str(par_dir))) == len(df_serial)
+
+# CUTOFF_DATE kiểu DATE: shard theo tháng (mặc định cutoff_format="date")
+conn = sqlite3.connect(db_path)
+df_date_serial = pd.read_sql_query("select * from ETB_DATE", conn)
+conn.close()
+df_date = load_df_parallel("select * from ETB_DATE", shard_by="cutoff", workers=3, connect=connect)
+pd.testing.assert_frame_equal(
+    df_date.sort_values(key_cols).reset_index(drop=True),
+    df_date_serial.sort_values(key_cols).reset_index(drop=True),
+)
+
+print("\n✅ PASSED: load_df_parallel khớp với query tuần tự (cutoff + hash shards)")
+
+# ============================================================
+# Panel cache (feather, zero-copy memory-map tuỳ chọn)
+# ============================================================
+
+print("\n" + "=" * 70)
+print("TEST: PANEL CACHE")
+print("=" * 70)
+
+import os
+from src.data_loader import load_panel
+
+cache_dir = tmp / "panel_cache"
+panel = load_panel(str(par_dir), cache_dir=cache_dir)
+assert len(list(cache_dir.glob("*.feather"))) == 1
+panel_hit = load_panel(str(par_dir), cache_dir=cache_dir)
+pd.testing.assert_frame_equal(panel, panel_hit)
+panel_hit.loc[panel_hit.index[:5], "PRINCIPLE_OUTSTANDING"] = 0.0  # mặc định: copy, sửa được
+
+# zero_copy: cột số trỏ vào file memory-map (read-only), dữ liệu như cũ
+panel_mm = load_panel(str(par_dir), cache_dir=cache_dir, zero_copy=True)
+pd.testing.assert_frame_equal(panel, panel_mm)
+assert not panel_mm["PRINCIPLE_OUTSTANDING"].to_numpy().flags.writeable
+
+# Partition thay đổi (mtime) → key mới → build lại
+f = par_dir / "CUTOFF_YYYYMM=202504.parquet"
+os.utime(f, ns=(f.stat().st_atime_ns, f.stat().st_mtime_ns + 10**9))
+load_panel(str(par_dir), cache_dir=cache_dir)
+assert len(list(cache_dir.glob("*.feather"))) == 2
+
+print("\n✅ PASSED: panel cache hit khớp dữ liệu gốc, đổi partition → rebuild")
+
+# DISBURSAL_DATE thiếu tháng: compact_panel → Int32 <NA>, load_panel(compact=True) vẫn đúng ngày
+from src.data_loader import compact_panel
+
+nan_dir = tmp / "ETB_missing_date"
+nan_dir.mkdir()
+part = pd.read_parquet(par_dir / "CUTOFF_YYYYMM=202503.parquet")
+part["DISBURSAL_DATE"] = part["DISBURSAL_DATE"].astype("float64")
+part.loc[part.index[:10], "DISBURSAL_DATE"] = np.nan
+part.to_parquet(nan_dir / "CUTOFF_YYYYMM=202503.parquet", index=False)
+
+compacted = compact_panel(part)
+assert str(compacted["DISBURSAL_DATE"].dtype) == "Int32"
+assert compacted["DISBURSAL_DATE"].isna().sum() == 10
+assert set(compacted["DISBURSAL_DATE"].dropna()) == {202412}
+
+for compact in (True, False):
+    panel_nan = load_panel(str(nan_dir), cache_dir=cache_dir, compact=compact)
+    disb = panel_nan["DISBURSAL_DATE"]
+    assert pd.api.types.is_datetime64_any_dtype(disb) and disb.isna().sum() == 10
+    assert set(disb.dropna()) == {pd.Timestamp("2024-12-01")}, set(disb.dropna())
+    if compact:
+        assert set(panel_nan["CUTOFF_DATE"]) == {202503}
+
+print("\n✅ PASSED: DISBURSAL_DATE thiếu tháng → compact Int32 <NA>, load_panel vẫn parse đúng ngày")
+
@@ -0,0 +1,85 @@
+"""
+Test script: FallbackIndex (resolve fallback 1 lần cho mỗi policy, lookup bằng số nguyên)
++ cache tích ma trận m → T (chain_products / transition).
+"""
+
+import numpy as np
+
+from src.config import BUCKETS_CANON
+from src.rollrate.transition import compute_transition_by_mob
+from panel_fixture import make_panel
+
+df = make_panel()
+matrices_by_mob, parent_fallback = compute_transition_by_mob(df)
+store = compute_transition_by_mob(df, return_store=True)
+
+print("=" * 70)
+print("TEST: FALLBACK INDEX (resolve 1 lần, lookup số nguyên)")
+print("=" * 70)
+
+from src.rollrate.matrix_store import fallback_index
+
+gappy = {prod: {mob: dict(sd) for mob, sd in md.items()} for prod, md in matrices_by_mob.items()}
+del gappy["A"][2]["S1"]
+parents = {k: v for k, v in parent_fallback.items() if k != ("A", "S2")}
+
+fidx = fallback_index(gappy, parents, policy="calibration", states=BUCKETS_CANON)
+assert fallback_index(fidx) is fidx  # index dựng sẵn → truyền thẳng xuống engine
+last_mob_A = max(gappy["A"])
+
+assert fidx.reason("A", "S1", 3) == "exact"
+assert fidx.reason("A", "S1", 2) == "max_mob"
+np.testing.assert_array_equal(fidx.get("A", "S1", 2), gappy["A"][last_mob_A]["S1"]["P"].to_numpy())
+assert fidx.reason("A", "ZZ", 1) == "product_parent"          # score lạ → parent đầu tiên của product
+np.testing.assert_array_equal(fidx.get("A", "ZZ", 1), parents[("A", "S1")].to_numpy())
+assert fidx.reason("C", "S1", 0) == "identity"
+np.testing.assert_array_equal(fidx.get("C", "S1", 0), np.eye(len(BUCKETS_CANON)))
+
+plan_idx = fallback_index(gappy, parents, policy="plan", states=BUCKETS_CANON)
+assert plan_idx.reason("A", "S1", 2) == "parent"
+assert plan_idx.reason("A", "S2", 99) == "product_parent"
+
+fc_idx = fallback_index(gappy, policy="forecast", states=BUCKETS_CANON)
+assert fc_idx.reason("A", "S1", 99) == "max_mob"
+try:
+    fc_idx.get("A", "ZZ", 1)
+    raise AssertionError("forecast policy phải raise KeyError khi không có matrix")
+except KeyError:
+    pass
+
+# Cùng store → index cache trên store, slot dùng chung cho mọi engine
+assert fallback_index(store, policy="allocation", states=BUCKETS_CANON) is \
+    fallback_index(store, policy="allocation", states=BUCKETS_CANON)
+print(fidx)
+print(fidx.table(max_mob=4).head())
+
+print("\n✅ PASSED: FallbackIndex đúng thứ tự fallback của từng engine")
+
+print("\n" + "=" * 70)
+print("TEST: CACHE TÍCH MA TRẬN m → T")
+print("=" * 70)
+
+alloc_idx = fallback_index(store, policy="allocation", states=BUCKETS_CANON)
+for m0 in range(0, 10):
+    expected = np.eye(len(BUCKETS_CANON))
+    for mob_k in range(m0, 10):
+        expected = expected @ alloc_idx.get("B", "S1", mob_k)
+    np.testing.assert_allclose(alloc_idx.transition("B", "S1", m0, 10), expected, atol=1e-13)
+assert alloc_idx.chain_products(10) is alloc_idx.chain_products(10)  # cache theo target
+
+# Cache LRU có giới hạn: target dùng gần nhất giữ lại, target cũ nhất bị bỏ
+from src.rollrate.matrix_store import CHAIN_CACHE_SIZE
+
+chain_10 = alloc_idx.chain_products(10)
+for target in range(11, 11 + CHAIN_CACHE_SIZE - 1):
+    alloc_idx.chain_products(target)
+assert alloc_idx.chain_products(10) is chain_10           # vẫn trong cache, thành mới nhất
+alloc_idx.chain_products(11 + CHAIN_CACHE_SIZE)           # đẩy target 11 ra
+assert len(alloc_idx._chains) == CHAIN_CACHE_SIZE
+assert 11 not in alloc_idx._chains and 10 in alloc_idx._chains
+expected = np.linalg.multi_dot([alloc_idx.get("B", "S1", m) for m in range(3, 11)])
+np.testing.assert_allclose(alloc_idx.transition("B", "S1", 3, 11), expected, atol=1e-13)  # build lại sau khi bị bỏ
+np.testing.assert_array_equal(alloc_idx.transition("B", "S1", 10, 10), np.eye(len(BUCKETS_CANON)))
+
+print("\n✅ PASSED: transition(m → T) O(1) từ tích lũy ngược khớp nhân tuần tự")
+
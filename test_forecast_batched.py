@@ -0,0 +1,74 @@
+"""
+Test script: forecast cohort theo lô (forecast_all_vintages / forecast_cohorts_batched)
+khớp forecast_vintage từng cohort; kernel canonical / banded (Q / R) khớp dense.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.config import CFG, BUCKETS_CANON
+from src.rollrate.transition import compute_transition_by_mob
+from panel_fixture import make_panel, with_orig_date
+
+df = make_panel()
+matrices_by_mob, parent_fallback = compute_transition_by_mob(df)
+store = compute_transition_by_mob(df, return_store=True)
+
+print("=" * 70)
+print("TEST: BATCHED COHORT FORECAST (forecast_all_vintages)")
+print("=" * 70)
+
+from src.rollrate.forecast import forecast_all_vintages, forecast_vintage
+
+df_fc = with_orig_date(df)
+fc_all = forecast_all_vintages(df_fc, matrices_by_mob, max_mob=12)
+assert len(fc_all) > 0
+for (prod, score, vintage), fc in fc_all.items():
+    ref_fc = forecast_vintage(df_fc, matrices_by_mob, prod, score, vintage, max_mob=12)
+    assert list(fc) == list(ref_fc)
+    for mob_k in fc:
+        pd.testing.assert_series_equal(fc[mob_k], ref_fc[mob_k], check_exact=True)
+
+fc_arr = forecast_all_vintages(df_fc, store, max_mob=12, as_array=True)
+assert fc_arr["ead"].shape == (len(fc_all), 13, len(BUCKETS_CANON))
+
+print(f"\n✅ PASSED: {len(fc_all)} cohort forecast theo lô trùng bit với forecast_vintage từng cohort")
+
+print("\n" + "=" * 70)
+print("TEST: DẠNG CHÍNH TẮC Q / R (kernel canonical / banded)")
+print("=" * 70)
+
+from src.rollrate.forecast import forecast_cohorts_batched
+from src.rollrate.matrix_store import banded_diagonals, canonical_form, canonical_step, fallback_index
+
+fc_dense = forecast_cohorts_batched(df_fc, store, max_mob=12)
+work = {"dense": fc_dense["work_per_step"]}
+for kernel in ["canonical", "banded"]:
+    fc_k = forecast_cohorts_batched(df_fc, store, max_mob=12, kernel=kernel)
+    assert fc_k["keys"] == fc_dense["keys"]
+    np.testing.assert_allclose(fc_k["ead"], fc_dense["ead"], rtol=1e-13, atol=1e-9)
+    assert fc_k["work_per_step"] * 2 <= fc_dense["work_per_step"]
+    work[kernel] = fc_k["work_per_step"]
+
+# Q có băng hẹp (roll tối đa 1 bucket, cure tối đa 1 bucket) → banded khớp dense
+fidx_fc = fallback_index(store, policy="forecast", states=BUCKETS_CANON)
+canon = fidx_fc.canonical()
+assert canon["ok"][: fidx_fc.n_cells][fidx_fc._present.ravel()].all()
+t = canon["n_transient"]
+QR_band = np.array(canon["QR"])
+Q_band = QR_band[:, :, :t]
+Q_band[:, np.abs(np.arange(t)[None, :] - np.arange(t)[:, None]) > 1] = 0.0
+offsets, D = banded_diagonals(Q_band, 1, 1)
+assert D.shape[1] == 3
+v = np.random.default_rng(0).random((len(QR_band), len(BUCKETS_CANON)))
+np.testing.assert_allclose(
+    canonical_step(v, QR_band, t, (offsets, D)), canonical_step(v, QR_band, t), rtol=1e-14
+)
+
+# Hàng absorbing không phải identity → ok = False
+P_bad = np.array(fidx_fc.matrices[:2])
+P_bad[:, BUCKETS_CANON.index("WRITEOFF")] = 1.0 / len(BUCKETS_CANON)
+assert not canonical_form(P_bad, BUCKETS_CANON)["ok"].any()
+
+print(f"\n✅ PASSED: phép nhân / cohort / bước {work}, kernel canonical / banded khớp dense")
+
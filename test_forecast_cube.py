@@ -0,0 +1,65 @@
+"""
+Test script: ForecastCube – lifecycle long / wide / DEL / select khớp pipeline dict.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.config import CFG
+from src.rollrate.transition import compute_transition_by_mob
+from panel_fixture import make_panel, with_orig_date
+
+df = make_panel()
+df_fc = with_orig_date(df)
+matrices_by_mob, parent_fallback = compute_transition_by_mob(df)
+store = compute_transition_by_mob(df, return_store=True)
+
+print("=" * 70)
+print("TEST: FORECASTCUBE (lifecycle long / wide / DEL không lặp cohort)")
+print("=" * 70)
+
+from src.rollrate import lifecycle as lifecycle_mod
+from src.rollrate.forecast_cube import ForecastCube
+from src.rollrate.forecast import forecast_all_vintages
+
+fc_all = forecast_all_vintages(df_fc, matrices_by_mob, max_mob=12)
+
+# Lifecycle qua cube trùng khớp bản dict (actual → forecast → long)
+lc_dict = lifecycle_mod.lifecycle_to_long_df_amount(
+    lifecycle_mod.combine_all_lifecycle_amount(
+        lifecycle_mod.get_actual_all_vintages_amount(df_fc), forecast_all_vintages(df_fc, store, max_mob=12)
+    )
+)
+lc_cube = lifecycle_mod.build_full_lifecycle_amount(df_fc, store, max_mob=12)
+pd.testing.assert_frame_equal(lc_cube, lc_dict, check_exact=True)
+
+cube = forecast_all_vintages(df_fc, store, max_mob=12, as_cube=True)
+assert len(cube) == len(fc_all)
+assert ForecastCube.from_dict(fc_all).to_long().equals(cube.to_long())
+
+# DEL + wide + slicing
+df_fc[CFG["disb"]] = df_fc.groupby(CFG["loan"])[CFG["ead"]].transform("first")
+life = ForecastCube.from_actual(df_fc).combine(cube)
+disb = life.disb_total(df_fc)
+ref_del = lifecycle_mod.add_del_metrics(lc_cube, df_fc)
+got_del = life.to_long(disb=disb, del_metrics=True)
+pd.testing.assert_frame_equal(got_del, ref_del[got_del.columns], rtol=1e-12)
+
+wide = life.to_wide("DEL30_PCT", disb=disb)
+assert wide.shape == (len(life), len(life.mobs))
+sub = life.select(product="A", mobs=range(3, 6))
+assert set(sub.keys["PRODUCT_TYPE"]) == {"A"} and list(sub.mobs) == [3, 4, 5]
+one = life.cohort(*life.key_index()[0])
+np.testing.assert_array_equal(one.to_numpy(), life.values[0][life.present[0]])
+print(life)
+
+# Dòng MOB NaN bị bỏ như groupby của get_actual_all_vintages_amount (không dồn EAD sang cohort khác)
+df_nan = df_fc.copy()
+df_nan[CFG["mob"]] = df_nan[CFG["mob"]].astype("float64")
+df_nan.loc[df_nan.index[[0, len(df_nan) // 2]], CFG["mob"]] = np.nan
+actual_nan = ForecastCube.from_actual(df_nan)
+ref_nan = ForecastCube.from_dict(lifecycle_mod.get_actual_all_vintages_amount(df_nan))
+pd.testing.assert_frame_equal(actual_nan.to_long(), ref_nan.to_long())
+
+print("\n✅ PASSED: ForecastCube to_long / to_wide / DEL / select khớp pipeline dict")
+
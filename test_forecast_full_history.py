@@ -0,0 +1,51 @@
+"""
+Test script: full-history backtest theo lô (forecast.py và bản MOB0 → max_mob)
+khớp forecast từng cohort.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.config import CFG, BUCKETS_CANON
+from src.rollrate.transition import compute_transition_by_mob
+from panel_fixture import make_panel, with_orig_date
+
+df = make_panel()
+df_fc = with_orig_date(df)
+df_fc[CFG["disb"]] = df_fc.groupby(CFG["loan"])[CFG["ead"]].transform("first")
+store = compute_transition_by_mob(df, return_store=True)
+
+print("=" * 70)
+print("TEST: FULL-HISTORY BACKTEST THEO LÔ (MOB0 → max_mob)")
+print("=" * 70)
+
+from src.rollrate import forecast_full_history as ffh_mod
+from src.rollrate.forecast import forecast_full_history, forecast_segment, forecast_vintage
+
+df_fh = pd.concat([df_fc, df_fc[df_fc["PRODUCT_TYPE"] == "A"].assign(PRODUCT_TYPE="ZZ")], ignore_index=True)
+
+# Bản forecast.py: như forecast_vintage từng cohort (product ZZ không có matrix → skip)
+fh = forecast_full_history(df_fh, store, max_mob=12)
+assert "ZZ" not in set(fh["PRODUCT_TYPE"])
+for (prod, score, vintage), g in fh.groupby(["PRODUCT_TYPE", "RISK_SCORE", "VINTAGE_DATE"]):
+    ref_fc = forecast_vintage(df_fc, store, prod, score, vintage, max_mob=12)
+    assert list(g["MOB"]) == list(ref_fc)
+    np.testing.assert_array_equal(g[BUCKETS_CANON].to_numpy(), np.stack([v.to_numpy() for v in ref_fc.values()]))
+
+# Bản MOB0: DISB_TOTAL 1 groupby = DISB mỗi loan 1 lần của từng cohort, chuỗi = forecast_segment từng cohort
+disb_all = ffh_mod.cohort_disb_totals(df_fh)
+for key, g in df_fh.groupby(["PRODUCT_TYPE", "RISK_SCORE", CFG["orig_date"]], observed=True):
+    assert np.isclose(disb_all[key], g.groupby(CFG["loan"])[CFG["disb"]].first().sum(), rtol=1e-14)
+
+fh0 = ffh_mod.forecast_full_history(df_fh, store, max_mob=12)
+assert (fh0["MOB"].min(), fh0["MOB"].max()) == (0, 12) and "ZZ" not in set(fh0["PRODUCT_TYPE"])
+for (prod, score, vintage), g in fh0.groupby(["PRODUCT_TYPE", "RISK_SCORE", "VINTAGE_DATE"]):
+    init0 = pd.Series(0.0, index=BUCKETS_CANON)
+    init0.iloc[0] = disb_all[(prod, score, vintage)]
+    ref_fc = forecast_segment(store, prod, score, 0, init0, 12)
+    np.testing.assert_allclose(
+        g[BUCKETS_CANON].to_numpy(), np.stack([v.to_numpy() for v in ref_fc.values()]), rtol=1e-13
+    )
+
+print(f"\n✅ PASSED: full-history theo lô ({len(fh)} / {len(fh0)} dòng) khớp forecast từng cohort")
+
@@ -0,0 +1,82 @@
+"""
+Test script: nhiều kịch bản macro theo lô (forecast_scenarios) khớp shock từng bước
+của từng cohort; apply_macro_adjustment dùng chung engine shock.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.config import BUCKETS_CANON
+from src.rollrate.matrix_store import fallback_index
+from src.rollrate.transition import compute_transition_by_mob
+from panel_fixture import make_panel, with_orig_date
+
+df = make_panel()
+df_fc = with_orig_date(df)
+store = compute_transition_by_mob(df, return_store=True)
+
+print("=" * 70)
+print("TEST: NHIỀU KỊCH BẢN MACRO THEO LÔ")
+print("=" * 70)
+
+from src.rollrate.forecast import apply_macro_adjustment, forecast_scenarios, scenario_summary
+from src.rollrate.macro import shock_matrices
+from src.rollrate.forecast import forecast_cohorts_batched
+
+fc_dense = forecast_cohorts_batched(df_fc, store, max_mob=12)
+
+fidx_fc = fallback_index(store, policy="forecast", states=BUCKETS_CANON)
+shocked = shock_matrices(fidx_fc.matrices, 1.8, BUCKETS_CANON)
+np.testing.assert_allclose(shocked.sum(axis=-1), fidx_fc.matrices.sum(axis=-1), rtol=1e-13)
+assert shocked.min() >= 0
+n_t = 4  # DPD90+ / PREPAY / WRITEOFF / SOLDOUT giữ identity
+np.testing.assert_array_equal(shocked[:, n_t:], fidx_fc.matrices[:, n_t:])
+P0 = pd.DataFrame(fidx_fc.matrices[0], index=BUCKETS_CANON, columns=BUCKETS_CANON)
+assert apply_macro_adjustment(P0, {"UNEMPLOYMENT_RATE": 1.0}) is P0  # enable_macro=False → passthrough
+np.testing.assert_allclose(
+    apply_macro_adjustment(P0, {"multiplier": 1.8}, enable_macro=True).to_numpy(), shocked[0]
+)
+
+scen = {
+    "BASE": {},
+    "DOWNSIDE": {"GDP_GROWTH": [-1.0, -2.0], "UNEMPLOYMENT_RATE": 1.5},
+    "UPSIDE": {"GDP_GROWTH": 1.0},
+}
+sc = forecast_scenarios(df_fc, store, scen, max_mob=12, probabilities={"BASE": 0.6, "DOWNSIDE": 0.3, "UPSIDE": 0.1})
+np.testing.assert_allclose(sc["ead"][0], fc_dense["ead"], rtol=1e-12, atol=1e-9)
+assert (sc["multipliers"][:, 0] == 1).all()  # MACRO_LAG = 1 → bước đầu chưa shock
+
+# Cohort có snapshot sớm hơn as-of (vintage khác nhau → cutoff mới nhất khác nhau)
+assert set(sc["cutoff_lag"].tolist()) == {0, 1, 2}
+n_h = sc["portfolio"].shape[1]
+assert n_h == 12 - int((sc["start_mob"] + sc["cutoff_lag"]).min()) + 1
+
+# Mỗi kịch bản = chuỗi ma trận shock từng bước của từng cohort, macro theo tháng lịch của cohort
+port = np.zeros_like(sc["portfolio"])
+for s_i in range(len(sc["scenarios"])):
+    for c, key in enumerate(sc["keys"]):
+        start, lag_c = int(sc["start_mob"][c]), int(sc["cutoff_lag"][c])
+        v = sc["ead"][s_i, c, start]
+        row = fidx_fc.rows([key[:2]])[0]
+        for mob_s in range(start, 12):
+            col = mob_s if mob_s <= fidx_fc.max_mob else fidx_fc.beyond_col
+            k = mob_s - start - lag_c                    # horizon lịch của bước (< 0: trước as-of)
+            mult = sc["multipliers"][s_i, k] if k >= 0 else 1.0
+            P_s = shock_matrices(fidx_fc.matrices[fidx_fc.slots[row, col]], mult, BUCKETS_CANON)
+            v = v @ P_s
+            np.testing.assert_allclose(sc["ead"][s_i, c, mob_s + 1], v, rtol=1e-12, atol=1e-9)
+        for j in range(n_h):
+            if start + lag_c + j <= 12:
+                port[s_i, j] += sc["ead"][s_i, c, start + lag_c + j]
+np.testing.assert_allclose(sc["portfolio"], port, rtol=1e-12, atol=1e-9)
+
+summ = scenario_summary(sc).groupby("SCENARIO")["DEL30"].last()
+assert summ["DOWNSIDE"] > summ["BASE"] > summ["UPSIDE"]
+np.testing.assert_allclose(sc["weighted"], np.tensordot([0.6, 0.3, 0.1], sc["portfolio"], axes=1))
+sc_lite = forecast_scenarios(df_fc, store, scen, max_mob=12, keep_cohorts=False)
+assert sc_lite["ead"] is None
+np.testing.assert_array_equal(sc_lite["portfolio"], sc["portfolio"])
+
+print(f"\n✅ PASSED: {len(sc['scenarios'])} kịch bản × {len(sc['keys'])} cohort trong 1 lần chạy khớp shock từng bước")
+print("✅ PASSED: macro path / portfolio theo tháng lịch từ snapshot cutoff của từng cohort")
+
@@ -0,0 +1,91 @@
+"""
+Test script: transition tensor (1 pass) + MatrixStore
+So sánh với cách tính cũ bằng crosstab cho từng (product, score, mob).
+Các tính năng khác (bundle, incremental, sweep, ...) có test script riêng, dùng chung panel_fixture.
+"""
+
+import numpy as np
+
+from src.config import CFG, MIN_OBS
+from src.rollrate.transition import (
+    STATE_SPACE,
+    make_pairs,
+    compute_transition_from_pairs,
+    compute_transition_by_mob,
+)
+from src.rollrate.matrix_store import MatrixStore, as_nested
+from src.rollrate.allocation_v2_fast import _get_combined_matrix
+from panel_fixture import make_panel
+
+# ============================================================
+# Panel giả lập (panel_fixture): 2 product × 2 score, MOB 0..8
+# ============================================================
+
+df = make_panel()
+
+print("=" * 70)
+print("TEST: TRANSITION TENSOR vs CROSSTAB")
+print("=" * 70)
+
+matrices_by_mob, parent_fallback = compute_transition_by_mob(df)
+pairs = make_pairs(df)
+
+for (prod, score), grp in pairs.groupby(["product_t", "score_t"]):
+    parent = compute_transition_from_pairs(grp, parent_P=None)
+    np.testing.assert_allclose(parent_fallback[(prod, score)].to_numpy(), parent.to_numpy(), atol=1e-12)
+    for mob, mob_grp in grp.groupby("mob_t"):
+        entry = matrices_by_mob[prod][int(mob)][score]
+        assert entry["is_fallback"] == (len(mob_grp) < MIN_OBS), (prod, score, mob)
+        expected = parent if entry["is_fallback"] else compute_transition_from_pairs(mob_grp, parent_P=parent)
+        np.testing.assert_allclose(entry["P"].to_numpy(), expected.to_numpy(), atol=1e-12)
+
+# Cutoff dạng số YYYYMM (int32, như panel compact) → cùng tuổi tháng / time weight
+from src.config import parse_date_column
+
+df_int = df.assign(**{CFG["cutoff"]: parse_date_column(df[CFG["cutoff"]], output="yyyymm")})
+pairs_int = make_pairs(df_int)
+np.testing.assert_allclose(pairs_int["time_weight"].to_numpy(), pairs["time_weight"].to_numpy())
+assert pairs["time_weight"].min() < 1.0  # panel nhiều tháng → có tuổi > 0
+
+print("\n✅ PASSED: tensor 1 pass khớp crosstab từng (product, score, mob)")
+
+print("\n" + "=" * 70)
+print("TEST: MATRIXSTORE")
+print("=" * 70)
+
+store = compute_transition_by_mob(df, return_store=True)
+P = store.get("A", "S1", 3)
+assert P.shape == (len(STATE_SPACE), len(STATE_SPACE))
+assert np.shares_memory(P, store.P)  # view, không copy
+np.testing.assert_allclose(P, matrices_by_mob["A"][3]["S1"]["P"].to_numpy())
+
+# MOB không có → parent; segment không có → default
+np.testing.assert_allclose(store.get("A", "S1", 99), parent_fallback[("A", "S1")].to_numpy())
+assert store.get("Z", "S1", 3) is None
+
+# Adapter dict lồng nhau + round-trip
+nested, parents = as_nested(store)
+assert set(nested) == set(matrices_by_mob)
+# DataFrame của adapter là view read-only: sửa tại chỗ raise, tensor dùng chung không đổi
+P_view = nested["A"][3]["S1"]["P"]
+assert np.shares_memory(P_view.to_numpy(), store.P)
+before = store.P.copy()
+try:
+    P_view.iloc[0, 0] = 0.5
+    raise AssertionError("sửa DataFrame của to_nested phải raise")
+except ValueError:
+    pass
+np.testing.assert_array_equal(store.P, before)
+assert store.P.flags.writeable
+
+store2 = MatrixStore.from_nested(matrices_by_mob, parent_fallback)
+np.testing.assert_allclose(store2.get("B", "S2", 2), store.get("B", "S2", 2))
+
+# Consumer nhận MatrixStore trực tiếp
+np.testing.assert_allclose(
+    _get_combined_matrix(store, None, "A", "S2", 0, 6),
+    _get_combined_matrix(matrices_by_mob, parent_fallback, "A", "S2", 0, 6),
+)
+
+print("\n✅ PASSED: MatrixStore lookup O(1), fallback parent, adapter dict tương thích")
+
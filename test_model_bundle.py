@@ -0,0 +1,69 @@
+"""
+Test script: model bundle (save / load memory-map)
+Lưu matrices + k + alpha + seasonality + LGD rồi đọc lại, so với MatrixStore gốc.
+"""
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from src.rollrate.artifacts import save_model_bundle, load_model_bundle
+from src.rollrate.transition import compute_transition_by_mob
+from panel_fixture import make_panel
+
+df = make_panel()
+matrices_by_mob, parent_fallback = compute_transition_by_mob(df)
+store = compute_transition_by_mob(df, return_store=True)
+
+print("=" * 70)
+print("TEST: MODEL BUNDLE (save / load memory-map)")
+print("=" * 70)
+
+bundle_root = tempfile.mkdtemp()
+k_raw = {m: 0.5 + 0.01 * m for m in range(8)}
+k_final = {m: 0.4 for m in range(10)}
+seasonality = {"A": pd.Series(np.linspace(0.9, 1.1, 12), index=range(1, 13))}
+lgd = {"lgd_base": pd.DataFrame({"PRODUCT_SEGMENT": ["A"], "MOB_BUCKET": ["0-12"], "LGD_BASE": [0.45]})}
+
+save_model_bundle(
+    matrices_by_mob, parent_fallback,
+    k_raw_by_mob=k_raw, k_smooth_by_mob=k_raw, k_final=k_final, alpha=0.8,
+    seasonality=seasonality, lgd_lookups=lgd,
+    data_window={"cutoff_from": "2025-01", "cutoff_to": "2025-10"},
+    out_root=bundle_root, version="v1",
+)
+bundle = load_model_bundle(bundle_root, verify=True)  # root → LATEST = v1
+
+assert isinstance(bundle["store"].P, np.ndarray) and not bundle["store"].P.flags.writeable  # memory-map read-only
+np.testing.assert_allclose(bundle["store"].get("A", "S1", 3), store.get("A", "S1", 3))
+np.testing.assert_allclose(
+    bundle["parent_fallback"][("B", "S2")].to_numpy(), parent_fallback[("B", "S2")].to_numpy()
+)
+assert bundle["matrices_by_mob"]["A"][3]["S1"]["reason"] == matrices_by_mob["A"][3]["S1"]["reason"]
+assert bundle["k_raw_by_mob"] == k_raw and bundle["k_final"] == k_final and bundle["alpha"] == 0.8
+np.testing.assert_allclose(bundle["seasonality"]["A"].to_numpy(), seasonality["A"].to_numpy())
+pd.testing.assert_frame_equal(bundle["lgd_lookups"]["lgd_base"], lgd["lgd_base"])
+assert bundle["manifest"]["data_window"]["cutoff_to"] == "2025-10"
+
+print("\n✅ PASSED: bundle lưu/đọc đủ matrices, k, alpha, seasonality, LGD (memory-map)")
+
+# Segment không có parent → has_parent giữ nguyên qua bundle (fallback "parent" không đổi)
+from src.config import BUCKETS_CANON
+from src.rollrate.matrix_store import MatrixStore, fallback_index
+
+parent_missing = {k: v for k, v in parent_fallback.items() if k != ("B", "S2")}
+store_missing = MatrixStore.from_nested(matrices_by_mob, parent_missing)
+assert not store_missing.has_parent.all()
+save_model_bundle(store_missing, out_root=bundle_root, version="v2")
+bundle2 = load_model_bundle(bundle_root)
+np.testing.assert_array_equal(bundle2["store"].has_parent, store_missing.has_parent)
+assert set(bundle2["parent_fallback"]) == set(parent_missing)
+for policy in ("forecast", "calibration"):
+    fi_saved = fallback_index(store_missing, policy=policy, states=BUCKETS_CANON)
+    fi_loaded = fallback_index(bundle2["store"], policy=policy, states=BUCKETS_CANON)
+    np.testing.assert_array_equal(fi_loaded.slots, fi_saved.slots)
+    np.testing.assert_array_equal(fi_loaded.matrices, fi_saved.matrices)
+
+print("✅ PASSED: has_parent lưu/đọc qua bundle (segment thiếu parent không bị coi là có parent)")
+
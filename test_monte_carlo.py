@@ -0,0 +1,49 @@
+"""
+Test script: Monte Carlo theo loan – trung bình path khớp forecast kỳ vọng,
+cùng seed cho cùng kết quả bất kể số luồng.
+"""
+
+import numpy as np
+
+from src.config import BUCKETS_CANON
+from src.rollrate.transition import compute_transition_by_mob
+from panel_fixture import make_panel, with_orig_date
+
+df = make_panel()
+df_fc = with_orig_date(df)
+store = compute_transition_by_mob(df, return_store=True)
+
+print("=" * 70)
+print("TEST: MONTE CARLO THEO LOAN")
+print("=" * 70)
+
+from src.config import BUCKETS_30P
+from src.rollrate.monte_carlo import loss_distribution, simulate_loss_paths
+from src.rollrate.forecast import forecast_cohorts_batched
+
+fc_dense = forecast_cohorts_batched(df_fc, store, max_mob=12)
+
+sim = simulate_loss_paths(df_fc, store, max_mob=12, n_paths=2000, seed=7, path_chunk=500, loan_chunk=150)
+assert sim["keys"] == fc_dense["keys"]
+np.testing.assert_allclose(sim["ead"], np.nansum(fc_dense["ead"][np.arange(len(sim["keys"])), fc_dense["start_mob"]], axis=1))
+
+# Trung bình path ≈ EAD kỳ vọng của forecast tại max_mob (sai số chuẩn Monte Carlo)
+idx_30 = [BUCKETS_CANON.index(s_) for s_ in BUCKETS_30P if s_ in BUCKETS_CANON]
+expected_30 = fc_dense["ead"][:, 12, idx_30].sum(axis=1)
+mc_30 = sim["amounts"][:, :, 0]
+z = (mc_30.mean(axis=0) - expected_30) / np.maximum(mc_30.std(axis=0) / np.sqrt(len(mc_30)), 1e-9)
+assert np.abs(z).max() < 5, z
+np.testing.assert_allclose(sim["portfolio"], sim["amounts"].sum(axis=1))
+
+# Cùng seed → cùng kết quả, không phụ thuộc số luồng
+sim_1 = simulate_loss_paths(df_fc, store, max_mob=12, n_paths=300, seed=7, path_chunk=100, loan_chunk=150, n_jobs=1)
+sim_3 = simulate_loss_paths(df_fc, store, max_mob=12, n_paths=300, seed=7, path_chunk=100, loan_chunk=150, n_jobs=3)
+np.testing.assert_array_equal(sim_1["amounts"], sim_3["amounts"])
+
+dist = loss_distribution(sim)
+port = dist[dist["PRODUCT_TYPE"] == "ALL"].set_index("METRIC")
+assert len(dist) == (len(sim["keys"]) + 1) * 3
+assert (port["Q99"] >= port["Q50"]).all() and (port["ES99"] >= port["Q99"] - 1e-9).all()
+np.testing.assert_allclose(port.loc["DEL30", "MEAN"], expected_30.sum(), rtol=0.05)
+
+print(f"\n✅ PASSED: Monte Carlo {len(sim['amounts'])} path khớp forecast kỳ vọng (|z| max = {np.abs(z).max():.2f})")
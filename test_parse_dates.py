@@ -0,0 +1,42 @@
+"""
+Test script: parse_date_column (factorize + parse_date từng giá trị unique)
+So sánh với cách cũ apply(parse_date) từng dòng, gồm cả int32 / Int32 (nullable) YYYYMM.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.config import parse_date, parse_date_column
+
+print("=" * 70)
+print("TEST: PARSE_DATE_COLUMN (YYYYMM / datetime / string)")
+print("=" * 70)
+
+cases = {
+    "int64": pd.Series([202401, 202402, 202401, 202512]),
+    "int32": pd.Series([202401, 202402, 202401, 202512], dtype="int32"),
+    "Int32": pd.Series([202401, 202402, None, 202512], dtype="Int32"),
+    "Int64": pd.Series([202401, None, 202402, 202401], dtype="Int64"),
+    "float": pd.Series([202401.0, np.nan, 202402.0]),
+    "string": pd.Series(["202401", "2024-02", None, "202512"]),
+    "datetime": pd.Series(pd.to_datetime(["2024-01-01", None, "2024-02-01"])),
+}
+
+for name, s in cases.items():
+    expected = pd.to_datetime(s.astype(object).apply(parse_date))
+    got = parse_date_column(s)
+    pd.testing.assert_series_equal(got, expected, check_names=False, check_dtype=False)
+    assert got.dropna().dt.year.min() >= 2024, (name, got)
+
+    ym = parse_date_column(s, output="yyyymm")
+    exp_ym = (expected.dt.year * 100 + expected.dt.month).astype("Int32")
+    assert ym.astype("Int32").equals(exp_ym), (name, ym)
+    assert str(ym.dtype) == ("Int32" if s.isna().any() else "int32"), (name, ym.dtype)
+
+    mi = parse_date_column(s, output="month_index")
+    exp_mi = (expected.dt.year * 12 + expected.dt.month - 1).astype("Int32")
+    assert mi.astype("Int32").equals(exp_mi), (name, mi)
+
+assert parse_date_column(cases["Int32"], output="yyyymm").tolist() == [202401, 202402, pd.NA, 202512]
+
+print("\n✅ PASSED: parse_date_column khớp parse_date từng dòng (int32 / Int32 / Int64 / float / string / datetime)")
@@ -0,0 +1,49 @@
+"""
+Test script: create_segment_columns – RISK_SCORE ghép theo mã factorize khớp
+astype(str) + "_".join từng dòng như bản cũ (cả cột datetime / số), và giữ nguyên
+RISK_SCORE khi SEGMENT_COLS không có cột segment khác.
+"""
+
+import numpy as np
+import pandas as pd
+
+import src.config as config
+from src.config import create_segment_columns
+
+rng = np.random.default_rng(3)
+n = 5000
+df = pd.DataFrame({
+    "PRODUCT_TYPE": rng.choice(["PL", "CC"], n),
+    "RISK_SCORE": rng.integers(1, 4, n),
+    "GENDER": rng.choice(["M", "F"], n),
+    "OPEN_MONTH": pd.to_datetime("2025-01-01") + pd.to_timedelta(rng.integers(0, 3, n) * 31, unit="D"),
+    "LA_GROUP": rng.choice([1.0, 2.5], n),
+})
+
+print("=" * 70)
+print("TEST: CREATE_SEGMENT_COLUMNS (label như astype(str) từng dòng)")
+print("=" * 70)
+
+base_cols = list(config.SEGMENT_COLS)
+
+other_cols = ["RISK_SCORE", "GENDER", "OPEN_MONTH", "LA_GROUP"]
+config.SEGMENT_COLS = ["PRODUCT_TYPE"] + other_cols
+out = create_segment_columns(df)
+expected = df[other_cols].astype(str).agg("_".join, axis=1)
+assert out["RISK_SCORE"].tolist() == expected.tolist()
+assert out["RISK_SCORE"].iloc[0].split("_")[2] == str(df["OPEN_MONTH"].dt.date.iloc[0])  # "2025-01-01", không kèm giờ
+out_cat = create_segment_columns(df, as_category=True)
+assert out_cat["RISK_SCORE"].astype(str).tolist() == expected.tolist()
+
+# SEGMENT_COLS chỉ có PRODUCT_TYPE → RISK_SCORE giữ nguyên dtype / giá trị từ data
+config.SEGMENT_COLS = ["PRODUCT_TYPE"]
+out_keep = create_segment_columns(df)
+pd.testing.assert_series_equal(out_keep["RISK_SCORE"], df["RISK_SCORE"])
+assert (create_segment_columns(df.drop(columns="RISK_SCORE"))["RISK_SCORE"] == "ALL").all()
+
+# SEGMENT_COLS = ["PRODUCT_TYPE", "RISK_SCORE"] → RISK_SCORE = astype(str)
+config.SEGMENT_COLS = ["PRODUCT_TYPE", "RISK_SCORE"]
+assert create_segment_columns(df)["RISK_SCORE"].tolist() == df["RISK_SCORE"].astype(str).tolist()
+config.SEGMENT_COLS = base_cols
+
+print("\n✅ PASSED: RISK_SCORE khớp astype(str) + join từng dòng, giữ nguyên khi không có cột segment khác")
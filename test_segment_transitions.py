@@ -0,0 +1,82 @@
+"""
+Test script: generate_all_transitions (CONTRACT / AMOUNT / AMOUNT_TW theo segment)
+So sánh với compute_transition_from_pairs cho từng segment, và output="parquet" ghi đúng 1 file.
+"""
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.config import CFG, BUCKETS_CANON
+from src.rollrate import segment
+from src.rollrate.segment import generate_all_transitions
+from src.rollrate.transition import STATE_SPACE, make_pairs, compute_transition_from_pairs
+
+# ============================================================
+# Panel giả lập: 2 product × 2 score, MOB 0..8
+# ============================================================
+
+rng = np.random.default_rng(7)
+rows = []
+for loan in range(2000):
+    start = pd.Timestamp("2025-01-01") + pd.DateOffset(months=int(rng.integers(0, 4)))
+    for mob in range(int(rng.integers(2, 9))):
+        rows.append({
+            CFG["loan"]: loan,
+            CFG["mob"]: mob,
+            CFG["state"]: rng.choice(BUCKETS_CANON[:4], p=[0.85, 0.08, 0.05, 0.02]),
+            CFG["cutoff"]: start + pd.DateOffset(months=mob),
+            CFG["ead"]: float(rng.uniform(100, 1000)),
+            "PRODUCT_TYPE": "A" if loan % 3 else "B",
+            "RISK_SCORE": "S1" if loan % 2 else "S2",
+        })
+df = pd.DataFrame(rows)
+
+print("=" * 70)
+print("TEST: GENERATE_ALL_TRANSITIONS vs compute_transition_from_pairs")
+print("=" * 70)
+
+segment_map = {"PRODUCT_TYPE": ["A", "B"], "RISK_SCORE": ["S1", "S2"]}
+result = generate_all_transitions(df, segment_map=segment_map, output=None)
+
+pairs = make_pairs(df)
+pairs["ONE"] = 1.0
+value_cols = {"CONTRACT": "ONE", "AMOUNT": "ead_raw", "AMOUNT_TW": "ead_t"}
+
+assert set(result["TYPE"]) == set(value_cols)
+assert result["SEGMENT"].nunique() == 4
+for seg_col, seg_vals in segment_map.items():
+    for seg_val in seg_vals:
+        grp = pairs[df[seg_col].to_numpy()[pairs.index] == seg_val]
+        for type_label, value_col in value_cols.items():
+            got = (
+                result[(result["SEGMENT"] == f"{seg_col}={seg_val}") & (result["TYPE"] == type_label)]
+                .pivot(index="FROM_STATE", columns="TO_STATE", values="PROB")
+                .reindex(index=STATE_SPACE, columns=STATE_SPACE)
+            )
+            expected = compute_transition_from_pairs(grp, value_col=value_col, parent_P=None)
+            np.testing.assert_allclose(got.to_numpy(), expected.to_numpy(), atol=1e-12,
+                                       err_msg=f"{seg_col}={seg_val} {type_label}")
+
+print("\n✅ PASSED: CONTRACT / AMOUNT / AMOUNT_TW khớp từng segment")
+
+# ============================================================
+# output="parquet" → 1 file tổng
+# ============================================================
+
+print("\n" + "=" * 70)
+print("TEST: OUTPUT PARQUET (1 file)")
+print("=" * 70)
+
+out_root = Path(tempfile.mkdtemp())
+segment.OUT_ROOT = out_root  # ghi vào thư mục tạm, không đụng outputs/
+result_pq = generate_all_transitions(df, segment_map=segment_map, output="parquet")
+
+files = sorted(p.name for p in out_root.iterdir())
+assert files == ["rollrate_all_segments.parquet"], files
+pd.testing.assert_frame_equal(pd.read_parquet(out_root / files[0]), result_pq)
+pd.testing.assert_frame_equal(result_pq, result)
+
+print("\n✅ PASSED: output='parquet' ghi đúng 1 file, nội dung khớp kết quả trả về")
@@ -0,0 +1,61 @@
+"""
+Test script: update_transitions (chỉ đọc partition mới) khớp tính lại toàn bộ ROLL_WINDOW.
+Cutoff dạng Timestamp và dạng số YYYYMM (int32).
+"""
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from src.config import CFG, parse_date_column
+from src.rollrate.transition import compute_transition_by_mob
+from panel_fixture import make_long_panel, make_panel
+
+df = make_panel()
+df_long = make_long_panel()
+
+print("=" * 70)
+print("TEST: INCREMENTAL UPDATE (cutoff mới)")
+print("=" * 70)
+
+from src.rollrate.transition_incremental import (
+    build_transition_state,
+    update_transitions,
+    save_transition_state,
+)
+
+state_root = tempfile.mkdtemp()
+cutoff = CFG["cutoff"]
+last = df[cutoff].max()
+prev = last - pd.DateOffset(months=1)
+state_path = save_transition_state(build_transition_state(df[df[cutoff] < last]), f"{state_root}/state.npz")
+
+store_inc = update_transitions(
+    df[df[cutoff] == last], prev_partition=df[df[cutoff] == prev], state_path=state_path
+)
+m_full, pf_full = compute_transition_by_mob(df[df[cutoff] >= last - pd.DateOffset(months=CFG["ROLL_WINDOW"])])
+
+for prod in m_full:
+    for mob in m_full[prod]:
+        for score, entry in m_full[prod][mob].items():
+            np.testing.assert_allclose(store_inc.get(prod, score, mob), entry["P"].to_numpy(), atol=1e-10)
+            assert store_inc.info(prod, score, mob)["is_fallback"] == entry["is_fallback"]
+
+# Cutoff int YYYYMM: partition mới = 202604, window tính theo month index
+month_long = parse_date_column(df_long[cutoff], output="month_index")
+last_m = month_long.max()
+state_path = save_transition_state(
+    build_transition_state(df_long[month_long < last_m]), f"{state_root}/state_int.npz"
+)
+store_inc = update_transitions(
+    df_long[month_long == last_m], prev_partition=df_long[month_long == last_m - 1], state_path=state_path
+)
+m_full, _ = compute_transition_by_mob(df_long[month_long >= last_m - CFG["ROLL_WINDOW"]])
+for prod in m_full:
+    for mob in m_full[prod]:
+        for score, entry in m_full[prod][mob].items():
+            np.testing.assert_allclose(store_inc.get(prod, score, mob), entry["P"].to_numpy(), atol=1e-10)
+
+print("\n✅ PASSED: update_transitions (2 partition mới nhất) khớp tính lại toàn bộ window (cả cutoff int YYYYMM)")
+
@@ -0,0 +1,61 @@
+"""
+Test script: sweep ROLL_WINDOW / WEIGHT_METHOD từ pair count cache
+khớp make_pairs + compute_transition_by_mob cho từng biến thể (cutoff Timestamp và int YYYYMM).
+"""
+
+import numpy as np
+
+from src.config import CFG
+from src.rollrate.transition import compute_transition_by_mob
+from panel_fixture import make_long_panel, make_panel
+
+df = make_panel()
+df_long = make_long_panel()
+
+print("=" * 70)
+print("TEST: SWEEP ROLL_WINDOW / WEIGHT_METHOD từ pair count cache")
+print("=" * 70)
+
+from src.rollrate.transition_sweep import build_pair_count_cache, sweep_transitions
+
+cache = build_pair_count_cache(df, save=False)
+variants = sweep_transitions(cache, roll_windows=(3, 12), weight_methods=("exp", "linear"))
+
+base_cfg = dict(CFG)
+for (rw, method, lam), store_v in variants.items():
+    CFG.update(ROLL_WINDOW=rw, WEIGHT_METHOD=method)
+    m_v, _ = compute_transition_by_mob(df)
+    for prod in m_v:
+        for mob in m_v[prod]:
+            for score, entry in m_v[prod][mob].items():
+                np.testing.assert_allclose(store_v.get(prod, score, mob), entry["P"].to_numpy(), atol=1e-10)
+CFG.update(base_cfg)
+
+# Cutoff int YYYYMM (df_long, 202401–202604 > ROLL_WINDOW) → window/time weight phải khớp
+
+cache_long = build_pair_count_cache(df_long, save=False)
+for (rw, method, lam), store_v in sweep_transitions(cache_long, roll_windows=(6, 12), weight_methods=("exp",)).items():
+    CFG.update(ROLL_WINDOW=rw, WEIGHT_METHOD=method)
+    m_v, _ = compute_transition_by_mob(df_long)
+    for prod in m_v:
+        for mob in m_v[prod]:
+            for score, entry in m_v[prod][mob].items():
+                np.testing.assert_allclose(store_v.get(prod, score, mob), entry["P"].to_numpy(), atol=1e-10)
+CFG.update(base_cfg)
+
+print("\n✅ PASSED: mọi biến thể từ cache khớp make_pairs + compute_transition_by_mob (cả cutoff int YYYYMM)")
+
+# as_of sớm hơn tháng cuối của cache → khớp build trên panel cắt tới as_of (không nhìn tương lai)
+
+from src.rollrate.transition_sweep import transitions_from_cache
+
+for as_of in (202510, 202601):
+    store_as_of = transitions_from_cache(cache_long, as_of=as_of)
+    m_v, _ = compute_transition_by_mob(df_long[df_long[CFG["cutoff"]] <= as_of])
+    for prod in m_v:
+        for mob in m_v[prod]:
+            for score, entry in m_v[prod][mob].items():
+                np.testing.assert_allclose(store_as_of.get(prod, score, mob), entry["P"].to_numpy(), atol=1e-10)
+
+print("✅ PASSED: as_of khớp compute_transition_by_mob trên panel cắt tới as_of")
+